@@ -0,0 +1,69 @@
+"""
+Combine prefetch benchmark.
+
+Splits random data into horcruxes and times reading every block for combine with the
+synchronous plan.read_blocks and with the per-source plan.Prefetcher. Each block read
+sleeps for --latency ms first, to stand in for horcruxes on separate slow devices (disks,
+NFS mounts), where prefetching lets all of them be busy at once.
+
+usage:
+    PYTHONPATH=. python benchmarks/combine_prefetch.py --n 8 --k 4 --latency 2
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from horcrux import plan, split
+
+MiB = 1024 * 1024
+
+
+def make_horcruxes(workdir, size, n, k):
+    with tempfile.TemporaryFile() as fin:
+        fin.write(os.urandom(size))
+        fin.seek(0)
+        s = split.Stream(fin, n, k, None, outdir=workdir, horcrux_title="bench")
+        s.init_horcruxes()
+        s.distribute()
+        for h in s.horcruxes:
+            h.stream.close()
+    return sorted(workdir.glob("bench_*.hrcx"))
+
+
+def time_reads(files, latency, prefetch):
+    real_read = plan.Source.read
+
+    def slow_read(self, f, block_id):
+        time.sleep(latency)
+        return real_read(self, f, block_id)
+
+    read_plan = plan.plan_reads(files)
+    with mock.patch.object(plan.Source, "read", slow_read):
+        start = time.perf_counter()
+        blocks = plan.Prefetcher(read_plan) if prefetch else plan.read_blocks(read_plan)
+        for _ in blocks:
+            pass
+        return time.perf_counter() - start, len(read_plan.chosen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=64, help="input size in MiB")
+    parser.add_argument("--n", type=int, default=8)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=2, help="ms per block read")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        files = make_horcruxes(Path(workdir), args.size * MiB, args.n, args.k)
+        for name, prefetch in (("read_blocks", False), ("Prefetcher", True)):
+            elapsed, sources = time_reads(files, args.latency / 1000, prefetch)
+            rate = args.size / elapsed
+            print(f"{name:>12}: {sources} sources {elapsed:8.2f}s {rate:10.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Combine throughput benchmark.
+
+Splits a file of random data into horcruxes and times combining k of them end to end,
+with `combine.from_files` and with the original combine, which walked every horcrux in
+order through the deque-of-ints reader. Both run on indexed horcruxes and on copies
+without the index footer, where from_files has to scan the frames for block locations.
+The frames mode times `Horcrux.read_block` and `skip_block` over one horcrux on their
+own, with FrameReader and the deque reader.
+
+usage:
+    PYTHONPATH=. python benchmarks/combine_throughput.py --size 4096 --n 3 --k 2
+    PYTHONPATH=. python benchmarks/combine_throughput.py --mode frames --frame-size 4096
+"""
+import argparse
+import os
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+from typing import List
+
+from google.protobuf.internal.decoder import _DecodeVarint32
+
+from horcrux import combine, io, split
+
+MiB = 1024 * 1024
+
+
+class LegacyHorcrux(io.Horcrux):
+    "the pre-FrameReader implementation, kept here as the baseline"
+
+    def _read_message_bytes(self, skip=False):
+        buff = self.__dict__.setdefault("_in_buff", deque(maxlen=10))
+        if len(buff) < 10:
+            buff.extend(self.stream.read(10 - len(buff)))
+        msg_len, new_pos = _DecodeVarint32(buff, 0)
+        for _ in range(new_pos):
+            buff.popleft()
+        if msg_len <= len(buff):
+            m = bytes(buff.popleft() for _ in range(msg_len))
+            return m if not skip else None
+        if skip:
+            try:
+                self.stream.seek(msg_len - len(buff), 1)
+            except OSError:
+                self.stream.read(msg_len - len(buff))
+            buff.clear()
+            return
+        ary = bytearray(buff)
+        ary.extend(self.stream.read(msg_len - len(buff)))
+        buff.clear()
+        return bytes(ary)
+
+
+def make_horcruxes(workdir, size, n, k, frame_size) -> List[Path]:
+    source = workdir / "source.bin"
+    with open(source, "wb") as fout:
+        remaining = size
+        while remaining:
+            chunk = os.urandom(min(remaining, 16 * MiB))
+            fout.write(chunk)
+            remaining -= len(chunk)
+    with open(source, "rb") as fin:
+        s = split.Stream(
+            fin, n, k, size, "source.bin", workdir, "bench", frame_size=frame_size
+        )
+        s.init_horcruxes()
+        s.distribute()
+        for h in s.horcruxes:
+            h.stream.close()
+    source.unlink()
+    return sorted(workdir.glob("bench_*.hrcx"))[:k]
+
+
+def strip_index(path, outdir):
+    "copy the horcrux at path into outdir the way it was written before index footers"
+    src = io.Horcrux(open(path, "rb"))
+    src.init_read()
+    with open(outdir / path.name, "wb") as fout:
+        hx = io.Horcrux(fout)
+        hx.init_write(
+            src.share,
+            src.crypto_header,
+            src.encrypted_filename,
+            src.cipher_mode,
+            src.distribution,
+        )
+        while src.next_block_id is not None:
+            hx.write_data_block(*src.read_block())
+        hx.flush()
+    src.close()
+    return outdir / path.name
+
+
+def legacy_combine(files, outfile):
+    "the original combine: merge every horcrux's blocks in order, read sequentially"
+    streams = [open(f, "rb") for f in files]
+    try:
+        hxs = []
+        for st in streams:
+            h = LegacyHorcrux(st)
+            h.init_read()
+            hxs.append(h)
+        crypto = combine._init_crypto(hxs)
+        blocks = combine._merged_blocks(hxs)
+        for pt in combine._decrypt_sequential(blocks, crypto):
+            outfile.write(pt)
+    finally:
+        for st in streams:
+            st.close()
+
+
+def current_combine(files, outfile):
+    combine.from_files(files, outfile=outfile)
+
+
+def time_combine(files, combiner):
+    with open(os.devnull, "wb") as sink:
+        start = time.perf_counter()
+        combiner(files, sink)
+        return time.perf_counter() - start
+
+
+def time_reads(path, horcrux_class, skip=False):
+    "time reading (or skipping) every block of the horcrux at path"
+    with open(path, "rb") as f:
+        start = time.perf_counter()
+        h = horcrux_class(f)
+        h.init_read()
+        blocks = 0
+        while h.next_block_id is not None:
+            if skip:
+                h.skip_block()
+            else:
+                h.read_block()
+            blocks += 1
+        return time.perf_counter() - start, blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=1024, help="input size in MiB")
+    parser.add_argument("--n", type=int, default=3)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--frame-size", type=int, default=split.FRAME_SIZE)
+    parser.add_argument(
+        "--mode", choices=("combine", "scan", "frames", "all"), default="all"
+    )
+    parser.add_argument("--dir", type=Path, help="scratch directory (default: tmp)")
+    args = parser.parse_args()
+
+    size = args.size * MiB
+    with tempfile.TemporaryDirectory(dir=args.dir) as workdir:
+        workdir = Path(workdir)
+        files = make_horcruxes(workdir, size, args.n, args.k, args.frame_size)
+        combiners = (("before (deque)", legacy_combine), ("after", current_combine))
+        if args.mode in ("combine", "all"):
+            for name, combiner in combiners:
+                elapsed = time_combine(files, combiner)
+                print(
+                    f"{'combine':>10} {name:>20}: {elapsed:8.2f}s "
+                    f"{size / MiB / elapsed:10.1f} MiB/s"
+                )
+        if args.mode in ("scan", "all"):
+            (workdir / "noindex").mkdir()
+            unindexed = [strip_index(f, workdir / "noindex") for f in files]
+            for name, combiner in combiners:
+                elapsed = time_combine(unindexed, combiner)
+                print(
+                    f"{'no index':>10} {name:>20}: {elapsed:8.2f}s "
+                    f"{size / MiB / elapsed:10.1f} MiB/s"
+                )
+        if args.mode in ("frames", "all"):
+            path = files[0]
+            read = path.stat().st_size / MiB
+            readers = (("before (deque)", LegacyHorcrux), ("after", io.Horcrux))
+            for op, skip in (("read_block", False), ("skip_block", True)):
+                for name, horcrux_class in readers:
+                    elapsed, blocks = time_reads(path, horcrux_class, skip)
+                    print(
+                        f"{op:>10} {name:>20}: {elapsed:8.2f}s "
+                        f"{read / elapsed:10.1f} MiB/s ({blocks} blocks)"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Erasure coded distribution benchmark.
+
+Splits random data with the replicate and erasure distributions over a grid of n:k and
+reports the bytes written to all horcruxes (as a multiple of the input), split time and
+combine time from k horcruxes.
+
+usage:
+    PYTHONPATH=. python benchmarks/erasure_distribution.py --size 32 --grid 3:2 5:3 10:5
+"""
+import argparse
+import io
+import os
+import time
+
+from horcrux import combine, split
+
+MiB = 1024 * 1024
+
+
+def n_k(value):
+    n, k = value.split(":")
+    return int(n), int(k)
+
+
+def run(data, n, k, distribution):
+    out = [io.BytesIO() for _ in range(n)]
+    start = time.perf_counter()
+    s = split.Stream(
+        io.BytesIO(data),
+        n,
+        k,
+        len(data),
+        digest_profile="fast",
+        distribution=distribution,
+    )
+    s.init_horcruxes(out)
+    s.distribute()
+    split_time = time.perf_counter() - start
+    written = sum(len(o.getvalue()) for o in out)
+    start = time.perf_counter()
+    combined = combine.from_streams([io.BytesIO(o.getvalue()) for o in out[-k:]])
+    combine_time = time.perf_counter() - start
+    assert combined == data
+    return written, split_time, combine_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=32, help="input size in MiB")
+    parser.add_argument(
+        "--grid", type=n_k, nargs="+", default=[(3, 2), (5, 3), (10, 5)], metavar="N:K"
+    )
+    args = parser.parse_args()
+
+    data = os.urandom(args.size * MiB)
+    print(f"{'n:k':>6} {'distribution':>12} {'written':>8} {'split':>8} {'combine':>8}")
+    for n, k in args.grid:
+        for distribution in ("replicate", "erasure"):
+            written, split_time, combine_time = run(data, n, k, distribution)
+            print(
+                f"{f'{n}:{k}':>6} {distribution:>12} {written / len(data):>7.2f}x "
+                f"{split_time:>7.2f}s {combine_time:>7.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Batch secret sharing benchmark.
+
+Compares calling sss.generate_shares / sss.combine_shares once per secret with the
+batched sss.generate_shares_many / sss.combine_shares_many. Uses the fast digest profile,
+with the default profile argon2 dominates either way. Even with the fast profile each
+secret's argon2 digest (hashed when splitting and again to check a combine) is most of
+the cost, which caps the end to end speedup, so the field arithmetic alone (the field's
+generate / recover against generate_many / recover_many, digests made up front) is timed
+too.
+
+usage:
+    PYTHONPATH=. python benchmarks/sss_batch.py --secrets 10000 --n 5 --k 3
+"""
+import argparse
+import time
+
+from nacl.utils import random
+
+from horcrux import sss
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def one_at_a_time(secrets, n, k, profile, field):
+    return [sss.generate_shares(n, k, s, profile, field) for s in secrets]
+
+
+def combine_one_at_a_time(share_sets):
+    return [sss.combine_shares(s) for s in share_sets]
+
+
+def field_one_at_a_time(backend, k, anchor_sets, xs):
+    return [backend.generate(k, anchors, xs) for anchors in anchor_sets]
+
+
+def recover_one_at_a_time(backend, xs, y_sets, targets):
+    return [
+        backend.recover([sss.Point(x, y) for x, y in zip(xs, ys)], targets)
+        for ys in y_sets
+    ]
+
+
+def report(field, op, rate, single, batch):
+    print(
+        f"{field:>6} {op:>8} {rate / single:>10.0f} {rate / batch:>10.0f} "
+        f"{single / batch:>7.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--secrets", type=int, default=10000)
+    parser.add_argument("--n", type=int, default=5)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--profile", choices=sss.PROFILES, default="fast")
+    args = parser.parse_args()
+
+    profile = sss.PROFILES[args.profile]
+    secrets = [b"\x00" + random(31) for _ in range(args.secrets)]
+    rate = len(secrets)
+    print(f"numpy: {'yes' if sss.np is not None else 'no'}")
+    print("end to end")
+    print(f"{'field':>6} {'op':>8} {'single/s':>10} {'batch/s':>10} {'speedup':>8}")
+    for field in sss.FIELDS:
+        single, _ = timed(one_at_a_time, secrets, args.n, args.k, profile, field)
+        batch, sets = timed(
+            sss.generate_shares_many, secrets, args.n, args.k, profile, field
+        )
+        report(field, "generate", rate, single, batch)
+        picked = [s[-args.k :] for s in sets]
+        single, _ = timed(combine_one_at_a_time, picked)
+        batch, recovered = timed(sss.combine_shares_many, picked)
+        assert recovered == secrets
+        report(field, "combine", rate, single, batch)
+
+    print("field arithmetic only")
+    print(f"{'field':>6} {'op':>8} {'single/s':>10} {'batch/s':>10} {'speedup':>8}")
+    digest_x, secret_x = sss.INDEX_SPACES["legacy"]
+    anchor_sets = [
+        [sss.Point(digest_x, b"\x00" + random(31)), sss.Point(secret_x, s)]
+        for s in secrets
+    ]
+    xs = range(args.n)
+    for field, backend in sss.FIELDS.items():
+        single, _ = timed(field_one_at_a_time, backend, args.k, anchor_sets, xs)
+        batch, y_sets = timed(backend.generate_many, args.k, anchor_sets, xs)
+        report(field, "generate", rate, single, batch)
+        picked, targets = tuple(xs[-args.k :]), (secret_x, digest_x)
+        y_sets = [ys[-args.k :] for ys in y_sets]
+        single, _ = timed(recover_one_at_a_time, backend, picked, y_sets, targets)
+        batch, recovered = timed(backend.recover_many, picked, y_sets, targets)
+        assert [r[0] for r in recovered] == secrets
+        report(field, "recover", rate, single, batch)
+
+if __name__ == "__main__":
+    main()
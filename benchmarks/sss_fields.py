@@ -0,0 +1,52 @@
+"""
+Secret sharing field benchmark.
+
+Times sss.generate_shares and sss.combine_shares for each backend in sss.FIELDS. The
+fast digest profile is used so the argon2 digest doesn't drown out the field work.
+
+usage:
+    PYTHONPATH=. python benchmarks/sss_fields.py
+    PYTHONPATH=. python benchmarks/sss_fields.py --grid 253:253 --repeat 3
+"""
+import argparse
+import time
+
+from nacl.utils import random
+
+from horcrux import gf256, sss
+
+DEFAULT_GRID = ["5:3", "50:10", "253:50", "253:253"]
+
+
+def best_of(repeat, func, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--grid", nargs="+", default=DEFAULT_GRID, metavar="N:K")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    profile = sss.PROFILES["fast"]
+    print(f"numpy: {'yes' if gf256.np is not None else 'no'}")
+    print(f"{'n':>5} {'k':>5} {'field':>6} {'generate':>10} {'combine':>10}")
+    for spec in args.grid:
+        n, k = (int(v) for v in spec.split(":"))
+        for field in sss.FIELDS:
+            secret = random(32) if field == "gf256" else b"\x00" + random(31)
+            gen, shares = best_of(
+                args.repeat, sss.generate_shares, n, k, secret, profile, field
+            )
+            comb, recovered = best_of(args.repeat, sss.combine_shares, shares[-k:])
+            assert recovered == secret
+            print(f"{n:>5} {k:>5} {field:>6} {gen:>9.4f}s {comb:>9.4f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Share generation microbenchmark.
+
+Times PrimeField.generate, the coefficient form + Horner evaluation that
+sss.generate_shares uses, against the original `_split_secret`, which interpolated
+every share from the random base points, digest and secret with `_larange_interpolate`.
+Both are copied here as they were, as the baseline. The argon2 digest is left out, it
+costs the same either way.
+
+usage:
+    PYTHONPATH=. python benchmarks/sss_split.py
+    PYTHONPATH=. python benchmarks/sss_split.py --grid 253:253 100:50
+"""
+import argparse
+import time
+
+from nacl.utils import random
+
+from horcrux import sss
+from horcrux.sss import DIGEST_INDEX, PRIME, SECRET_INDEX, Point
+
+DEFAULT_GRID = ["5:2", "5:5", "50:5", "50:50", "253:2", "253:50", "253:253"]
+
+
+def product(vals):
+    acc = 1
+    for v in vals:
+        acc *= v
+    return acc
+
+
+def _divmod(num, den, p):
+    mod_inverse = pow(den, p - 2, p)  # modular version of 1/den
+    return num * mod_inverse
+
+
+def _larange_interpolate(x, points):
+    "the original interpolation, one full evaluation of the curve per call"
+    p = PRIME
+    k = len(points)
+    xs, ys = [], []
+    for pt in points:
+        xs.append(pt.X)
+        ys.append(pt.Y)
+    assert k == len(set(xs)), "Points must be destinct."
+    nums = []  # numerators
+    dens = []  # denominators calculated individually to prevent float div errors
+    for i in range(k):
+        others = list(xs)
+        cur = others.pop(i)  # current x value
+        nums.append(product(x - o for o in others))
+        dens.append(product(cur - o for o in others))
+    den = product(dens)  # common denominator
+    num = sum([_divmod(nums[i] * den * ys[i] % p, dens[i], p) for i in range(k)])
+    return _divmod(num, den, p) % p
+
+
+def legacy_split_secret(shares, threshold, secret, digest):
+    "the original _split_secret, taking the digest instead of hashing the secret"
+    digest = int.from_bytes(digest, "big")
+    secret = int.from_bytes(secret, "big")
+
+    def rand_int_32():
+        return int.from_bytes(random(32), "big")
+
+    rand_points = [Point(i, rand_int_32() % PRIME) for i in range(threshold - 2)]
+    base_points = rand_points + [
+        Point(DIGEST_INDEX, digest),
+        Point(SECRET_INDEX, secret),
+    ]
+    return [
+        Point(i, _larange_interpolate(i, base_points).to_bytes(32, "big"))
+        for i in range(shares)
+    ]
+
+
+def generate(shares, threshold, secret, digest):
+    anchors = [Point(DIGEST_INDEX, digest), Point(SECRET_INDEX, secret)]
+    ys = sss.PrimeField.generate(threshold, anchors, range(shares))
+    return [Point(i, y) for i, y in enumerate(ys)]
+
+
+def recovers(points, k, secret):
+    "any k of the shares give back the secret"
+    return sss.PrimeField.recover(points[-k:], (SECRET_INDEX,))[0] == secret
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--grid", nargs="+", default=DEFAULT_GRID, metavar="N:K")
+    args = parser.parse_args()
+
+    print(f"{'n':>5} {'k':>5} {'original':>12} {'generate':>12} {'speedup':>8}")
+    for spec in args.grid:
+        n, k = (int(v) for v in spec.split(":"))
+        secret, digest = b"\x00" + random(31), b"\x00" + random(31)
+        old, legacy = timed(legacy_split_secret, n, k, secret, digest)
+        new, shares = timed(generate, n, k, secret, digest)
+        assert recovers(legacy, k, secret) and recovers(shares, k, secret)
+        print(f"{n:>5} {k:>5} {old:>11.4f}s {new:>11.4f}s {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
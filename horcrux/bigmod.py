@@ -0,0 +1,94 @@
+"""
+Vectorized arithmetic mod a 256 bit prime just under 2^256, using NumPy.
+
+Python big ints are one object per value, so batches of them can't be vectorized.
+Here each value is split into sixteen 16 bit limbs (least significant first), stacked
+on the first axis of an array. A product of two limbs fits in 32 bits, so a whole matrix
+product of limbs sums exactly in float64 and runs as one BLAS matmul; carrying and
+folding the high limbs back in (2^256 = c mod p, for p = 2^256 - c) is done afterwards
+in uint64. Values go in and out as concatenated 32 byte big endian strings.
+"""
+from typing import Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+LIMBS = 16
+LIMB_BITS = 16
+MASK = (1 << LIMB_BITS) - 1
+PRODUCT = LIMBS * 2 - 1  # limbs of the product of two values, before carrying
+CHUNK = 1 << 16  # most output values computed at once, bounding the scratch arrays
+
+
+def to_limbs(data: bytes):
+    "limbs of each 32 byte big endian value in data, shape (LIMBS, count)"
+    limbs = np.frombuffer(data, dtype=">u2").reshape(-1, LIMBS)
+    return np.ascontiguousarray(limbs[:, ::-1].T, dtype=np.uint64)
+
+
+def from_limbs(limbs) -> bytes:
+    "the values of limbs (shape (LIMBS, ...)) as 32 byte big endian strings, in C order"
+    return np.moveaxis(limbs, 0, -1)[..., ::-1].astype(">u2").tobytes()
+
+
+def int_limbs(values: Sequence[int]):
+    "limbs of python ints below 2^256, shape (LIMBS, len(values))"
+    return to_limbs(b"".join(v.to_bytes(32, "big") for v in values))
+
+
+def reduce(limbs, p: int):
+    "values of limbs (carried, any number of them) mod p, as LIMBS limbs"
+    c = (1 << (LIMBS * LIMB_BITS)) - p
+    assert 0 < c <= MASK, "p must be just under 2^256"
+    while len(limbs) > LIMBS:
+        high = limbs[LIMBS:]
+        if not high.any():
+            limbs = limbs[:LIMBS]
+            break
+        # value = low + high * 2^256 = low + high * c (mod p)
+        folded = np.zeros((max(LIMBS, len(high) + 1) + 1,) + limbs.shape[1:], np.uint64)
+        folded[:LIMBS] = limbs[:LIMBS]
+        folded[: len(high)] += high * np.uint64(c)
+        limbs = _carry(folded)
+    # now below 2^256, so at most one p over: value - p = value + c - 2^256
+    plus_c = np.zeros((LIMBS + 1,) + limbs.shape[1:], np.uint64)
+    plus_c[:LIMBS] = limbs
+    plus_c[0] += np.uint64(c)
+    plus_c = _carry(plus_c)
+    return np.where(plus_c[LIMBS] > 0, plus_c[:LIMBS], limbs)
+
+
+def matmul_mod(a: Sequence[Sequence[int]], b, p: int):
+    """
+    a (m x k python ints below 2^256) @ b (limbs, shape (LIMBS, k, count)) mod p, as
+    limbs of shape (LIMBS, m, count).
+    """
+    m, k = len(a), len(a[0])
+    assert k < 1 << 16, "too many terms to sum exactly in float64"
+    a_limbs = int_limbs([v for row in a for v in row]).reshape(LIMBS, m, k)
+    # limb i of a times limb j of b lands on limb i + j of the product
+    spread = np.zeros((m, PRODUCT, k, LIMBS))
+    for j in range(LIMBS):
+        spread[:, j : j + LIMBS, :, j] = a_limbs.transpose(1, 0, 2)
+    spread = spread.reshape(m * PRODUCT, k * LIMBS)
+    count = b.shape[-1]
+    b = b.transpose(1, 0, 2).reshape(k * LIMBS, count)
+    out = np.empty((LIMBS, m, count), np.uint64)
+    step = max(1, CHUNK // m)
+    for start in range(0, count, step):
+        product = spread @ b[:, start : start + step].astype(np.float64)
+        product = product.reshape(m, PRODUCT, -1).transpose(1, 0, 2)
+        carried = np.zeros((PRODUCT + 3,) + product.shape[1:], np.uint64)
+        carried[:PRODUCT] = product
+        out[:, :, start : start + step] = reduce(_carry(carried), p)
+    return out
+
+
+def _carry(limbs):
+    "propagate carries so every limb but the last is below 2^16, in place"
+    for i in range(len(limbs) - 1):
+        limbs[i + 1] += limbs[i] >> np.uint64(LIMB_BITS)
+        limbs[i] &= np.uint64(MASK)
+    return limbs
@@ -1,4 +1,5 @@
 """Console script for horcrux."""
+
 import argparse
 import sys
 import os
@@ -6,13 +7,20 @@ from pathlib import Path
 
 from . import split
 from . import combine
-from .sss import NotEnoughShares, IdMissMatch
+from . import repair
+from .crypto import MODES
+from .sss import NotEnoughShares, IdMissMatch, InvalidDigest, PROFILES, FIELDS
 
 
-def required_length(nmin, nmax):
+def required_length(nmin, nmax=None):
     class RequiredLength(argparse.Action):
         def __call__(self, parser, args, values, option_string=None):
-            if not nmin <= len(values) <= nmax:
+            if nmax is None and len(values) < nmin:
+                msg = 'argument "{f}" requires at least {nmin} arguments'.format(
+                    f=self.dest, nmin=nmin
+                )
+                raise argparse.ArgumentTypeError(msg)
+            if nmax is not None and not nmin <= len(values) <= nmax:
                 msg = 'argument "{f}" requires between {nmin} and {nmax} arguments'.format(
                     f=self.dest, nmin=nmin, nmax=nmax
                 )
@@ -22,6 +30,21 @@ def required_length(nmin, nmax):
     return RequiredLength
 
 
+def byte_range(value):
+    "parse OFFSET[:LENGTH] into (offset, length), length is None if left out"
+    offset, _, length = value.partition(":")
+    try:
+        offset = int(offset)
+        length = int(length) if length else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid range {value!r}, use OFFSET[:LENGTH]"
+        )
+    if offset < 0 or (length is not None and length < 0):
+        raise argparse.ArgumentTypeError("range offset and length must be positive")
+    return offset, length
+
+
 def _parse(args=None):
     examples = """example:
     horcrux split passwords.txt ~/horcruxes 2 5
@@ -46,7 +69,11 @@ def _parse(args=None):
     split_example = """examples:
     horcrux split passwords.txt ~/horcruxes 2 5
     horcrux split myfile.txt ~/horcruxes/my_hx 4 5
-    tar c "Documents" | horcrux split - doc_horcrux --filename Documents.tar 2 2"""
+    tar c "Documents" | horcrux split - doc_horcrux --filename Documents.tar 2 2
+    horcrux split backup.tar /mnt/disk1/bk 3 3 --spread-to /mnt/disk2 /mnt/disk3
+    horcrux split video.mkv ~/horcruxes/vid 3 5 --distribution key-only
+    pg_dump mydb | horcrux split - db_dump -f mydb.sql 3 5 --memory-limit 16
+    tar c Documents | horcrux split - docs -f Documents.tar 3 5 --spool"""
     split_parser = subparsers.add_parser(
         "split",
         aliases=["sp", "s"],
@@ -81,11 +108,112 @@ def _parse(args=None):
         "--filename",
         help="What to title re-assembled file. Usefull when processing streams.",
     )
+    split_parser.add_argument(
+        "--digest-profile",
+        choices=PROFILES,
+        default="interactive",
+        help=(
+            "Cost of the key check run when combining (default: %(default)s). "
+            "Higher settings are slower and use more memory."
+        ),
+    )
+    split_parser.add_argument(
+        "--field",
+        choices=FIELDS,
+        default="prime",
+        help="Finite field used to share the encryption key (default: %(default)s).",
+    )
+    split_parser.add_argument(
+        "--cipher-mode",
+        choices=MODES,
+        default="stream",
+        help=(
+            "stream: sequential secretstream encryption (default). block: seal each "
+            "block independently so it can be encrypted and decrypted in parallel."
+        ),
+    )
+    split_parser.add_argument(
+        "--distribution",
+        choices=["replicate", "erasure", "key-only"],
+        default="replicate",
+        help=(
+            "replicate: copy each block to n-k+1 horcruxes (default). erasure: "
+            "Reed-Solomon code each block over every horcrux, any k of which rebuild "
+            "it, writing n/k times the input instead of n-k+1 times. key-only: write "
+            "the encrypted input once to a .blob file, the horcruxes only hold key "
+            "shares. Combine k of them with the blob."
+        ),
+    )
+    split_parser.add_argument(
+        "--blob-copies",
+        type=int,
+        default=1,
+        metavar="COPIES",
+        help="Identical ciphertext blobs to write with --distribution key-only.",
+    )
+    split_parser.add_argument(
+        "--frame-size",
+        type=int,
+        default=split.FRAME_SIZE,
+        metavar="BYTES",
+        help=(
+            "Most input encrypted into one block (default: %(default)s). Bounds the "
+            "memory used to split and combine, whatever the input size."
+        ),
+    )
+    split_parser.add_argument(
+        "--memory-limit",
+        type=int,
+        metavar="MIB",
+        help=(
+            "Most memory (MiB) to split with. A stream of unknown size, like stdin, is "
+            "then distributed in one continuous schedule instead of 100 MiB chunks."
+        ),
+    )
+    split_parser.add_argument(
+        "--spool",
+        action="store_true",
+        help=(
+            "Copy a stream (stdin, a pipe) to a temporary file first, so it is "
+            "distributed as efficiently as a file of known size."
+        ),
+    )
+    split_parser.add_argument(
+        "--spool-dir",
+        type=Path,
+        metavar="DIR",
+        help="Where to put the --spool temporary file (default: the system's).",
+    )
+    split_parser.add_argument(
+        "--size",
+        type=int,
+        metavar="BYTES",
+        help="Exact size of a streamed INFILE, for the same effect without spooling.",
+    )
+    split_parser.add_argument(
+        "--spread-to",
+        nargs="+",
+        default=[],
+        type=Path,
+        metavar="DIR",
+        help=(
+            "More directories to write horcruxes to, round robin with OUTPUT's. Put "
+            "each on its own disk to write them all in parallel."
+        ),
+    )
+    split_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print how busy each stage of the split pipeline was.",
+    )
 
     combine_example = """examples:
     horcrux combine ~/horcruxes/passwords_1.hrcx ~/horcruxes/passwords_4.hrcx
     horcrux combine my_hx_* --output=reconstructed_file.txt
-    horcrux combine doc_horcrux_1.hrcx doc_horcrux_2.hrcx --output - | tar x"""
+    horcrux combine doc_horcrux_1.hrcx doc_horcrux_2.hrcx --output - | tar x
+    horcrux combine db_dump_* --range 1048576:4096 > page.bin
+    horcrux combine /mnt/disk*/bk_* --output backup.tar --memory-limit 16
+    horcrux combine vid_1.hrcx vid_3.hrcx vid_4.hrcx vid.blob"""
     c_parser = subparsers.add_parser(
         "combine",
         aliases=["comb", "c"],
@@ -93,7 +221,7 @@ def _parse(args=None):
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
     c_parser.add_argument(
-        "in_files", nargs="+", metavar="INPUT_FILES", action=required_length(2, 254)
+        "in_files", nargs="+", metavar="INPUT_FILES", action=required_length(2)
     )
     c_parser.add_argument(
         "--output",
@@ -108,6 +236,97 @@ def _parse(args=None):
         action="store_true",
         help="Overwrite files without prompting",
     )
+    c_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print how many bytes were read from each horcrux.",
+    )
+    c_parser.add_argument(
+        "--range",
+        type=byte_range,
+        metavar="OFFSET[:LENGTH]",
+        help=(
+            "Only extract LENGTH bytes (default: the rest) starting at OFFSET. Written "
+            "to stdout unless OUTPUT names a file. Fast for --cipher-mode block "
+            "horcruxes, which only decrypt the blocks in the range."
+        ),
+    )
+    c_parser.add_argument(
+        "--memory-limit",
+        type=int,
+        metavar="MIB",
+        help=(
+            "Most memory (MiB) to read horcruxes ahead into while earlier blocks are "
+            "decrypted (default: up to 64 MiB per horcrux read)."
+        ),
+    )
+
+    repair_example = """examples:
+    horcrux repair ~/horcruxes/passwords_1.hrcx ~/horcruxes/passwords_4.hrcx --lost 2
+    horcrux repair my_hx_* --lost 3 --output /mnt/usb/my_hx_3.hrcx"""
+    r_parser = subparsers.add_parser(
+        "repair",
+        aliases=["rep", "r"],
+        epilog=repair_example,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    r_parser.add_argument("in_files", nargs="+", metavar="INPUT_FILES")
+    r_parser.add_argument(
+        "--lost",
+        type=int,
+        required=True,
+        metavar="NUMBER",
+        help="Number of the lost horcrux, as in its file name (my_hx_2.hrcx is 2).",
+    )
+    r_parser.add_argument(
+        "--output",
+        type=Path,
+        metavar="OUTPUT",
+        help="Where to write it (default: next to the first input, named like it).",
+    )
+    r_parser.add_argument(
+        "--overwrite",
+        "-f",
+        action="store_true",
+        help="Overwrite OUTPUT if it exists.",
+    )
+
+    reshare_example = """examples:
+    horcrux reshare ~/horcruxes/passwords_1.hrcx ~/horcruxes/passwords_4.hrcx --to 3 7
+    horcrux reshare my_hx_* --to 4 7 --output /mnt/usb --title my_new_hx"""
+    rs_parser = subparsers.add_parser(
+        "reshare",
+        aliases=["res"],
+        epilog=reshare_example,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    rs_parser.add_argument("in_files", nargs="+", metavar="INPUT_FILES")
+    rs_parser.add_argument(
+        "--to",
+        type=int,
+        nargs=2,
+        required=True,
+        metavar=("THRESHOLD", "N"),
+        help="Make N new horcruxes, THRESHOLD of which are needed to re-assemble.",
+    )
+    rs_parser.add_argument(
+        "--output",
+        type=Path,
+        metavar="OUTPUT",
+        help="Where to place the new horcruxes (default: next to the first input).",
+    )
+    rs_parser.add_argument(
+        "--title",
+        help="What to title the new horcruxes (default: the inputs' title with "
+        "_reshared added).",
+    )
+    rs_parser.add_argument(
+        "--overwrite",
+        "-f",
+        action="store_true",
+        help="Overwrite existing horcruxes in OUTPUT with the new ones.",
+    )
+
     if args is None:
         args = root_parser.parse_args()
     else:
@@ -119,7 +338,7 @@ def _resolve_files_split(args):
     # file size stuff
     if args.in_file == "-":
         args.in_file = sys.stdin.buffer
-        args.file_size = None
+        args.file_size = args.size
     else:
         args.in_file = Path(args.in_file)
         if not args.in_file.exists():
@@ -130,7 +349,7 @@ def _resolve_files_split(args):
             args.file_size = os.stat(args.in_file).st_size
             args.filename = args.in_file.name if not args.filename else args.filename
         else:
-            args.file_size = None
+            args.file_size = args.size
 
     # output_dir and filename
     if not args.output_dir.exists():
@@ -168,6 +387,56 @@ def _resolve_files_combine(args):
     return args
 
 
+def _distribute(s, args):
+    "distribute split stream s, returning 1 if INFILE didn't match its size"
+    try:
+        s.distribute(progress=True)
+    except split.SizeMismatchError as e:
+        print(f"INFILE didn't match its size: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _mib(value):
+    return None if value is None else value * 1024 * 1024
+
+
+def _print_split_stats(stats):
+    print("stage        busy    starved    blocked  peak queue", file=sys.stderr)
+    stages = [("read", stats["read"]), ("encrypt", stats["encrypt"])]
+    for i, st in stats["write"].items():
+        stages.append((f"write {i + 1}" if isinstance(i, int) else i, st))
+    for name, st in stages:
+        if st is None:
+            continue
+        print(
+            f"{name:<8} {st.busy:>7.2f}s {st.starved:>9.2f}s {st.blocked:>9.2f}s "
+            f"{st.peak_depth:>11}",
+            file=sys.stderr,
+        )
+
+
+def _combine_range(args):
+    "write the --range slice of the combined horcruxes to a file or stdout"
+    to_file = isinstance(args.output, Path) and not args.output.is_dir()
+    if to_file and args.output.exists() and not args.overwrite:
+        print(f"{args.output} already exists, use --overwrite.", file=sys.stderr)
+        return 2
+    data = combine.read_range(args.in_files, *args.range)
+    if to_file:
+        args.output.write_bytes(data)
+    else:
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    return 0
+
+
+def _print_problems(problems):
+    "warn about the corrupt or truncated horcruxes combine worked around"
+    for path, problem in problems.items():
+        print(f"warning: {path}: {problem}", file=sys.stderr)
+
+
 def main(args=None):
     """Console script for horcrux."""
     try:
@@ -181,6 +450,9 @@ def main(args=None):
 
     if args.cmd.startswith("s"):
         args = _resolve_files_split(args)
+        outdir = args.output_dir
+        if args.spread_to:
+            outdir = [args.output_dir, *args.spread_to]
         if isinstance(args.in_file, Path):
             with open(args.in_file, "rb") as in_stream:
                 s = split.Stream(
@@ -189,11 +461,20 @@ def main(args=None):
                     args.threshold,
                     args.file_size,
                     args.filename,
-                    args.output_dir,
+                    outdir,
                     args.horcrux_title,
+                    args.digest_profile,
+                    args.field,
+                    args.cipher_mode,
+                    distribution=args.distribution,
+                    blob_copies=args.blob_copies,
+                    frame_size=args.frame_size,
+                    memory_limit=_mib(args.memory_limit),
+                    spool=args.spool,
+                    spool_dir=args.spool_dir,
                 )
                 s.init_horcruxes()
-                s.distribute(progress=True)
+                error = _distribute(s, args)
         else:
             s = split.Stream(
                 args.in_file,
@@ -201,15 +482,30 @@ def main(args=None):
                 args.threshold,
                 args.file_size,
                 args.filename,
-                args.output_dir,
+                outdir,
                 args.horcrux_title,
+                args.digest_profile,
+                args.field,
+                args.cipher_mode,
+                distribution=args.distribution,
+                blob_copies=args.blob_copies,
+                frame_size=args.frame_size,
+                memory_limit=_mib(args.memory_limit),
+                spool=args.spool,
+                spool_dir=args.spool_dir,
             )
             s.init_horcruxes()
-            s.distribute(progress=True)
-        return 0
+            error = _distribute(s, args)
+        if args.stats:
+            _print_split_stats(s.stats)
+        return error
     elif args.cmd.startswith("c"):
         args = _resolve_files_combine(args)
+        problems = {}
         try:
+            if args.range is not None:
+                return _combine_range(args)
+            stats = {}
             if isinstance(args.output, Path):
                 combine.from_files(
                     args.in_files,
@@ -217,16 +513,62 @@ def main(args=None):
                     args.output_filename,
                     overwrite=args.overwrite,
                     progress=True,
+                    stats=stats,
+                    problems=problems,
+                    memory_limit=_mib(args.memory_limit),
                 )
             else:
-                combine.from_files(args.in_files, outfile=args.output)
+                combine.from_files(
+                    args.in_files,
+                    outfile=args.output,
+                    stats=stats,
+                    problems=problems,
+                    memory_limit=_mib(args.memory_limit),
+                )
+            if args.stats:
+                for path, read in stats.items():
+                    print(f"{path}: {read} bytes", file=sys.stderr)
         # Catch most likely failure modes
-        except (NotEnoughShares, IdMissMatch, combine.crypto.DecryptionError) as e:
-            if isinstance(e, combine.DecryptionError):
+        except (
+            NotEnoughShares,
+            IdMissMatch,
+            combine.crypto.DecryptionError,
+            ValueError,
+        ) as e:
+            if getattr(e, "horcrux_id", None) is not None:
                 print(f"{e} Horcrux {e.horcrux_id+1} is likely corrupted.")
             else:
                 print(e, file=sys.stderr)
             return 2
+        finally:
+            _print_problems(problems)
+        return 0
+    elif args.cmd in ("reshare", "res"):
+        threshold, n = args.to
+        try:
+            paths = repair.reshare(
+                args.in_files, threshold, n, args.output, args.title, args.overwrite
+            )
+        except (NotEnoughShares, IdMissMatch, InvalidDigest, ValueError) as e:
+            print(e, file=sys.stderr)
+            return 2
+        except FileExistsError as e:
+            print(f"{e.filename} already exists, use --overwrite.", file=sys.stderr)
+            return 2
+        print(f"Made {len(paths)} horcruxes in {paths[0].parent}", file=sys.stderr)
+        return 0
+    elif args.cmd.startswith("r"):
+        try:
+            path = repair.regenerate(
+                args.in_files, args.lost - 1, args.output, args.overwrite
+            )
+        except (NotEnoughShares, IdMissMatch, InvalidDigest, ValueError) as e:
+            print(e, file=sys.stderr)
+            return 2
+        except FileExistsError as e:
+            print(f"{e.filename} already exists, use --overwrite.", file=sys.stderr)
+            return 2
+        print(f"Rebuilt {path}", file=sys.stderr)
         return 0
 
 
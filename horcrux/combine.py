@@ -1,13 +1,21 @@
-from typing import Sequence, List, Union
+from typing import Iterator, Sequence, List, Union
 from pathlib import Path
+from collections import deque
+from io import RawIOBase
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
+import heapq
+import itertools
+import os
 import sys
 from rich.progress import Progress, BarColumn, TimeRemainingColumn, FileSizeColumn
 
 from . import io
 from . import sss
 from . import crypto
-from .crypto import DecryptionError
+from . import erasure
+from . import plan
+from .crypto import DecryptionError, BlockCipher
 
 
 def _prepare_streams(streams):
@@ -21,6 +29,22 @@ def _prepare_streams(streams):
     return hxs
 
 
+def _prepare_blobs(streams):
+    "prepare ciphertext blobs from input streams"
+    blobs = []
+    for s in streams:
+        blob = io.Horcrux(s)
+        blob.init_blob_read()
+        blobs.append(blob)
+    return blobs
+
+
+def _split_blobs(files):
+    "separate ciphertext blobs from horcruxes in files"
+    blobs = [f for f in files if io.is_blob(f)]
+    return [f for f in files if f not in blobs], blobs
+
+
 def _init_crypto(horcruxes):
     key = sss.combine_shares([h.share for h in horcruxes])
     if horcruxes[0].encrypted_filename:
@@ -31,7 +55,7 @@ def _init_crypto(horcruxes):
         )
         for h in horcruxes:
             h.encrypted_filename = fn
-    c_stream = crypto.Stream()
+    c_stream = crypto.MODES[horcruxes[0].cipher_mode]()
     c_stream.init_decrypt(horcruxes[0].crypto_header, key)
     del key
     return c_stream
@@ -54,32 +78,87 @@ def from_files(
     outfile=None,
     overwrite=False,
     progress=False,
+    fd_budget=plan.FD_BUDGET,
+    stats=None,
+    problems=None,
+    memory_limit=None,
 ) -> Path:
-    "combine horcruxes from filelike paths, return the new Path object"
+    """
+    combine horcruxes from filelike paths, return the new Path object.
+
+    Every file's headers are read, but blocks are only read from a minimal covering
+    subset of them, with at most fd_budget files open at once (see plan.plan_reads). If
+    stats is a dict it is filled with the bytes of block data read from each file.
+
+    A block that fails to read or decrypt is read again from another horcrux holding a
+    copy of it. If problems is a dict it is filled with what was wrong with each corrupt
+    or truncated file that was worked around (or that the combine failed on).
+
+    Blocks are read ahead of decryption into at most memory_limit bytes (default: up to
+    plan.PREFETCH_BYTES per file), see plan.Prefetcher.
+
+    Key-only horcruxes are combined with their ciphertext blob, include it in files.
+    """
     outdir = Path(outdir)
 
-    with _mass_open(files) as streams:
-        horcruxes = _prepare_streams(streams)
+    read_plan = plan.plan_reads(files)
+    try:
+        return _combine_planned(
+            read_plan,
+            outdir,
+            outfile_name,
+            outfile,
+            overwrite,
+            progress,
+            fd_budget,
+            memory_limit,
+        )
+    finally:
+        if stats is not None:
+            stats.update(read_plan.bytes_read)
+        if problems is not None:
+            problems.update(read_plan.problems)
+
+
+def _combine_planned(
+    read_plan,
+    outdir,
+    outfile_name,
+    outfile,
+    overwrite,
+    progress,
+    fd_budget,
+    memory_limit=None,
+):
+    horcruxes = read_plan.horcruxes
+    blocks = plan.block_reader(read_plan, fd_budget, memory_limit)
+    blocks = _decoded(blocks, horcruxes)
+    failover = _failover_plan(read_plan, horcruxes)
+    with contextlib.closing(blocks):
+        # blocks are read ahead while argon2 runs for the key
         crypto = _init_crypto(horcruxes)
         if outfile:
-            from_streams(horcruxes, outfile, crypto, progress=progress)
-            return outfile
-        if not horcruxes[0].encrypted_filename and not outfile_name:
-            # ugly, should force filename
-            outfile = outdir / f"combined_horcrux_stream_{horcruxes[0].share.id.hex()}"
-        elif outfile_name:
-            outfile = outdir / outfile_name
+            _combine_blocks(blocks, outfile, crypto, progress, read_plan=failover)
         else:
-            outfile = outdir / horcruxes[0].encrypted_filename
-        if outfile.exists() and not overwrite:
-            resp = "x"
-            while resp.lower()[0] not in "yn":
-                print(f"{outfile} already exists, overwrite? (Y/n): ", file=sys.stderr)
-                resp = input()
-            if resp.lower()[0] == "n":
-                return
-        with open(outfile, "wb") as outstream:
-            from_streams(horcruxes, outstream, crypto, progress=progress)
+            if not horcruxes[0].encrypted_filename and not outfile_name:
+                # ugly, should force filename
+                share_id = horcruxes[0].share.id.hex()
+                outfile = outdir / f"combined_horcrux_stream_{share_id}"
+            elif outfile_name:
+                outfile = outdir / outfile_name
+            else:
+                outfile = outdir / horcruxes[0].encrypted_filename
+            if outfile.exists() and not overwrite:
+                resp = "x"
+                while resp.lower()[0] not in "yn":
+                    print(
+                        f"{outfile} already exists, overwrite? (Y/n): ", file=sys.stderr
+                    )
+                    resp = input()
+                if resp.lower()[0] == "n":
+                    return
+            with open(outfile, "wb") as outstream:
+                _combine_blocks(blocks, outstream, crypto, progress, read_plan=failover)
     return outfile
 
 
@@ -88,20 +167,55 @@ def from_streams(
     out_stream=None,
     crypto: crypto.Stream = None,
     progress=False,
+    workers=None,
+    blobs: Sequence[io.IOBase] = (),
+    problems=None,
+    memory_limit=None,
 ) -> Union[io.IOBase, bytes]:
-    "Combine horcruxes from given streams. Return the out_stream or bytes if not assigned."
+    """
+    Combine horcruxes from given streams. Return the out_stream or bytes if not assigned.
+
+    Block mode horcruxes are decrypted by `workers` threads (default: number of cpus).
+    Key-only horcruxes read their blocks from the ciphertext blob streams in `blobs`.
+    Indexed horcruxes fail over to other copies of blocks as from_files does, filling
+    problems (keyed by horcrux id), and are read ahead into at most memory_limit bytes.
+    """
     if not out_stream:
         output = io.BytesIO()
     else:
         output = out_stream
     if crypto is None:  # if crypto is provided, assume streams have been primed
         hxs = _prepare_streams(streams)
-        crypto = _init_crypto(hxs)
+        blobs = _prepare_blobs(blobs)
     else:
         hxs = streams
-    current_id = 0
-    live = set(hxs)
-    dead = set()
+    blocks, read_plan = _ordered_blocks(hxs, blobs, memory_limit)
+    try:
+        with contextlib.closing(blocks):
+            if crypto is None:
+                crypto = _init_crypto(hxs)  # indexed horcruxes are read ahead meanwhile
+            _combine_blocks(
+                blocks,
+                output,
+                crypto,
+                progress,
+                workers,
+                _failover_plan(read_plan, hxs),
+            )
+    finally:
+        if problems is not None and read_plan is not None:
+            problems.update(read_plan.problems)
+    if not out_stream:
+        return output.getvalue()
+
+
+def _combine_blocks(
+    blocks, output, crypto, progress=False, workers=None, read_plan=None
+):
+    """
+    decrypt ordered (horcrux, block id, ciphertext) blocks into output, retrying blocks
+    that fail to decrypt with other copies from read_plan, if given
+    """
     with Progress(
         "[progress.description]{task.description}",
         BarColumn(),
@@ -109,24 +223,407 @@ def from_streams(
         transient=True,
     ) as pb:
         task = pb.add_task("Combining...", start=False, visible=progress)
+        for pt in _decrypt(blocks, crypto, workers, read_plan):
+            pb.update(task, advance=len(pt))
+            output.write(pt)
 
-        while live:
-            for h in live:
-                if h.next_block_id == current_id:
-                    try:
-                        pt = crypto.decrypt(h.read_block()[1])
-                    except DecryptionError as e:
-                        e.horcrux_id = h.hrcx_id  # add some helpful info
-                        raise
-                    pb.update(task, advance=len(pt))
-                    output.write(pt)
-                    current_id += 1
-                    break
-                elif h.next_block_id is None:
-                    dead.add(h)
-                    continue
-                elif h.next_block_id < current_id:
-                    h.skip_block()
-            live -= dead
-    if not out_stream:
-        return output.getvalue()
+
+def iter_plaintext(
+    streams: Sequence[io.IOBase],
+    chunk_size: int = None,
+    crypto: crypto.Stream = None,
+    workers=None,
+    blobs: Sequence[io.IOBase] = (),
+    memory_limit=None,
+) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Combine horcruxes from given streams, yielding the plaintext as blocks are
+    decrypted instead of collecting it, so only a few blocks are held at once.
+
+    Each decrypted block is yielded as it is, or with chunk_size, as chunk_size
+    memoryviews (the last may be shorter) of a single reused buffer. Those are only
+    valid until the next chunk is requested, copy them to keep them. Other arguments
+    are as for from_streams: with a small memory_limit only about a block per horcrux
+    is read ahead, so memory stays a few blocks whatever the size of the plaintext.
+    """
+    if crypto is None:  # if crypto is provided, assume streams have been primed
+        hxs = _prepare_streams(streams)
+        blobs = _prepare_blobs(blobs)
+    else:
+        hxs = streams
+    blocks, read_plan = _ordered_blocks(hxs, blobs, memory_limit)
+    with contextlib.closing(blocks):
+        if crypto is None:
+            crypto = _init_crypto(hxs)
+        plaintexts = _decrypt(blocks, crypto, workers, _failover_plan(read_plan, hxs))
+        if chunk_size is None:
+            yield from plaintexts
+        else:
+            yield from _rechunked(plaintexts, chunk_size)
+
+
+def _rechunked(plaintexts, chunk_size):
+    "yield plaintexts as memoryviews of chunk_size bytes, from one reused buffer"
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be at least 1 byte.")
+    chunk = memoryview(bytearray(chunk_size))
+    filled = 0
+    for pt in plaintexts:
+        pt = memoryview(pt)
+        while pt:
+            take = min(len(pt), chunk_size - filled)
+            chunk[filled : filled + take] = pt[:take]
+            pt = pt[take:]
+            filled += take
+            if filled == chunk_size:
+                yield chunk
+                filled = 0
+    if filled:
+        yield chunk[:filled]
+
+
+class PlaintextReader(RawIOBase):
+    """
+    A read only, unseekable file of the plaintext combined from horcrux streams,
+    decrypted block by block as it's read (see iter_plaintext). Arguments are as for
+    from_streams. e.g.
+
+        with PlaintextReader(streams) as f, tarfile.open(fileobj=f, mode="r|") as tar:
+            tar.extractall()
+
+    Wrap it in io.BufferedReader for small reads.
+    """
+
+    def __init__(
+        self,
+        streams: Sequence[io.IOBase],
+        crypto: crypto.Stream = None,
+        workers=None,
+        blobs: Sequence[io.IOBase] = (),
+        memory_limit=None,
+    ):
+        super().__init__()
+        self._blocks = iter_plaintext(
+            streams,
+            crypto=crypto,
+            workers=workers,
+            blobs=blobs,
+            memory_limit=memory_limit,
+        )
+        self._block = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._block:
+            block = next(self._blocks, None)
+            if block is None:
+                return 0
+            self._block = memoryview(block)
+        size = min(len(b), len(self._block))
+        b[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+    def close(self):
+        "stop reading the horcruxes, any readers are shut down"
+        if not self.closed:
+            self._blocks.close()
+            self._block = memoryview(b"")
+        super().close()
+
+
+def read_range(
+    files: Sequence[io.FileLike], offset: int, length: int = None, workers=None
+) -> bytes:
+    """
+    Return `length` bytes of the combined plaintext starting at `offset`, or everything
+    from `offset` on if length is None.
+
+    Block mode horcruxes are random access: only the blocks covering the range are read
+    and decrypted. Stream mode and erasure coded horcruxes have to be decrypted from the
+    start.
+    """
+    files, blob_files = _split_blobs(files)
+    with _mass_open(files) as streams, _mass_open(blob_files) as blobs:
+        return range_from_streams(streams, offset, length, workers=workers, blobs=blobs)
+
+
+def range_from_streams(
+    streams: Sequence[io.Horcrux],
+    offset: int,
+    length: int = None,
+    crypto: crypto.Stream = None,
+    workers=None,
+    blobs: Sequence[io.IOBase] = (),
+) -> bytes:
+    "read_range for seekable horcrux streams, and ciphertext blobs of key-only ones"
+    if offset < 0 or (length is not None and length < 0):
+        raise ValueError("Range offset and length must not be negative.")
+    if crypto is None:  # if crypto is provided, assume streams have been primed
+        hxs = _prepare_streams(streams)
+        blobs = _prepare_blobs(blobs)
+        crypto = _init_crypto(hxs)
+    else:
+        hxs = streams
+    if length == 0:
+        return b""
+    if isinstance(crypto, BlockCipher) and hxs[0].distribution != "erasure":
+        _check_blobs(hxs, blobs)
+        return _read_block_range([*hxs, *blobs], crypto, offset, length, workers)
+    return _read_stream_range(hxs, crypto, offset, length, workers, blobs)
+
+
+def _locate_blocks(hxs):
+    """
+    return [(horcrux, block id, data offset, data length)] for every block in order,
+    from the index footers, or the frame headers for horcruxes without one.
+    """
+    located = {}
+    for h in hxs:
+        for block_id, pos, data_len in h.locate_blocks():
+            located.setdefault(block_id, (h, block_id, pos, data_len))
+    blocks = [located[i] for i in sorted(located)]
+    for expected, (h, block_id, _, _) in enumerate(blocks):
+        if block_id != expected:
+            raise DecryptionError(f"Block {expected} is missing from every horcrux.")
+    return blocks
+
+
+def _read_block_range(hxs, crypto, offset, length, workers):
+    "decrypt only the block mode blocks covering [offset, offset + length)"
+    blocks = _locate_blocks(hxs)
+    if not blocks:
+        raise DecryptionError("Horcrux stream is truncated, final block not found.")
+    end = None if length is None else offset + length
+    covering = []
+    skip = 0
+    start = 0  # plaintext offset of the current block
+    for block in blocks:
+        size = block[3] - BlockCipher.ABYTES
+        if start + size > offset and (end is None or start < end):
+            if not covering:
+                skip = offset - start
+            covering.append(block)
+        start += size
+    if end is None or end >= start:
+        # the range runs to the end, so the (empty) final block must be there too
+        if covering[-1:] != blocks[-1:]:
+            covering.append(blocks[-1])
+
+    def open_block(block, ciphertext):
+        h, block_id, _, _ = block
+        try:
+            pt, is_final = crypto.decrypt(block_id, ciphertext)
+            if is_final != (block is blocks[-1]):
+                raise DecryptionError(
+                    "Found data after the final block."
+                    if is_final
+                    else "Horcrux stream is truncated, final block not found."
+                )
+        except DecryptionError as e:
+            e.horcrux_id = h.hrcx_id
+            raise
+        return pt
+
+    # read here, horcrux readers aren't thread safe. Only decryption is spread out
+    sealed = [h.read_at(pos, data_len) for h, _, pos, data_len in covering]
+    with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        data = b"".join(pool.map(open_block, covering, sealed))
+    return data[skip:] if length is None else data[skip : skip + length]
+
+
+def _read_stream_range(hxs, crypto, offset, length, workers=None, blobs=()):
+    "sequential fallback, decrypt from the first block and keep only the range"
+    out = []
+    start = 0
+    blocks, read_plan = _ordered_blocks(hxs, blobs)
+    with contextlib.closing(blocks):
+        for pt in _decrypt(blocks, crypto, workers, _failover_plan(read_plan, hxs)):
+            if start + len(pt) > offset:
+                out.append(pt[max(offset - start, 0) :])
+            start += len(pt)
+            if length is not None and start >= offset + length:
+                break
+    data = b"".join(out)
+    return data if length is None else data[:length]
+
+
+def _ordered_blocks(hxs, blobs=(), memory_limit=None):
+    """
+    return an iterable of (horcrux, block id, ciphertext) for every block in order, and
+    the plan.ReadPlan it follows (None if there isn't one).
+
+    Indexed horcruxes are read ahead (into at most memory_limit bytes) by a
+    plan.Prefetcher that's already been started, others are merged from a walk over every input. Erasure coded blocks are rebuilt
+    from their fragments, key-only horcruxes' blocks come from their blobs.
+    """
+    read_plan = plan.plan_streams([*hxs, *blobs])
+    if read_plan is not None:
+        prefetcher = plan.Prefetcher(read_plan, memory_limit=memory_limit)
+        return _decoded(prefetcher.start(), hxs), read_plan
+    if hxs[0].distribution == "erasure":
+        return _decoded(_walked_fragments(hxs), hxs), None
+    _check_blobs(hxs, blobs)
+    return _merged_blocks([*hxs, *blobs]), None
+
+
+def _check_blobs(hxs, blobs):
+    if hxs[0].distribution == "key-only" and not blobs:
+        raise DecryptionError("Key-only horcruxes need their ciphertext blob.")
+
+
+def _failover_plan(read_plan, hxs):
+    """
+    read_plan, to retry blocks that fail to decrypt with other copies of them. None for
+    erasure coded horcruxes: a fragment that can't be read is read from a spare
+    horcrux, but retrying a block that fails to decrypt with other k-subsets of its
+    fragments isn't supported.
+    """
+    if read_plan is None or hxs[0].distribution == "erasure":
+        return None
+    return read_plan
+
+
+def _decoded(blocks, hxs):
+    "blocks, or the blocks rebuilt from them if they are erasure coded fragments"
+    if hxs[0].distribution == "erasure":
+        return _FragmentDecoder(blocks, hxs[0].share.threshold)
+    return blocks
+
+
+class _FragmentDecoder:
+    """
+    Iterate (horcrux, block id, ciphertext) for every block in order, rebuilt from
+    (horcrux, block id, fragment) for k fragments of each block.
+
+    A class rather than a generator so closing it closes the fragment reader, even if
+    iteration never started.
+    """
+
+    def __init__(self, fragments, k):
+        self.fragments = fragments
+        self.k = k
+
+    def __iter__(self):
+        for block_id, group in itertools.groupby(self.fragments, key=lambda f: f[1]):
+            hs, _, fragments = zip(*group)
+            try:
+                block = erasure.decode(fragments, [h.hrcx_id for h in hs], self.k)
+            except ValueError as e:
+                raise DecryptionError(f"Block {block_id} can't be rebuilt: {e}") from e
+            yield hs[0], block_id, block
+
+    def close(self):
+        self.fragments.close()
+
+
+def _walked_fragments(hxs):
+    "yield (horcrux, block id, fragment) for every block, walking k inputs in step"
+    k = hxs[0].share.threshold
+    if len(hxs) < k:
+        raise DecryptionError(f"Only {len(hxs)} fragments per block, {k} are needed.")
+    walking = hxs[:k]
+    for block_id in itertools.count():
+        next_ids = {h.next_block_id for h in walking}
+        if next_ids == {None}:
+            return
+        if next_ids != {block_id}:
+            raise DecryptionError(f"Block {block_id} is missing from a horcrux.")
+        for h in walking:
+            yield h, block_id, h.read_block()[1]
+
+
+def _merged_blocks(hxs):
+    "yield (horcrux, block id, ciphertext) for every block in order, walking each input"
+    # merge the inputs on their next block id, skipping blocks already yielded
+    heap = [(h.next_block_id, i, h) for i, h in enumerate(hxs)]
+    heap = [entry for entry in heap if entry[0] is not None]
+    heapq.heapify(heap)
+    current_id = 0
+    while heap:
+        block_id, i, h = heapq.heappop(heap)
+        if block_id == current_id:
+            yield h, current_id, h.read_block()[1]
+            current_id += 1
+        elif block_id < current_id:
+            h.skip_block()
+        else:
+            raise DecryptionError(f"Block {current_id} is missing from every horcrux.")
+        if h.next_block_id is not None:
+            heapq.heappush(heap, (h.next_block_id, i, h))
+
+
+def _failover(decrypt, h, block_id, error, read_plan):
+    """
+    retry decrypt(block id, ciphertext) for a block that failed to decrypt from horcrux
+    h with error, using the copies of it in other horcruxes of read_plan. Returns the
+    horcrux the block came from and the result. The failures are noted in
+    read_plan.problems. Raises error if no copy decrypts.
+    """
+    error.horcrux_id = h.hrcx_id  # add some helpful info
+    tried = [h]
+    while read_plan is not None:
+        read_plan.note(h, f"Block {block_id} failed to decrypt.")
+        try:
+            h, ciphertext = read_plan.reread(block_id, tried, error)
+        except DecryptionError:
+            break
+        tried.append(h)
+        try:
+            return h, decrypt(block_id, ciphertext)
+        except DecryptionError:
+            continue
+    raise error
+
+
+def _decrypt(blocks, crypto, workers=None, read_plan=None):
+    "plaintexts of blocks in order, block mode blocks are decrypted by workers threads"
+    if isinstance(crypto, BlockCipher):
+        workers = workers or os.cpu_count() or 1
+        return _decrypt_parallel(blocks, crypto, workers, read_plan)
+    return _decrypt_sequential(blocks, crypto, read_plan)
+
+
+def _decrypt_sequential(blocks, crypto, read_plan=None):
+    def decrypt(_, ciphertext):
+        return crypto.decrypt(ciphertext)  # a failure leaves the stream state as it was
+
+    for h, block_id, ciphertext in blocks:
+        try:
+            yield crypto.decrypt(ciphertext)
+        except DecryptionError as e:
+            yield _failover(decrypt, h, block_id, e, read_plan)[1]
+
+
+def _decrypt_parallel(blocks, crypto, workers, read_plan=None):
+    "decrypt block mode ciphertexts in a thread pool, yielding plaintexts in order"
+    pending = deque()
+    final = False
+
+    def finish_oldest():
+        nonlocal final
+        h, block_id, opened = pending.popleft()
+        try:
+            pt, is_final = opened.result()
+        except DecryptionError as e:
+            # blames h itself if it fails, otherwise h is the horcrux that had a copy
+            h, (pt, is_final) = _failover(crypto.decrypt, h, block_id, e, read_plan)
+        if final:
+            error = DecryptionError("Found data after the final block.")
+            error.horcrux_id = h.hrcx_id
+            raise error
+        final = is_final
+        return pt
+
+    with ThreadPoolExecutor(workers) as pool:
+        for h, block_id, ciphertext in blocks:
+            opened = pool.submit(crypto.decrypt, block_id, ciphertext)
+            pending.append((h, block_id, opened))
+            if len(pending) > workers * 2:
+                yield finish_oldest()
+        while pending:
+            yield finish_oldest()
+    if not final:
+        raise DecryptionError("Horcrux stream is truncated, final block not found.")
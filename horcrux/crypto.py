@@ -1,5 +1,7 @@
 from nacl.bindings import crypto_secretstream as lib
+from nacl.bindings import crypto_aead as aead
 from nacl.secret import SecretBox
+from nacl.utils import random
 
 
 class DecryptionError(Exception):
@@ -49,13 +51,86 @@ class Stream:
         lib.crypto_secretstream_xchacha20poly1305_init_pull(self._state, header, key)
 
     def decrypt(self, ciphertext):
-        "decrypt cipertext and return the plaintext"
+        """
+        decrypt cipertext and return the plaintext. A failed decrypt leaves the state
+        as it was, so the block can be retried with another copy of it.
+        """
+        # libsodium only advances the state once a block authenticates, but snapshot
+        # it anyway, retrying from an advanced state would fail every later block
+        snapshot = bytes(self._state.statebuf)
         try:
             pt, lt = lib.crypto_secretstream_xchacha20poly1305_pull(
                 self._state,
                 ciphertext,
             )
         except lib.exc.RuntimeError as e:
+            self._state.statebuf[0 : len(snapshot)] = snapshot
             raise DecryptionError("Error while decrypting ciphertext.") from e
         self.last_tag = self.TAGS[lt]
         return pt
+
+
+class BlockCipher:
+    """
+    xchacha20poly1305 AEAD with every block sealed independently, so blocks can be
+    encrypted and decrypted in any order, or in parallel.
+
+    Each block's nonce is a random per-stream prefix (the header) followed by the block
+    id. The block id and a final-block flag are bound as associated data, and the flag
+    is prepended to the ciphertext so reordered, renumbered or re-flagged blocks all
+    fail to authenticate. Writers must end the stream with a final block so readers can
+    detect truncation.
+    """
+
+    # the nonce is this prefix followed by the 8 byte block id
+    PREFIX_BYTES = aead.crypto_aead_xchacha20poly1305_ietf_NPUBBYTES - 8
+    ABYTES = aead.crypto_aead_xchacha20poly1305_ietf_ABYTES + 1  # tag + final flag
+
+    def __init__(self):
+        self._key = None
+        self._prefix = None
+
+    def init_encrypt(self, key):
+        "Initilize encrypt state and return the stream header."
+        self._key = key
+        self._prefix = random(self.PREFIX_BYTES)
+        return self._prefix
+
+    def init_decrypt(self, header, key):
+        "Initilize decrypt state with a header and a key"
+        if len(header) != self.PREFIX_BYTES:
+            raise DecryptionError("Invalid block cipher header.")
+        self._key = key
+        self._prefix = header
+
+    def _nonce_and_ad(self, block_id, final):
+        bid = block_id.to_bytes(8, "big")
+        flag = b"\x01" if final else b"\x00"
+        return self._prefix + bid, bid + flag, flag
+
+    def encrypt(self, block_id, plaintext, final=False):
+        "Return the sealed block. Only the final block may be empty."
+        if not plaintext and not final:
+            raise ValueError("Message must be at least 1 byte long.")
+        nonce, ad, flag = self._nonce_and_ad(block_id, final)
+        return flag + aead.crypto_aead_xchacha20poly1305_ietf_encrypt(
+            bytes(plaintext), ad, nonce, self._key
+        )
+
+    def decrypt(self, block_id, ciphertext):
+        "Return (plaintext, final) for a sealed block"
+        if len(ciphertext) < self.ABYTES or ciphertext[0] > 1:
+            raise DecryptionError("Error while decrypting ciphertext.")
+        final = ciphertext[0] == 1
+        nonce, ad, _ = self._nonce_and_ad(block_id, final)
+        try:
+            pt = aead.crypto_aead_xchacha20poly1305_ietf_decrypt(
+                bytes(ciphertext[1:]), ad, nonce, self._key
+            )
+        except aead.exc.CryptoError as e:
+            raise DecryptionError("Error while decrypting ciphertext.") from e
+        return pt, final
+
+
+# cipher for each StreamHeader mode
+MODES = {"stream": Stream, "block": BlockCipher}
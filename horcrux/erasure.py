@@ -0,0 +1,52 @@
+"""
+Systematic Reed-Solomon erasure coding over GF(2^8).
+
+A stripe is cut into k data fragments, which are the values of a degree < k polynomial
+at x = 0..k-1. Parity fragments are its values at x = k..n-1, so any k of the n
+fragments (with their x) pin the polynomial down and rebuild the stripe. Every byte
+position is its own polynomial, so the lagrange scalars are shared across the whole
+fragment and the byte-wise work is done by gf256.combine.
+"""
+from functools import lru_cache
+from typing import List, Sequence
+
+from . import gf256
+
+MAX_FRAGMENTS = 256  # one per element of GF(2^8)
+LENGTH_BYTES = 4  # stripes are prefixed with their length so padding can be dropped
+
+
+def encode(stripe: bytes, k: int, n: int) -> List[bytes]:
+    "return n fragments of stripe, any k of which can rebuild it"
+    if not 0 < k <= n <= MAX_FRAGMENTS:
+        raise ValueError(f"Need 0 < k <= n <= {MAX_FRAGMENTS}, got k={k}, n={n}.")
+    framed = len(stripe).to_bytes(LENGTH_BYTES, "big") + bytes(stripe)
+    size = -(-len(framed) // k)  # ceiling division
+    framed += bytes(size * k - len(framed))
+    data = [framed[i * size : (i + 1) * size] for i in range(k)]
+    if n == k:
+        return data
+    return data + gf256.combine(_scalars(tuple(range(k)), tuple(range(k, n))), data)
+
+
+def decode(fragments: Sequence[bytes], xs: Sequence[int], k: int) -> bytes:
+    "rebuild a stripe from k fragments and their x (the index they were encoded at)"
+    if len(fragments) < k:
+        raise ValueError(f"Need {k} fragments to decode, got {len(fragments)}.")
+    fragments, xs = list(fragments[:k]), tuple(xs[:k])
+    if len({len(f) for f in fragments}) != 1:
+        raise ValueError("Fragments are different lengths.")
+    missing = tuple(x for x in range(k) if x not in xs)
+    data = dict(zip(xs, fragments))
+    if missing:
+        data.update(zip(missing, gf256.combine(_scalars(xs, missing), fragments)))
+    framed = b"".join(data[x] for x in range(k))
+    length = int.from_bytes(framed[:LENGTH_BYTES], "big")
+    if length > len(framed) - LENGTH_BYTES:
+        raise ValueError("Fragments don't decode to a valid stripe.")
+    return framed[LENGTH_BYTES : LENGTH_BYTES + length]
+
+
+@lru_cache(maxsize=64)
+def _scalars(xs, targets):
+    return gf256.lagrange_scalars(xs, targets)
@@ -0,0 +1,115 @@
+"""
+GF(2^8) arithmetic using log/antilog tables.
+
+Uses the AES/SLIP-0039 reducing polynomial x^8 + x^4 + x^3 + x + 1 with generator 3.
+Addition and subtraction are both XOR. Byte strings are treated as vectors of field
+elements, so one set of larange scalars can be applied to every byte of a secret at
+once. NumPy is used for the byte-wise work when it's installed.
+"""
+from functools import lru_cache
+from typing import List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+POLYNOMIAL = 0x11B
+
+EXP = [0] * 510  # doubled so EXP[LOG[a] + LOG[b]] never needs a modulus
+LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    EXP[_i] = _x
+    LOG[_x] = _i
+    _x ^= _x << 1  # multiply by the generator, 3
+    if _x & 0x100:
+        _x ^= POLYNOMIAL
+for _i in range(255, 510):
+    EXP[_i] = EXP[_i - 255]
+del _x, _i
+
+if np is not None:
+    _EXP = np.array(EXP, dtype=np.uint8)
+    _LOG = np.array(LOG, dtype=np.uint16)
+    # _MUL[a, b] == mul(a, b), 64 KiB
+    _MUL = _EXP[_LOG[:, None] + _LOG[None, :]]
+    _MUL[0, :] = _MUL[:, 0] = 0
+
+
+def mul(a: int, b: int) -> int:
+    if not a or not b:
+        return 0
+    return EXP[LOG[a] + LOG[b]]
+
+
+def div(a: int, b: int) -> int:
+    if not b:
+        raise ZeroDivisionError("division by zero in GF(256)")
+    if not a:
+        return 0
+    return EXP[LOG[a] - LOG[b] + 255]
+
+
+def lagrange_scalars(xs: Sequence[int], targets: Sequence[int]) -> List[List[int]]:
+    """
+    return, for each target, the larange scalars l_i(target) over xs.
+
+    Barycentric weights are computed once for xs, so each target costs O(len(xs)).
+    """
+    assert len(xs) == len(set(xs)), "Points must be destinct."
+    weights = []
+    for i, xi in enumerate(xs):
+        den = 1
+        for j, xj in enumerate(xs):
+            if j != i:
+                den = mul(den, xi ^ xj)
+        weights.append(div(1, den))
+    result = []
+    for t in targets:
+        diffs = [t ^ x for x in xs]
+        if 0 in diffs:  # target is one of the known points
+            result.append([int(d == 0) for d in diffs])
+            continue
+        big_l = 1
+        for d in diffs:
+            big_l = mul(big_l, d)
+        result.append([mul(big_l, div(w, d)) for w, d in zip(weights, diffs)])
+    return result
+
+
+@lru_cache(maxsize=256)
+def _mul_table(c):
+    "translation table multiplying every byte by c"
+    return bytes(mul(c, v) for v in range(256))
+
+
+def combine(
+    scalar_rows: Sequence[Sequence[int]], vectors: Sequence[bytes]
+) -> List[bytes]:
+    """
+    return sum(scalars[i] * vectors[i]) for each row of scalars, byte-wise.
+
+    All vectors must be the same length.
+    """
+    if np is not None:
+        return _combine_np(scalar_rows, vectors)
+    length = len(vectors[0])
+    result = []
+    for scalars in scalar_rows:
+        acc = 0
+        for c, v in zip(scalars, vectors):
+            if c:
+                acc ^= int.from_bytes(bytes(v).translate(_mul_table(c)), "big")
+        result.append(acc.to_bytes(length, "big"))
+    return result
+
+
+def _combine_np(scalar_rows, vectors):
+    scalars = np.array(scalar_rows, dtype=np.uint8).reshape(-1, len(vectors))
+    result = np.zeros((len(scalars), len(vectors[0])), dtype=np.uint8)
+    # one vector at a time, so memory stays at a couple of (targets, length) arrays
+    for column, vector in zip(scalars.T, vectors):
+        vec = np.frombuffer(vector, dtype=np.uint8)
+        result ^= _MUL[column[:, None], vec[None, :]]
+    return [row.tobytes() for row in result]
@@ -2,9 +2,10 @@
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: hrcx.proto
 """Generated protocol buffer code."""
+
+from google.protobuf.internal import builder as _builder
 from google.protobuf import descriptor as _descriptor
-from google.protobuf import message as _message
-from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pool as _descriptor_pool
 from google.protobuf import symbol_database as _symbol_database
 
 # @@protoc_insertion_point(imports)
@@ -12,358 +13,37 @@ from google.protobuf import symbol_database as _symbol_database
 _sym_db = _symbol_database.Default()
 
 
-DESCRIPTOR = _descriptor.FileDescriptor(
-    name="hrcx.proto",
-    package="",
-    syntax="proto3",
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-    serialized_pb=b'\n\nhrcx.proto"n\n\x0bShareHeader\x12\n\n\x02id\x18\x01 \x01(\x0c\x12\x11\n\tthreshold\x18\x02 \x01(\x05\x12!\n\x05point\x18\x03 \x01(\x0b\x32\x12.ShareHeader.Point\x1a\x1d\n\x05Point\x12\t\n\x01X\x18\x01 \x01(\x05\x12\t\n\x01Y\x18\x02 \x01(\x0c":\n\x0cStreamHeader\x12\x0e\n\x06header\x18\x01 \x01(\x0c\x12\x1a\n\x12\x65ncrypted_filename\x18\x03 \x01(\x0c"\x15\n\x07\x42lockID\x12\n\n\x02id\x18\x01 \x01(\x05"\x1b\n\x0bStreamBlock\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\x0c\x62\x06proto3',
-)
-
-
-_SHAREHEADER_POINT = _descriptor.Descriptor(
-    name="Point",
-    full_name="ShareHeader.Point",
-    filename=None,
-    file=DESCRIPTOR,
-    containing_type=None,
-    create_key=_descriptor._internal_create_key,
-    fields=[
-        _descriptor.FieldDescriptor(
-            name="X",
-            full_name="ShareHeader.Point.X",
-            index=0,
-            number=1,
-            type=5,
-            cpp_type=1,
-            label=1,
-            has_default_value=False,
-            default_value=0,
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-        _descriptor.FieldDescriptor(
-            name="Y",
-            full_name="ShareHeader.Point.Y",
-            index=1,
-            number=2,
-            type=12,
-            cpp_type=9,
-            label=1,
-            has_default_value=False,
-            default_value=b"",
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-    ],
-    extensions=[],
-    nested_types=[],
-    enum_types=[],
-    serialized_options=None,
-    is_extendable=False,
-    syntax="proto3",
-    extension_ranges=[],
-    oneofs=[],
-    serialized_start=95,
-    serialized_end=124,
-)
-
-_SHAREHEADER = _descriptor.Descriptor(
-    name="ShareHeader",
-    full_name="ShareHeader",
-    filename=None,
-    file=DESCRIPTOR,
-    containing_type=None,
-    create_key=_descriptor._internal_create_key,
-    fields=[
-        _descriptor.FieldDescriptor(
-            name="id",
-            full_name="ShareHeader.id",
-            index=0,
-            number=1,
-            type=12,
-            cpp_type=9,
-            label=1,
-            has_default_value=False,
-            default_value=b"",
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-        _descriptor.FieldDescriptor(
-            name="threshold",
-            full_name="ShareHeader.threshold",
-            index=1,
-            number=2,
-            type=5,
-            cpp_type=1,
-            label=1,
-            has_default_value=False,
-            default_value=0,
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-        _descriptor.FieldDescriptor(
-            name="point",
-            full_name="ShareHeader.point",
-            index=2,
-            number=3,
-            type=11,
-            cpp_type=10,
-            label=1,
-            has_default_value=False,
-            default_value=None,
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-    ],
-    extensions=[],
-    nested_types=[
-        _SHAREHEADER_POINT,
-    ],
-    enum_types=[],
-    serialized_options=None,
-    is_extendable=False,
-    syntax="proto3",
-    extension_ranges=[],
-    oneofs=[],
-    serialized_start=14,
-    serialized_end=124,
-)
-
-
-_STREAMHEADER = _descriptor.Descriptor(
-    name="StreamHeader",
-    full_name="StreamHeader",
-    filename=None,
-    file=DESCRIPTOR,
-    containing_type=None,
-    create_key=_descriptor._internal_create_key,
-    fields=[
-        _descriptor.FieldDescriptor(
-            name="header",
-            full_name="StreamHeader.header",
-            index=0,
-            number=1,
-            type=12,
-            cpp_type=9,
-            label=1,
-            has_default_value=False,
-            default_value=b"",
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-        _descriptor.FieldDescriptor(
-            name="encrypted_filename",
-            full_name="StreamHeader.encrypted_filename",
-            index=1,
-            number=3,
-            type=12,
-            cpp_type=9,
-            label=1,
-            has_default_value=False,
-            default_value=b"",
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-    ],
-    extensions=[],
-    nested_types=[],
-    enum_types=[],
-    serialized_options=None,
-    is_extendable=False,
-    syntax="proto3",
-    extension_ranges=[],
-    oneofs=[],
-    serialized_start=126,
-    serialized_end=184,
-)
-
-
-_BLOCKID = _descriptor.Descriptor(
-    name="BlockID",
-    full_name="BlockID",
-    filename=None,
-    file=DESCRIPTOR,
-    containing_type=None,
-    create_key=_descriptor._internal_create_key,
-    fields=[
-        _descriptor.FieldDescriptor(
-            name="id",
-            full_name="BlockID.id",
-            index=0,
-            number=1,
-            type=5,
-            cpp_type=1,
-            label=1,
-            has_default_value=False,
-            default_value=0,
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-    ],
-    extensions=[],
-    nested_types=[],
-    enum_types=[],
-    serialized_options=None,
-    is_extendable=False,
-    syntax="proto3",
-    extension_ranges=[],
-    oneofs=[],
-    serialized_start=186,
-    serialized_end=207,
-)
-
-
-_STREAMBLOCK = _descriptor.Descriptor(
-    name="StreamBlock",
-    full_name="StreamBlock",
-    filename=None,
-    file=DESCRIPTOR,
-    containing_type=None,
-    create_key=_descriptor._internal_create_key,
-    fields=[
-        _descriptor.FieldDescriptor(
-            name="data",
-            full_name="StreamBlock.data",
-            index=0,
-            number=2,
-            type=12,
-            cpp_type=9,
-            label=1,
-            has_default_value=False,
-            default_value=b"",
-            message_type=None,
-            enum_type=None,
-            containing_type=None,
-            is_extension=False,
-            extension_scope=None,
-            serialized_options=None,
-            file=DESCRIPTOR,
-            create_key=_descriptor._internal_create_key,
-        ),
-    ],
-    extensions=[],
-    nested_types=[],
-    enum_types=[],
-    serialized_options=None,
-    is_extendable=False,
-    syntax="proto3",
-    extension_ranges=[],
-    oneofs=[],
-    serialized_start=209,
-    serialized_end=236,
-)
-
-_SHAREHEADER_POINT.containing_type = _SHAREHEADER
-_SHAREHEADER.fields_by_name["point"].message_type = _SHAREHEADER_POINT
-DESCRIPTOR.message_types_by_name["ShareHeader"] = _SHAREHEADER
-DESCRIPTOR.message_types_by_name["StreamHeader"] = _STREAMHEADER
-DESCRIPTOR.message_types_by_name["BlockID"] = _BLOCKID
-DESCRIPTOR.message_types_by_name["StreamBlock"] = _STREAMBLOCK
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
-ShareHeader = _reflection.GeneratedProtocolMessageType(
-    "ShareHeader",
-    (_message.Message,),
-    {
-        "Point": _reflection.GeneratedProtocolMessageType(
-            "Point",
-            (_message.Message,),
-            {
-                "DESCRIPTOR": _SHAREHEADER_POINT,
-                "__module__": "hrcx_pb2"
-                # @@protoc_insertion_point(class_scope:ShareHeader.Point)
-            },
-        ),
-        "DESCRIPTOR": _SHAREHEADER,
-        "__module__": "hrcx_pb2"
-        # @@protoc_insertion_point(class_scope:ShareHeader)
-    },
-)
-_sym_db.RegisterMessage(ShareHeader)
-_sym_db.RegisterMessage(ShareHeader.Point)
-
-StreamHeader = _reflection.GeneratedProtocolMessageType(
-    "StreamHeader",
-    (_message.Message,),
-    {
-        "DESCRIPTOR": _STREAMHEADER,
-        "__module__": "hrcx_pb2"
-        # @@protoc_insertion_point(class_scope:StreamHeader)
-    },
-)
-_sym_db.RegisterMessage(StreamHeader)
-
-BlockID = _reflection.GeneratedProtocolMessageType(
-    "BlockID",
-    (_message.Message,),
-    {
-        "DESCRIPTOR": _BLOCKID,
-        "__module__": "hrcx_pb2"
-        # @@protoc_insertion_point(class_scope:BlockID)
-    },
-)
-_sym_db.RegisterMessage(BlockID)
-
-StreamBlock = _reflection.GeneratedProtocolMessageType(
-    "StreamBlock",
-    (_message.Message,),
-    {
-        "DESCRIPTOR": _STREAMBLOCK,
-        "__module__": "hrcx_pb2"
-        # @@protoc_insertion_point(class_scope:StreamBlock)
-    },
-)
-_sym_db.RegisterMessage(StreamBlock)
-
-
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(
+    b'\n\nhrcx.proto"\xcd\x03\n\x0bShareHeader\x12\n\n\x02id\x18\x01 \x01(\x0c\x12\x11\n\tthreshold\x18\x02 \x01(\x05\x12!\n\x05point\x18\x03 \x01(\x0b\x32\x12.ShareHeader.Point\x12\x32\n\x0e\x64igest_profile\x18\x04 \x01(\x0b\x32\x1a.ShareHeader.DigestProfile\x12!\n\x05\x66ield\x18\x05 \x01(\x0e\x32\x12.ShareHeader.Field\x12,\n\x0bindex_space\x18\x06 \x01(\x0e\x32\x17.ShareHeader.IndexSpace\x1a\x1d\n\x05Point\x12\t\n\x01X\x18\x01 \x01(\x03\x12\t\n\x01Y\x18\x02 \x01(\x0c\x1a\x94\x01\n\rDigestProfile\x12\x37\n\talgorithm\x18\x01 \x01(\x0e\x32$.ShareHeader.DigestProfile.Algorithm\x12\x10\n\x08opslimit\x18\x02 \x01(\x04\x12\x10\n\x08memlimit\x18\x03 \x01(\x04"&\n\tAlgorithm\x12\x0c\n\x08\x41RGON2ID\x10\x00\x12\x0b\n\x07\x41RGON2I\x10\x01"\x1d\n\x05\x46ield\x12\t\n\x05PRIME\x10\x00\x12\t\n\x05GF256\x10\x01""\n\nIndexSpace\x12\n\n\x06LEGACY\x10\x00\x12\x08\n\x04WIDE\x10\x01"\xfa\x01\n\x0cStreamHeader\x12\x0e\n\x06header\x18\x01 \x01(\x0c\x12\x1a\n\x12\x65ncrypted_filename\x18\x03 \x01(\x0c\x12-\n\x0b\x63ipher_mode\x18\x04 \x01(\x0e\x32\x18.StreamHeader.CipherMode\x12\x30\n\x0c\x64istribution\x18\x05 \x01(\x0e\x32\x1a.StreamHeader.Distribution"#\n\nCipherMode\x12\n\n\x06STREAM\x10\x00\x12\t\n\x05\x42LOCK\x10\x01"8\n\x0c\x44istribution\x12\r\n\tREPLICATE\x10\x00\x12\x0b\n\x07\x45RASURE\x10\x01\x12\x0c\n\x08KEY_ONLY\x10\x02"\x15\n\x07\x42lockID\x12\n\n\x02id\x18\x01 \x01(\x05"\x1b\n\x0bStreamBlock\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\x0c"\x8f\x01\n\nBlockIndex\x12\x0b\n\x03ids\x18\x01 \x03(\x05\x12\x0f\n\x07offsets\x18\x02 \x03(\x04\x12\x0f\n\x07lengths\x18\x03 \x03(\x04\x12\x15\n\rblock_lengths\x18\x04 \x03(\x04\x12\x15\n\rholder_counts\x18\x05 \x03(\r\x12\x0f\n\x07holders\x18\x06 \x03(\x03\x12\x13\n\x0b\x62lob_digest\x18\x07 \x01(\x0c\x62\x06proto3'
+)
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, "hrcx_pb2", globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+    DESCRIPTOR._options = None
+    _SHAREHEADER._serialized_start = 15
+    _SHAREHEADER._serialized_end = 476
+    _SHAREHEADER_POINT._serialized_start = 229
+    _SHAREHEADER_POINT._serialized_end = 258
+    _SHAREHEADER_DIGESTPROFILE._serialized_start = 261
+    _SHAREHEADER_DIGESTPROFILE._serialized_end = 409
+    _SHAREHEADER_DIGESTPROFILE_ALGORITHM._serialized_start = 371
+    _SHAREHEADER_DIGESTPROFILE_ALGORITHM._serialized_end = 409
+    _SHAREHEADER_FIELD._serialized_start = 411
+    _SHAREHEADER_FIELD._serialized_end = 440
+    _SHAREHEADER_INDEXSPACE._serialized_start = 442
+    _SHAREHEADER_INDEXSPACE._serialized_end = 476
+    _STREAMHEADER._serialized_start = 479
+    _STREAMHEADER._serialized_end = 729
+    _STREAMHEADER_CIPHERMODE._serialized_start = 636
+    _STREAMHEADER_CIPHERMODE._serialized_end = 671
+    _STREAMHEADER_DISTRIBUTION._serialized_start = 673
+    _STREAMHEADER_DISTRIBUTION._serialized_end = 729
+    _BLOCKID._serialized_start = 731
+    _BLOCKID._serialized_end = 752
+    _STREAMBLOCK._serialized_start = 754
+    _STREAMBLOCK._serialized_end = 781
+    _BLOCKINDEX._serialized_start = 784
+    _BLOCKINDEX._serialized_end = 927
 # @@protoc_insertion_point(module_scope)
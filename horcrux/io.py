@@ -1,17 +1,499 @@
 "io and stream handlers"
-from collections import deque
-from typing import Union, List
+
+import os
+import mmap
+import queue
+import stat
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+from typing import Union, List, Sequence
 from os import PathLike
 from pathlib import Path
 from io import BytesIO, IOBase
 
 from . import sss
-from .hrcx_pb2 import ShareHeader, StreamHeader, StreamBlock, BlockID
+from .hrcx_pb2 import ShareHeader, StreamHeader, StreamBlock, BlockID, BlockIndex
 from google.protobuf.internal.encoder import _VarintBytes
 from google.protobuf.internal.decoder import _DecodeVarint32
 
 FileLike = Union[str, bytes, PathLike]
 
+READ_BUFFER_SIZE = 1024 * 256  # 256 KiB
+WRITE_BUFFER_SIZE = 1024 * 1024  # 1 MiB
+READ_AHEAD_CHUNK = 1024 * 1024  # 1 MiB
+READ_AHEAD_DEPTH = 16  # chunks
+READ_AHEAD_CLOSE_WAIT = 1.0  # seconds close waits for a reader blocked on its stream
+WRITER_QUEUE_DEPTH = 64  # frames
+WRITER_QUEUE_BYTES = 1024 * 1024 * 32  # 32 MiB, or one frame if it's bigger
+COPY_CHUNK = 1024 * 1024  # 1 MiB, for copies without copy_file_range
+MAX_VARINT_LEN = 10
+IOV_MAX = getattr(os, "sysconf", lambda _: 1024)("SC_IOV_MAX")
+STREAM_BLOCK_DATA_TAG = b"\x12"  # StreamBlock.data: field 2, length delimited
+INDEX_BLOCK_ID = -1  # BlockID marking the end of the blocks, the index follows
+INDEX_MAGIC = b"HRCXIDX1"
+# index frame offset from the start of the horcrux, then the magic
+INDEX_TRAILER = struct.Struct(">Q8s")
+# first frame of a ciphertext blob, where the blocks of key-only horcruxes are kept
+BLOB_MAGIC = b"HRCXBLB1"
+BLOB_FRAME = _VarintBytes(len(BLOB_MAGIC)) + BLOB_MAGIC
+
+# blocks: [(block id, data offset, data length)] for the blocks in this horcrux
+# schedule: [(data length, (holder ids...))] for every block id in order
+# blob_digest: digest of the ciphertext blob, for key-only horcruxes and blobs
+Index = namedtuple("Index", "blocks schedule blob_digest", defaults=(None,))
+
+
+class FrameReader:
+    """
+    Buffered reader for varint delimited messages.
+
+    Regular files are memory mapped and each message is sliced straight out of the map.
+    Everything else (pipes, sockets, BytesIO) is read into a reusable bytearray window
+    with `readinto`, so framing never touches individual bytes in python.
+    """
+
+    def __init__(self, stream: IOBase, buffer_size: int = READ_BUFFER_SIZE):
+        self.stream = stream
+        self._map = _map_file(stream)
+        if self._map is not None:
+            self._pos = stream.tell()
+        else:
+            self._buff = bytearray(buffer_size)
+            self._view = memoryview(self._buff)
+            self._start = 0
+            self._end = 0
+
+    def read_message(self) -> bytes:
+        "return the next message, raises IndexError at the end of the stream"
+        return self._take(self._read_varint())
+
+    def skip_message(self) -> int:
+        "skip over the next message without copying it, seeking when possible"
+        msg_len = self._read_varint()
+        if self._map is not None:
+            self._pos += msg_len
+            return msg_len
+        buffered = self._end - self._start
+        if msg_len <= buffered:
+            self._start += msg_len
+            return msg_len
+        self._start = self._end = 0
+        remaining = msg_len - buffered
+        try:
+            self.stream.seek(remaining, 1)
+        except OSError:
+            while remaining:
+                got = self.stream.readinto(
+                    self._view[: min(remaining, len(self._buff))]
+                )
+                if not got:
+                    break
+                remaining -= got
+        return msg_len
+
+    def tell(self) -> int:
+        "absolute stream offset of the next unread byte"
+        if self._map is not None:
+            return self._pos
+        return self.stream.tell() - (self._end - self._start)
+
+    def close(self):
+        "release the memory map, if any. The stream is left open"
+        if self._map is not None:
+            self._map.close()
+
+    def seek(self, offset: int):
+        "move the reader to an absolute stream offset"
+        if self._map is not None:
+            self._pos = offset
+            return
+        self._start = self._end = 0
+        self.stream.seek(offset)
+
+    def size(self) -> int:
+        "total length of the underlying stream"
+        if self._map is not None:
+            return len(self._map)
+        pos = self.stream.tell()
+        end = self.stream.seek(0, os.SEEK_END)
+        self.stream.seek(pos)
+        return end
+
+    def read_at(self, offset: int, length: int) -> bytes:
+        "return length bytes from an absolute offset, leaving the reader there after"
+        if self._map is not None:
+            self._pos = offset + length
+            return self._map[offset : self._pos]
+        self._start = self._end = 0
+        self.stream.seek(offset)
+        return self.stream.read(length)
+
+    def _read_varint(self):
+        if self._map is not None:
+            msg_len, self._pos = _DecodeVarint32(self._map, self._pos)
+            return msg_len
+        if self._end - self._start < MAX_VARINT_LEN:
+            self._fill()
+        msg_len, used = _DecodeVarint32(self._view[self._start : self._end], 0)
+        self._start += used
+        return msg_len
+
+    def _take(self, msg_len):
+        if self._map is not None:
+            start = self._pos
+            self._pos += msg_len
+            return self._map[start : self._pos]
+        buffered = self._end - self._start
+        if msg_len <= buffered:
+            start = self._start
+            self._start += msg_len
+            return bytes(self._view[start : self._start])
+        if msg_len <= len(self._buff):
+            self._fill()
+            msg_len = min(msg_len, self._end - self._start)
+            start = self._start
+            self._start += msg_len
+            return bytes(self._view[start : self._start])
+        # message is larger than the window, read the remainder in one go
+        head = self._view[self._start : self._end]
+        self._start = self._end = 0
+        return b"".join((head, self.stream.read(msg_len - len(head))))
+
+    def _fill(self):
+        "shift unread bytes to the front of the window and top it up from the stream"
+        buffered = self._end - self._start
+        if self._start:
+            self._view[:buffered] = self._view[self._start : self._end]
+            self._start, self._end = 0, buffered
+        while self._end < len(self._buff):
+            got = self.stream.readinto(self._view[self._end :])
+            if not got:
+                break
+            self._end += got
+
+
+def _map_file(stream):
+    "memory map stream if it's a regular, non-empty file opened for reading"
+    try:
+        fd = stream.fileno()
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or not stream.readable():
+            return None
+        if st.st_size <= stream.tell():
+            return None
+        return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+
+class StageStats:
+    """
+    Where a pipeline stage's time went, for finding the bottleneck.
+
+    busy: seconds spent working. starved: seconds waiting for input. blocked: seconds
+    waiting for room in the next stage's queue. peak_depth: most items seen waiting in
+    the stage's input queue, `depth` is how many are waiting now.
+
+    A stage run by several threads updates them through `_worked` and `_queued`, which
+    take a lock.
+    """
+
+    def __init__(self, input_queue=None):
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self.items = 0
+        self.peak_depth = 0
+        self._queue = input_queue
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _queued(self):
+        "note the input queue depth after an item has been put on it"
+        depth = self.depth
+        with self._lock:
+            self.peak_depth = max(self.peak_depth, depth)
+
+    def _worked(self, seconds):
+        "note an item done in seconds of work"
+        with self._lock:
+            self.busy += seconds
+            self.items += 1
+
+    def __repr__(self):
+        return (
+            f"StageStats(busy={self.busy:.3f}s, starved={self.starved:.3f}s, "
+            f"blocked={self.blocked:.3f}s, items={self.items}, "
+            f"peak_depth={self.peak_depth})"
+        )
+
+
+class ReadAhead:
+    """
+    Read a stream ahead from a thread of its own, in chunk_size reads queued up to depth
+    chunks deep. Only `read` is supported.
+
+    consumer_stats: StageStats of the stage calling `read`, charged with the time it
+    waits for data.
+    """
+
+    def __init__(
+        self,
+        stream: IOBase,
+        chunk_size: int = READ_AHEAD_CHUNK,
+        depth: int = READ_AHEAD_DEPTH,
+        consumer_stats: StageStats = None,
+    ):
+        self.stream = stream
+        self.queue = queue.Queue(depth)
+        self.stats = StageStats(self.queue)
+        self.consumer_stats = consumer_stats
+        self._buff = bytearray()
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(chunk_size,), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, chunk_size):
+        try:
+            while True:
+                start = time.perf_counter()
+                data = self.stream.read(chunk_size)
+                read = time.perf_counter()
+                self.stats.busy += read - start
+                if not self._put(data):
+                    return
+                self.stats.blocked += time.perf_counter() - read
+                self.stats.items += 1
+                if not data:
+                    return
+        except BaseException as e:  # handed to the reading thread
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            self.stats._queued()
+            return True
+        return False
+
+    def read(self, size=-1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buff) < size):
+            start = time.perf_counter()
+            item = self.queue.get()
+            if self.consumer_stats is not None:
+                self.consumer_stats.starved += time.perf_counter() - start
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                break
+            self._buff += item
+        if size < 0:
+            size = len(self._buff)
+        data = bytes(self._buff[:size])
+        del self._buff[:size]
+        return data
+
+    def close(self):
+        """
+        stop the reader thread, the wrapped stream is left open. A thread still blocked
+        reading the stream (an idle pipe, stdin) after READ_AHEAD_CLOSE_WAIT is left to
+        exit when its read returns, it's a daemon.
+        """
+        self._stop.set()
+        self._thread.join(READ_AHEAD_CLOSE_WAIT)
+
+
+class FeedBuffer:
+    """
+    A stream fed by `feed` in one thread and read from another, holding at most
+    max_bytes of fed data (or one piece, if it's bigger) not yet read. Feeders block
+    while it's full. Only `read` is supported, like ReadAhead.
+
+    Fed bytes are kept as they are, a read that takes a whole piece returns it without
+    a copy. `finish` ends the input, `close` stops the reader side, waking feeders.
+
+    consumer_stats: StageStats of the stage calling `read`, charged with the time it
+    waits for data.
+    """
+
+    def __init__(self, max_bytes: int = READ_AHEAD_CHUNK * READ_AHEAD_DEPTH):
+        self.max_bytes = max_bytes
+        self.stats = StageStats()
+        self.consumer_stats = None
+        self._pieces = deque()
+        self._offset = 0  # bytes of the first piece already read
+        self._size = 0
+        self._finished = False
+        self._closed = False
+        self._changed = threading.Condition()
+
+    def feed(self, data) -> bool:
+        "add data, waiting for room. Returns False if the reader has been closed"
+        data = bytes(data)
+        if not data:
+            return not self._closed
+        start = time.perf_counter()
+        with self._changed:
+            if self._finished:
+                raise ValueError("Can't feed a finished buffer.")
+            while (
+                not self._closed
+                and self._size
+                and self._size + len(data) > self.max_bytes
+            ):
+                self._changed.wait()
+            if self._closed:
+                return False
+            self._pieces.append(data)
+            self._size += len(data)
+            self.stats.items += 1
+            self.stats.peak_depth = max(self.stats.peak_depth, len(self._pieces))
+            self._changed.notify_all()
+        self.stats.blocked += time.perf_counter() - start
+        return True
+
+    def finish(self):
+        "end of input, reads return what's left and then b''"
+        with self._changed:
+            self._finished = True
+            self._changed.notify_all()
+
+    def read(self, size=-1) -> bytes:
+        # take pieces as they arrive rather than waiting for size bytes to be buffered,
+        # which might be more than max_bytes
+        taken = []
+        remaining = size
+        waited = 0.0
+        with self._changed:
+            while True:
+                while self._pieces and remaining:
+                    taken.append(self._take(remaining))
+                    remaining -= len(taken[-1])
+                self._changed.notify_all()
+                if not remaining or self._finished and not self._pieces:
+                    break
+                start = time.perf_counter()
+                self._changed.wait()
+                waited += time.perf_counter() - start
+        if self.consumer_stats is not None:
+            self.consumer_stats.starved += waited
+        if len(taken) == 1 and isinstance(taken[0], bytes):
+            return taken[0]
+        return b"".join(taken)
+
+    def _take(self, size):
+        "up to size bytes (all of them if negative) of the first piece"
+        piece = self._pieces[0]
+        if size < 0 or size > len(piece) - self._offset:
+            size = len(piece) - self._offset
+        if size == len(piece):
+            taken = piece
+        else:
+            taken = memoryview(piece)[self._offset : self._offset + size]
+        self._offset += size
+        if self._offset == len(piece):
+            self._pieces.popleft()
+            self._offset = 0
+        self._size -= size
+        return taken
+
+    def close(self):
+        "stop reading, feeders get False from then on"
+        with self._changed:
+            self._closed = True
+            self._pieces.clear()
+            self._size = 0
+            self._changed.notify_all()
+
+
+_FLUSH = object()
+_STOP = object()
+
+
+class WriterThread:
+    """
+    Write a horcrux's frames from a thread of its own, behind a queue of at most depth
+    frames and max_bytes bytes. Producers block while the queue is full.
+
+    producer_stats: StageStats of the stage putting frames, charged with the time it
+    waits for room.
+    """
+
+    def __init__(
+        self,
+        horcrux,
+        depth=WRITER_QUEUE_DEPTH,
+        producer_stats=None,
+        max_bytes=WRITER_QUEUE_BYTES,
+    ):
+        self.horcrux = horcrux
+        self.queue = queue.Queue(depth)
+        self.stats = StageStats(self.queue)
+        self.producer_stats = producer_stats
+        self.max_bytes = max_bytes
+        self.error = None
+        self._queued_bytes = 0
+        self._room = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        size = 0 if item is _FLUSH or item is _STOP else sum(len(b) for b in item)
+        start = time.perf_counter()
+        with self._room:
+            while self._queued_bytes and self._queued_bytes + size > self.max_bytes:
+                self._room.wait()
+            self._queued_bytes += size
+        self.queue.put((item, size))
+        if self.producer_stats is not None:
+            self.producer_stats.blocked += time.perf_counter() - start
+        self.stats._queued()
+
+    def _run(self):
+        while True:
+            start = time.perf_counter()
+            item, size = self.queue.get()
+            got = time.perf_counter()
+            self.stats.starved += got - start
+            if item is _STOP:
+                return
+            if self.error is None:  # otherwise keep draining so producers never block
+                try:
+                    if item is _FLUSH:
+                        self.horcrux._flush_buffer()
+                    else:
+                        self.horcrux._write_now(item)
+                except BaseException as e:
+                    self.error = e
+                self.stats.busy += time.perf_counter() - got
+                self.stats.items += 1
+            with self._room:
+                self._queued_bytes -= size
+                self._room.notify()
+
+    def close(self):
+        "write out everything queued, stop the thread and raise any error it hit"
+        self.queue.put((_FLUSH, 0))
+        self.queue.put((_STOP, 0))
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
 
 class Horcrux:
     def __init__(self, buf: IOBase):
@@ -20,14 +502,38 @@ class Horcrux:
         self.share = None
         self.crypto_header = None
         self.encrypted_filename = None
-        self._in_buff = deque(maxlen=10)
+        self.cipher_mode = None
+        self.distribution = None
+        self.index = None
+        self._reader = None
+        self._base = None
+        self._out_buff = []
+        self._out_size = 0
+        self._out_fd = None
+        self._writer = None
+        self._written = 0
+        self._blocks = []
 
     def init_read(self):
         "read headers from horcrux stream leaving stream cursor at begining of streamblocks"
+        if self._reader is None:
+            self._reader = FrameReader(self.stream)
+        try:
+            self._base = self._reader.tell()
+        except OSError:
+            self._base = None  # not seekable, no random access
         share = ShareHeader()
         share.ParseFromString(self._read_message_bytes())
         pt = sss.Point(share.point.X, share.point.Y)
-        share = sss.Share(share.id, share.threshold, pt)
+        if share.HasField("digest_profile"):
+            dp = share.digest_profile
+            algorithm = dp.Algorithm.Name(dp.algorithm).lower()
+            profile = sss.DigestProfile(algorithm, dp.opslimit, dp.memlimit)
+        else:
+            profile = None
+        field = share.Field.Name(share.field).lower()
+        index_space = share.IndexSpace.Name(share.index_space).lower()
+        share = sss.Share(share.id, share.threshold, pt, profile, field, index_space)
         self.share = share
         self.hrcx_id = share.point.X
 
@@ -35,6 +541,22 @@ class Horcrux:
         stm_header.ParseFromString(self._read_message_bytes())
         self.crypto_header = stm_header.header
         self.encrypted_filename = stm_header.encrypted_filename
+        self.cipher_mode = stm_header.CipherMode.Name(stm_header.cipher_mode).lower()
+        distribution = stm_header.Distribution.Name(stm_header.distribution)
+        self.distribution = distribution.lower().replace("_", "-")
+        self._read_next_block_id()
+
+    def init_blob_read(self):
+        "check a ciphertext blob's magic, leaving the stream cursor at its first block"
+        if self._reader is None:
+            self._reader = FrameReader(self.stream)
+        try:
+            self._base = self._reader.tell()
+        except OSError:
+            self._base = None
+        if self._read_message_bytes() != BLOB_MAGIC:
+            raise ValueError("Not a horcrux ciphertext blob.")
+        self.distribution = "key-only"
         self._read_next_block_id()
 
     def read_block(self):
@@ -53,6 +575,33 @@ class Horcrux:
             pass
         self._read_next_block_id()
 
+    def scan_blocks(self):
+        """
+        yield (block id, offset, length) locating the data of each remaining block.
+
+        Only the frame headers are read, block data is skipped over. Use `read_at` to
+        fetch a located block later. Requires a seekable stream.
+        """
+        while self.next_block_id is not None:
+            block_id = self.next_block_id
+            msg_len = self._reader.skip_message()
+            data_len = _stream_block_data_len(msg_len)
+            yield block_id, self._reader.tell() - data_len, data_len
+            self._read_next_block_id()
+
+    def close(self):
+        "close the underlying stream, headers and any loaded index stay available"
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self.stream.close()
+
+    def read_at(self, offset, length):
+        "read block data located by `scan_blocks`"
+        if self._reader is None:
+            self._reader = FrameReader(self.stream)
+        return self._reader.read_at(offset, length)
+
     def _read_next_block_id(self):
         bid = BlockID()
         try:
@@ -60,19 +609,144 @@ class Horcrux:
         except IndexError:
             self.next_block_id = None
             return
-        self.next_block_id = bid.id
+        self.next_block_id = None if bid.id == INDEX_BLOCK_ID else bid.id
+
+    def load_index(self):
+        """
+        read the block index footer with a single seek, leaving the read position as it
+        was. Returns None (and leaves self.index None) for horcruxes written without an
+        index or streams that can't seek.
+        """
+        if self.index is not None:
+            return self.index
+        if self._base is None:
+            return None
+        reader = self._reader
+        try:
+            resume = reader.tell()
+        except OSError:
+            return None
+        try:
+            end = reader.size()
+            if end - self._base < INDEX_TRAILER.size:
+                return None
+            trailer = reader.read_at(end - INDEX_TRAILER.size, INDEX_TRAILER.size)
+            index_offset, magic = INDEX_TRAILER.unpack(trailer)
+            if magic != INDEX_MAGIC:
+                return None
+            reader.seek(self._base + index_offset)
+            raw = reader.read_message()
+        except (OSError, ValueError, IndexError):
+            return None
+        finally:
+            reader.seek(resume)
+        msg = BlockIndex()
+        msg.ParseFromString(raw)
+        blocks = [
+            (i, self._base + offset, length)
+            for i, offset, length in zip(msg.ids, msg.offsets, msg.lengths)
+        ]
+        schedule = []
+        holders = iter(msg.holders)
+        for length, count in zip(msg.block_lengths, msg.holder_counts):
+            schedule.append((length, tuple(next(holders) for _ in range(count))))
+        self.index = Index(blocks, schedule, msg.blob_digest or None)
+        return self.index
+
+    def locate_blocks(self):
+        """
+        return [(block id, offset, length)] locating every remaining block, from the
+        index footer if there is one, otherwise by scanning.
+        """
+        index = self.load_index()
+        if index is None:
+            return list(self.scan_blocks())
+        if self.next_block_id is None:
+            return []
+        return [b for b in index.blocks if b[0] >= self.next_block_id]
 
-    def init_write(self, share, crypto_header, encrypted_filename=None):
+    def init_write(
+        self,
+        share,
+        crypto_header,
+        encrypted_filename=None,
+        cipher_mode="stream",
+        distribution="replicate",
+    ):
         "write required horcrux headers and prepare stream for blockwriting"
+        self._out_fd = _writable_fd(self.stream)
         self._write_share_header(share)
         self.hrcx_id = share.point.X
-        self._write_stream_header(crypto_header, encrypted_filename)
+        self._write_stream_header(
+            crypto_header, encrypted_filename, cipher_mode, distribution
+        )
+        self.cipher_mode = cipher_mode
+        self.distribution = distribution
+        self.flush()
+
+    def init_blob_write(self):
+        "prepare stream to be a ciphertext blob, for the blocks of key-only horcruxes"
+        self._out_fd = _writable_fd(self.stream)
+        self.write_frame((BLOB_FRAME,))
+        self.distribution = "key-only"
+        self.flush()
 
     def _write_bytes(self, b):
         "write delimited raw bytes to horcrux. raw=True to write raw bytes"
-        size = _VarintBytes(len(b))
-        self.stream.write(size)
-        self.stream.write(b)
+        self.write_frame((_VarintBytes(len(b)), b))
+
+    def write_frame(self, frame):
+        """
+        write a pre-encoded frame (a sequence of buffers) to the horcrux.
+
+        File descriptor backed streams buffer frames and flush them with vectored
+        writes, other streams are written to immediately. With a writer thread started,
+        frames are queued for it instead.
+        """
+        self._written += sum(len(b) for b in frame)
+        if self._writer is not None:
+            self._writer.put(frame)
+            return
+        self._write_now(frame)
+
+    def _write_now(self, frame):
+        if self._out_fd is None:
+            self.stream.writelines(frame)
+            return
+        self._out_buff.extend(frame)
+        self._out_size += sum(len(b) for b in frame)
+        if self._out_size >= WRITE_BUFFER_SIZE:
+            self._flush_buffer()
+
+    def start_writer(
+        self,
+        depth=WRITER_QUEUE_DEPTH,
+        producer_stats=None,
+        max_bytes=WRITER_QUEUE_BYTES,
+    ):
+        "hand writes to a WriterThread until `stop_writer`, returns its StageStats"
+        self._writer = WriterThread(self, depth, producer_stats, max_bytes)
+        return self._writer.stats
+
+    def stop_writer(self):
+        "write out everything queued and stop the writer thread"
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+
+    def flush(self):
+        "write any buffered frames out to the underlying stream"
+        if self._writer is not None:
+            self._writer.put(_FLUSH)
+            return
+        self._flush_buffer()
+
+    def _flush_buffer(self):
+        if not self._out_buff:
+            return
+        self.stream.flush()
+        bufs, self._out_buff, self._out_size = self._out_buff, [], 0
+        _writev_all(self._out_fd, bufs)
 
     def _write_share_header(self, share):
         sh = ShareHeader()
@@ -80,68 +754,274 @@ class Horcrux:
         sh.threshold = share.threshold
         sh.point.X = share.point.X
         sh.point.Y = share.point.Y
+        if share.profile is not None:
+            dp = sh.digest_profile
+            dp.algorithm = dp.Algorithm.Value(share.profile.algorithm.upper())
+            dp.opslimit = share.profile.opslimit
+            dp.memlimit = share.profile.memlimit
+        sh.field = sh.Field.Value(share.field.upper())
+        sh.index_space = sh.IndexSpace.Value(share.index_space.upper())
         self._write_bytes(sh.SerializeToString())
 
-    def _write_stream_header(self, header, encrypted_filename=None):
+    def _write_stream_header(
+        self,
+        header,
+        encrypted_filename=None,
+        cipher_mode="stream",
+        distribution="replicate",
+    ):
         sh = StreamHeader()
         sh.header = header
         if encrypted_filename:
             sh.encrypted_filename = encrypted_filename
+        sh.cipher_mode = sh.CipherMode.Value(cipher_mode.upper())
+        sh.distribution = sh.Distribution.Value(distribution.upper().replace("-", "_"))
         self._write_bytes(sh.SerializeToString())
 
     def write_data_block(self, _id, data):
         "write a data block to Horcrux"
-        bid = BlockID()
-        block = StreamBlock()
-        bid.id = _id
-        block.data = data
-        self._write_bytes(bid.SerializeToString())
-        self._write_bytes(block.SerializeToString())
+        self.write_block_frame(_id, encode_data_block(_id, data))
+
+    def write_block_frame(self, _id, frame):
+        "write an `encode_data_block` frame, noting where the data lands for the index"
+        data_len = len(frame[1]) if len(frame) == 2 else 0
+        frame_len = sum(len(b) for b in frame)
+        self._blocks.append((_id, self._written + frame_len - data_len, data_len))
+        self.write_frame(frame)
+
+    def copy_block(self, _id, src, offset, length):
+        """
+        write block _id, copying its length bytes of data from offset in file src.
+
+        The data is copied in the kernel with os.copy_file_range when both ends are
+        files that support it, otherwise with pread and write. Not for use while a
+        writer thread is running.
+        """
+        if not length:
+            self.write_block_frame(_id, encode_data_block(_id, b""))
+            return
+        head = _block_head(_id, length)
+        self._blocks.append((_id, self._written + len(head), length))
+        self.write_frame((head,))
+        self.flush()
+        if self._out_fd is None:
+            src.seek(offset)
+            self.stream.write(src.read(length))
+        else:
+            _copy_range(src.fileno(), self._out_fd, offset, length)
+        self._written += length
+
+    def write_index(self, schedule, blob_digest=None):
+        """
+        end the blocks and write the index footer.
+
+        schedule: (data length, holder ids) for every block id in order.
+
+        blob_digest: digest of the ciphertext blob, for key-only horcruxes and blobs.
+        """
+        end = BlockID()
+        end.id = INDEX_BLOCK_ID
+        self._write_bytes(end.SerializeToString())
+        msg = BlockIndex()
+        for block_id, offset, length in self._blocks:
+            msg.ids.append(block_id)
+            msg.offsets.append(offset)
+            msg.lengths.append(length)
+        for length, holders in schedule:
+            msg.block_lengths.append(length)
+            msg.holder_counts.append(len(holders))
+            msg.holders.extend(holders)
+        if blob_digest:
+            msg.blob_digest = blob_digest
+        index_offset = self._written
+        self._write_bytes(msg.SerializeToString())
+        self.write_frame((INDEX_TRAILER.pack(index_offset, INDEX_MAGIC),))
 
     def _read_message_bytes(self, skip=False):
         "read the next delimited message as bytes from the horcrux"
-        buff = self._in_buff
-        if len(buff) < 10:
-            buff.extend(self.stream.read(10 - len(buff)))
-        msg_len, new_pos = _DecodeVarint32(buff, 0)
-        for _ in range(new_pos):
-            buff.popleft()
-        if msg_len <= len(buff):
-            m = bytes(buff.popleft() for _ in range(msg_len))
-            return m if not skip else None
+        if self._reader is None:
+            self._reader = FrameReader(self.stream)
         if skip:
-            try:
-                self.stream.seek(msg_len - len(buff), 1)
-            except OSError:
-                self.stream.read(msg_len - len(buff))
-            buff.clear()
+            self._reader.skip_message()
             return
-        ary = bytearray(buff)
-        ary.extend(self.stream.read(msg_len - len(buff)))
-        buff.clear()
-        return bytes(ary)
+        return self._reader.read_message()
+
+
+def encode_data_block(_id, data):
+    """
+    Encode a BlockID and StreamBlock frame pair as a tuple of buffers.
+
+    The data itself is not copied, so the same frame can be handed to every horcrux that
+    receives the block.
+    """
+    if not data:
+        bid = BlockID()
+        bid.id = _id
+        bid = bid.SerializeToString()
+        return (_VarintBytes(len(bid)), bid, b"\x00")
+    return (_block_head(_id, len(data)), data)
+
+
+def _block_head(_id, data_len):
+    "the bytes of a block's frames that come before its data"
+    bid = BlockID()
+    bid.id = _id
+    bid = bid.SerializeToString()
+    data_varint = _VarintBytes(data_len)
+    block_len = len(STREAM_BLOCK_DATA_TAG) + len(data_varint) + data_len
+    return b"".join(
+        (
+            _VarintBytes(len(bid)),
+            bid,
+            _VarintBytes(block_len),
+            STREAM_BLOCK_DATA_TAG,
+            data_varint,
+        )
+    )
+
+
+def _stream_block_data_len(msg_len):
+    "length of StreamBlock.data in a serialized StreamBlock of msg_len bytes"
+    if not msg_len:
+        return 0
+    # msg_len = tag + varint(data_len) + data_len, which has exactly one solution
+    for varint_len in range(1, MAX_VARINT_LEN + 1):
+        data_len = msg_len - len(STREAM_BLOCK_DATA_TAG) - varint_len
+        if data_len >= 0 and len(_VarintBytes(data_len)) == varint_len:
+            return data_len
+    raise ValueError("Malformed stream block.")
+
+
+def distribute_block(horcruxes, _id, data):
+    "encode a data block once and write it to each of the given horcruxes"
+    frame = encode_data_block(_id, data)
+    for h in horcruxes:
+        h.write_block_frame(_id, frame)
+
+
+def is_blob(path: FileLike) -> bool:
+    "True if path is a ciphertext blob rather than a horcrux"
+    with open(path, "rb") as f:
+        return f.read(len(BLOB_FRAME)) == BLOB_FRAME
+
+
+def get_blob_files(
+    filename: FileLike,
+    outdir: Union[FileLike, Sequence[FileLike]] = ".",
+    copies: int = 1,
+) -> List[Horcrux]:
+    "create ciphertext blob files, copies of them are spread round robin over outdir"
+    if isinstance(outdir, (str, bytes, PathLike)):
+        outdirs = [Path(outdir)]
+    else:
+        outdirs = [Path(d) for d in outdir]
+    if copies == 1:
+        names = [f"{filename}.blob"]
+    else:
+        digits = len(str(copies))
+        names = [f"{filename}_{i:0{digits}}.blob" for i in range(1, copies + 1)]
+    streams = [open(outdirs[i % len(outdirs)] / n, "wb") for i, n in enumerate(names)]
+    return init_blob_streams(streams)
+
+
+def init_blob_streams(streams) -> List[Horcrux]:
+    blobs = [Horcrux(s) for s in streams]
+    for blob in blobs:
+        blob.init_blob_write()
+    return blobs
+
+
+def _writable_fd(stream):
+    "return the file descriptor behind stream if it can be written to with os.writev"
+    if not hasattr(os, "writev"):
+        return None
+    try:
+        fd = stream.fileno()
+    except (OSError, AttributeError):
+        return None
+    return fd if stream.writable() else None
+
+
+def _copy_range(src_fd, dst_fd, offset, length):
+    "copy length bytes from offset in src_fd to dst_fd's position"
+    copy_file_range = getattr(os, "copy_file_range", None)
+    while length:
+        if copy_file_range is not None:
+            try:
+                copied = copy_file_range(src_fd, dst_fd, length, offset)
+            except OSError:  # not supported between these files, copy by hand
+                copy_file_range = None
+                continue
+        else:
+            chunk = os.pread(src_fd, min(length, COPY_CHUNK), offset)
+            copied = os.write(dst_fd, chunk) if chunk else 0
+        if not copied:
+            raise ValueError("Source file is truncated.")
+        offset += copied
+        length -= copied
+
+
+def _writev_all(fd, bufs):
+    "write all bufs to fd, handling partial writes and the IOV_MAX limit"
+    bufs = [memoryview(b).cast("B") for b in bufs if len(b)]
+    i = 0
+    while i < len(bufs):
+        written = os.writev(fd, bufs[i : i + IOV_MAX])
+        while written:
+            if written >= len(bufs[i]):
+                written -= len(bufs[i])
+                i += 1
+            else:
+                bufs[i] = bufs[i][written:]
+                written = 0
 
 
 def get_horcrux_files(
     filename: FileLike,
     shares: List[sss.Share],
     crypto_header: bytes,
-    outdir: FileLike = ".",
+    outdir: Union[FileLike, Sequence[FileLike]] = ".",
     encrypted_filename: Union[bytes, None] = None,
+    cipher_mode: str = "stream",
+    distribution: str = "replicate",
 ) -> List[Horcrux]:
-    outdir = Path(outdir)
-    digits = len(str(len(shares)))
-    streams = []
-    for i, share in enumerate(shares, start=1):
-        name = "{}_{:0{digits}}.hrcx".format(filename, i, digits=digits)
-        f = open(outdir / name, "wb")
-        streams.append(f)
-    return init_horcrux_streams(streams, shares, crypto_header, encrypted_filename)
+    "create horcrux files, spread round robin over outdir if it's a list of directories"
+    streams = [open(p, "wb") for p in horcrux_paths(filename, len(shares), outdir)]
+    return init_horcrux_streams(
+        streams, shares, crypto_header, encrypted_filename, cipher_mode, distribution
+    )
+
+
+def horcrux_paths(
+    filename: FileLike,
+    count: int,
+    outdir: Union[FileLike, Sequence[FileLike]] = ".",
+) -> List[Path]:
+    "paths of count horcrux files titled filename, round robin over outdir"
+    if isinstance(outdir, (str, bytes, PathLike)):
+        outdirs = [Path(outdir)]
+    else:
+        outdirs = [Path(d) for d in outdir]
+    digits = len(str(count))
+    return [
+        outdirs[i % len(outdirs)]
+        / "{}_{:0{digits}}.hrcx".format(filename, i + 1, digits=digits)
+        for i in range(count)
+    ]
 
 
-def init_horcrux_streams(streams, shares, crypto_header, encrypted_filename=None):
+def init_horcrux_streams(
+    streams,
+    shares,
+    crypto_header,
+    encrypted_filename=None,
+    cipher_mode="stream",
+    distribution="replicate",
+):
     assert len(streams) == len(shares)
     horcruxes = [Horcrux(s) for s in streams]
     for hx, share in zip(horcruxes, shares):
-        hx.init_write(share, crypto_header, encrypted_filename)
+        hx.init_write(
+            share, crypto_header, encrypted_filename, cipher_mode, distribution
+        )
     return horcruxes
@@ -0,0 +1,470 @@
+"plan which horcrux files to read each block from when combining"
+
+import os
+import queue
+import threading
+from collections import OrderedDict
+from typing import Sequence
+
+from google.protobuf.message import DecodeError
+
+from . import io
+from .crypto import DecryptionError
+
+FD_BUDGET = 64  # most horcrux files held open at once while reading blocks
+PREFETCH_DEPTH = 16  # blocks each source reads ahead of the one being decrypted
+PREFETCH_BYTES = 1024 * 1024 * 64  # but no more than this (or one block) per source
+
+
+class Source:
+    """
+    A horcrux, its headers and where its blocks are.
+
+    File sources (with a path) are closed after planning and only reopened to read
+    blocks. Stream sources read through the horcrux's own open stream.
+
+    Blocks that run past the end of the file are left out, `truncated` is then set.
+    """
+
+    def __init__(self, horcrux, blocks, path=None):
+        self.horcrux = horcrux
+        self.path = path
+        self.device, self.size = _device_and_size(path, horcrux.stream)
+        self.blocks = {
+            block_id: (pos, length)
+            for block_id, pos, length in blocks
+            if not self.size or pos + length <= self.size
+        }
+        self.truncated = len(self.blocks) < len(blocks)
+        self.bytes_read = 0
+        self._lock = threading.Lock()  # stream sources may be read from two threads
+
+    def __repr__(self):
+        name = self.path if self.path is not None else self.horcrux.hrcx_id
+        return f"Source({str(name)!r})"
+
+    @property
+    def name(self):
+        "the path, or horcrux id for stream sources"
+        return self.path if self.path is not None else self.horcrux.hrcx_id
+
+    def open(self):
+        "return a file to read blocks from, None for stream sources"
+        return open(self.path, "rb") if self.path is not None else None
+
+    def read(self, f, block_id):
+        "read a block's data using a file from `open`"
+        pos, length = self.blocks[block_id]
+        if f is None:
+            with self._lock:
+                data = self.horcrux.read_at(pos, length)
+        else:
+            f.seek(pos)
+            data = f.read(length)
+        self.bytes_read += len(data)
+        if len(data) < length:
+            raise DecryptionError(f"Block {block_id} is truncated.")
+        return data
+
+
+def _device_and_size(path, stream):
+    try:
+        st = os.stat(path) if path is not None else os.fstat(stream.fileno())
+    except (OSError, AttributeError, ValueError):
+        return None, 0
+    return st.st_dev, st.st_size
+
+
+class ReadPlan:
+    """
+    A minimal set of horcrux files covering every block, and which of them to read each
+    block from.
+
+    sources: every given file, in order. Their headers are all available for key
+    recovery, but only `chosen` are opened to read blocks. Ciphertext blobs of key-only
+    horcruxes are sources too, but have no headers.
+
+    chosen: the covering subset.
+
+    schedule: (block id, source) for every block in order. Erasure coded horcruxes have
+    k entries, one per fragment, for each block.
+
+    problems: what went wrong with each corrupt or truncated file (by name) that was
+    worked around, rereading its blocks from other sources.
+    """
+
+    def __init__(self, sources, chosen, schedule, problems=None):
+        self.sources = sources
+        self.chosen = chosen
+        self.schedule = schedule
+        self.problems = dict(problems or {})
+        self.unreadable = set()  # sources that failed to read, not to be retried
+
+    @property
+    def horcruxes(self):
+        "the horcruxes, without any ciphertext blobs"
+        return [s.horcrux for s in self.sources if s.horcrux.share is not None]
+
+    @property
+    def bytes_read(self):
+        "bytes of block data read from each file so far"
+        return {s.name: s.bytes_read for s in self.sources}
+
+    def note(self, horcrux, problem):
+        "record a problem with horcrux's file, keeping the first for each"
+        source = next(s for s in self.sources if s.horcrux is horcrux)
+        self.problems.setdefault(source.name, str(problem))
+
+    def failed(self, source, error):
+        "note that source couldn't be read, it isn't read from again"
+        self.unreadable.add(source)
+        self.note(source.horcrux, error)
+
+    def reread(self, block_id, tried, error):
+        """
+        read block_id from another source holding it, returning (horcrux, data).
+
+        Sources whose horcrux is in tried, that failed to read before or that are
+        already scheduled for the block (other fragments of an erasure coded block) are
+        skipped. Raises error if there are none left. Only the block is read, nothing
+        else is read again.
+        """
+        scheduled = {s for i, s in self.schedule if i == block_id}
+        for source in self.sources:
+            if (
+                block_id not in source.blocks
+                or source.horcrux in tried
+                or source in self.unreadable
+                or source in scheduled
+            ):
+                continue
+            try:
+                f = source.open()
+                try:
+                    return source.horcrux, source.read(f, block_id)
+                finally:
+                    if f is not None:
+                        f.close()
+            except (OSError, DecryptionError) as e:
+                self.failed(source, e)
+        raise error
+
+
+def plan_reads(files: Sequence[io.FileLike]) -> ReadPlan:
+    """
+    Read the headers and block locations of each file, one at a time, and choose the
+    horcruxes to read blocks from.
+
+    Block locations come from the index footer, or a scan for older horcruxes. The
+    cover is picked greedily by the most uncovered bytes, breaking ties in favour of
+    devices not already being read from and then the smallest files.
+
+    Key-only horcruxes hold no blocks, files may include their ciphertext blobs.
+
+    Files with unreadable headers are skipped, and truncated or corrupt files only
+    offer the blocks before the damage. Either is noted in the plan's problems.
+    """
+    sources = []
+    problems = {}
+    for path in files:
+        blob = io.is_blob(path)
+        h = io.Horcrux(open(path, "rb"))
+        blocks = []
+        headers = False
+        try:
+            if blob:
+                h.init_blob_read()
+            else:
+                h.init_read()
+            headers = True
+            if h.load_index() is not None:
+                blocks = h.locate_blocks()
+            else:
+                for block in h.scan_blocks():
+                    blocks.append(block)
+        except (DecodeError, IndexError, ValueError) as e:
+            problems[path] = f"Corrupt horcrux: {e}"
+            if not headers:
+                continue
+        finally:
+            h.close()
+        source = Source(h, blocks, path)
+        if source.truncated:
+            problems.setdefault(path, "Horcrux is truncated.")
+        sources.append(source)
+    if not sources:
+        raise DecryptionError("None of the horcruxes could be read.")
+    return _plan(sources, problems)
+
+
+def plan_streams(horcruxes: Sequence[io.Horcrux]) -> ReadPlan:
+    """
+    plan_reads for horcruxes (and blobs) that are already open and primed with
+    `init_read` (or `init_blob_read`).
+
+    Returns None unless every horcrux has an index footer, reading them in one pass is
+    cheaper than scanning each for block locations first.
+    """
+    if not all(h.load_index() is not None for h in horcruxes):
+        return None
+    return _plan([Source(h, h.locate_blocks()) for h in horcruxes])
+
+
+def _plan(sources, problems=None):
+    if _distribution(sources) == "key-only":
+        _check_blobs(sources)
+    indexes = [s.horcrux.index for s in sources if s.horcrux.index is not None]
+    if indexes:
+        block_count = len(indexes[0].schedule)
+    else:
+        block_count = max((max(s.blocks, default=-1) for s in sources), default=-1) + 1
+    for block_id in range(block_count):
+        if not any(block_id in s.blocks for s in sources):
+            raise DecryptionError(f"Block {block_id} is missing from every horcrux.")
+
+    if _distribution(sources) == "erasure":
+        return _plan_fragments(sources, block_count, problems)
+    chosen = _choose_cover(sources, block_count)
+    loads = {s: 0 for s in chosen}
+    schedule = []
+    for block_id in range(block_count):
+        # spread the blocks over the chosen sources that hold them
+        holders = [s for s in chosen if block_id in s.blocks]
+        source = min(holders, key=loads.__getitem__)
+        loads[source] += source.blocks[block_id][1]
+        schedule.append((block_id, source))
+    return ReadPlan(sources, chosen, schedule, problems)
+
+
+def _distribution(sources):
+    horcruxes = (s.horcrux for s in sources if s.horcrux.share is not None)
+    h = next(horcruxes, None)
+    if h is None:
+        raise ValueError("No horcruxes given.")
+    return h.distribution
+
+
+def _check_blobs(sources):
+    "key-only horcruxes need a ciphertext blob, and their digests must match"
+    blobs = [s for s in sources if s.horcrux.share is None]
+    if not blobs:
+        raise DecryptionError("Key-only horcruxes need their ciphertext blob.")
+    expected = {
+        s.horcrux.index.blob_digest
+        for s in sources
+        if s.horcrux.share is not None and s.horcrux.index is not None
+    }
+    for blob in blobs:
+        index = blob.horcrux.index
+        if index is None or (expected and {index.blob_digest} != expected):
+            raise DecryptionError(f"{blob.name} isn't the blob for these horcruxes.")
+
+
+def _plan_fragments(sources, block_count, problems=None):
+    """
+    erasure coded horcruxes hold a fragment of every block and any k rebuild it. Read k
+    fragments of each block, from the same k sources where possible, preferring
+    sources on different devices.
+    """
+    k = sources[0].horcrux.share.threshold
+    by_preference = []
+    devices = set()
+    remaining = sorted(sources, key=lambda s: s.size)
+    while remaining:
+        best = next((s for s in remaining if s.device not in devices), remaining[0])
+        remaining.remove(best)
+        by_preference.append(best)
+        devices.add(best.device)
+    chosen = []
+    schedule = []
+    for block_id in range(block_count):
+        holders = [s for s in by_preference if block_id in s.blocks][:k]
+        if len(holders) < k:
+            raise DecryptionError(
+                f"Only {len(holders)} fragments of block {block_id}, {k} are needed."
+            )
+        for source in holders:
+            if source not in chosen:
+                chosen.append(source)
+            schedule.append((block_id, source))
+    return ReadPlan(sources, chosen, schedule, problems)
+
+
+def _choose_cover(sources, block_count):
+    "greedy set cover of block ids 0..block_count-1"
+    uncovered = set(range(block_count))
+    chosen = []
+    devices = set()
+    candidates = list(sources)
+    while uncovered:
+
+        def gain(s):
+            new = uncovered.intersection(s.blocks)
+            new_bytes = sum(s.blocks[i][1] + 1 for i in new)  # +1, empty blocks count
+            return (new_bytes, s.device not in devices, -s.size)
+
+        best = max(candidates, key=gain)
+        candidates.remove(best)
+        chosen.append(best)
+        devices.add(best.device)
+        uncovered.difference_update(best.blocks)
+    return chosen
+
+
+def read_blocks(plan: ReadPlan, fd_budget: int = FD_BUDGET):
+    """
+    yield (horcrux, block id, ciphertext) for every block in order, following plan.
+
+    Files are opened when first needed and closed after their last block, with at most
+    fd_budget open at once (least recently used files are closed, and reopened later if
+    needed). Blocks that can't be read are read from another source (see
+    ReadPlan.reread).
+    """
+    last_use = {source: block_id for block_id, source in plan.schedule}
+    open_files = OrderedDict()
+    errors = {}  # why each unreadable source failed
+    try:
+        for block_id, source in plan.schedule:
+            if source in errors:
+                h, data = plan.reread(block_id, [source.horcrux], errors[source])
+                yield h, block_id, data
+                continue
+            f = open_files.pop(source, None)
+            try:
+                if f is None and source.path is not None:
+                    if len(open_files) >= fd_budget:
+                        open_files.popitem(last=False)[1].close()
+                    f = source.open()
+                open_files[source] = f
+                data = source.read(f, block_id)
+            except (OSError, DecryptionError) as e:
+                f = open_files.pop(source, None)
+                if f is not None:
+                    f.close()
+                errors[source] = e
+                plan.failed(source, e)
+                h, data = plan.reread(block_id, [source.horcrux], e)
+                yield h, block_id, data
+                continue
+            if last_use[source] == block_id:
+                f = open_files.pop(source)
+                if f is not None:
+                    f.close()
+            yield source.horcrux, block_id, data
+    finally:
+        for f in open_files.values():
+            if f is not None:
+                f.close()
+
+
+class Prefetcher:
+    """
+    Iterate (horcrux, block id, ciphertext) for every block in order, like read_blocks,
+    with a reader thread per chosen source.
+
+    Each thread reads its source's blocks ahead into a queue of at most `depth` blocks
+    (fewer for big blocks), so a slow device only stalls the blocks it holds and sources
+    on separate devices are read in parallel. The queued blocks take at most
+    memory_limit bytes between them, split evenly over the sources, or PREFETCH_BYTES
+    per source by default; whatever the limit each source queues at least one block.
+    Call `start` early to begin reading before the blocks are needed, e.g. while the key
+    is being recovered. If a source fails to read, its remaining blocks are read from
+    other sources.
+    """
+
+    def __init__(
+        self, plan: ReadPlan, depth: int = PREFETCH_DEPTH, memory_limit: int = None
+    ):
+        self.plan = plan
+        self.depth = depth
+        self.memory_limit = memory_limit
+        self._queues = {}
+        self._threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        "start the reader threads, if they haven't been already"
+        if self._threads:
+            return self
+        wanted = {source: [] for source in self.plan.chosen}
+        for block_id, source in self.plan.schedule:
+            wanted[source].append(block_id)
+        per_source = PREFETCH_BYTES
+        if self.memory_limit is not None:
+            per_source = self.memory_limit // max(len(wanted), 1)
+        for source, block_ids in wanted.items():
+            largest = max((source.blocks[i][1] for i in block_ids), default=1)
+            depth = min(self.depth, per_source // max(largest, 1))
+            q = queue.Queue(max(depth, 1))
+            t = threading.Thread(
+                target=self._read_ahead, args=(source, block_ids, q), daemon=True
+            )
+            self._queues[source] = q
+            self._threads.append(t)
+            t.start()
+        return self
+
+    def _read_ahead(self, source, block_ids, q):
+        try:
+            f = source.open()
+            try:
+                for block_id in block_ids:
+                    if not self._put(q, source.read(f, block_id)):
+                        return
+            finally:
+                if f is not None:
+                    f.close()
+        except BaseException as e:  # handed to the consuming thread
+            self._put(q, e)
+
+    def _put(self, q, item):
+        "put item on q unless the prefetcher is closed while waiting for space"
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        self.start()
+        errors = {}  # why each source's reader thread stopped
+        try:
+            for block_id, source in self.plan.schedule:
+                if source in errors:
+                    h, data = self.plan.reread(
+                        block_id, [source.horcrux], errors[source]
+                    )
+                    yield h, block_id, data
+                    continue
+                data = self._queues[source].get()
+                if isinstance(data, (OSError, DecryptionError)):
+                    # the reader has stopped, read its blocks from other sources
+                    errors[source] = data
+                    self.plan.failed(source, data)
+                    h, data = self.plan.reread(block_id, [source.horcrux], data)
+                    yield h, block_id, data
+                    continue
+                if isinstance(data, BaseException):
+                    raise data
+                yield source.horcrux, block_id, data
+        finally:
+            self.close()
+
+    def close(self):
+        "stop and wait for the reader threads"
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+
+def block_reader(plan: ReadPlan, fd_budget: int = FD_BUDGET, memory_limit: int = None):
+    """
+    return a started Prefetcher for plan (reading ahead into at most memory_limit
+    bytes), or a read_blocks generator if reading every chosen source at once would take
+    more than fd_budget files.
+    """
+    if sum(s.path is not None for s in plan.chosen) > fd_budget:
+        return read_blocks(plan, fd_budget)
+    return Prefetcher(plan, memory_limit=memory_limit).start()
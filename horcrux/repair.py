@@ -0,0 +1,264 @@
+"""
+rebuild horcruxes from existing ones without decrypting anything: repair a lost
+horcrux, or reshare the key under a new threshold and number of horcruxes.
+"""
+
+import contextlib
+import itertools
+import math
+import re
+from pathlib import Path
+from typing import List, Sequence
+
+from . import erasure
+from . import io
+from . import plan
+from . import split
+from . import sss
+
+
+def regenerate(
+    files: Sequence[io.FileLike],
+    missing_index: int,
+    outfile: io.FileLike = None,
+    overwrite=False,
+) -> Path:
+    """
+    Rebuild the horcrux with share index missing_index (0 for the horcrux numbered 1)
+    from threshold survivors in files, returning its path.
+
+    Its share is evaluated from the survivors' shares and its blocks are copied frame
+    for frame from survivors holding them (erasure coded fragments are re-encoded), so
+    nothing is decrypted and the other horcruxes stay valid. The survivors need index
+    footers, for the schedule of which blocks the lost horcrux held.
+
+    outfile defaults to the survivors' naming pattern, e.g. my_hx_2.hrcx for index 1.
+
+    missing_index is checked against the number of horcruxes in the schedule. Key-only
+    horcruxes hold no blocks, so their schedule doesn't say how many there were and
+    any index is taken, even one past the original horcruxes.
+    """
+    sources = _load_survivors(files)
+    horcruxes = [s.horcrux for s in sources]
+    if any(h.hrcx_id == missing_index for h in horcruxes):
+        raise ValueError(f"Horcrux {missing_index + 1} isn't missing.")
+    indexes = [h.index for h in horcruxes if h.index is not None]
+    if not indexes:
+        raise ValueError("Repair needs horcruxes with a block index.")
+    schedule, blob_digest = indexes[0].schedule, indexes[0].blob_digest
+    known = set().union(*(holders for _, holders in schedule))
+    if known and missing_index >= max(known) + 1:
+        raise ValueError(
+            f"There was no horcrux {missing_index + 1}, only {max(known) + 1}."
+        )
+    share = sss.extend_shares([h.share for h in horcruxes], [missing_index])[0]
+    if outfile is None:
+        outfile = _sibling_path(sources[0].path, missing_index)
+    template = horcruxes[0]
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(outfile, "wb" if overwrite else "xb"))
+        opened = {s: stack.enter_context(open(s.path, "rb")) for s in sources}
+        h = io.Horcrux(out)
+        h.init_write(
+            share,
+            template.crypto_header,
+            template.encrypted_filename,
+            template.cipher_mode,
+            template.distribution,
+        )
+        for block_id, (length, holders) in enumerate(schedule):
+            if template.distribution == "erasure":
+                k = template.share.threshold
+                fragments = _recoded(sources, opened, block_id, k, len(holders))
+                h.write_data_block(block_id, fragments[missing_index])
+            elif missing_index in holders:
+                source = _holder(sources, block_id)
+                pos, data_len = source.blocks[block_id]
+                h.copy_block(block_id, opened[source], pos, data_len)
+        h.write_index(schedule, blob_digest)
+        h.flush()
+    return Path(outfile)
+
+
+def reshare(
+    files: Sequence[io.FileLike],
+    threshold: int,
+    num_horcruxes: int,
+    outdir: io.FileLike = None,
+    horcrux_title: str = None,
+    overwrite=False,
+) -> List[Path]:
+    """
+    Make num_horcruxes new horcruxes, threshold of which are needed to recombine, from
+    enough of the horcruxes in files to recover the key. Returns their paths.
+
+    Only the key is reshared. The encrypted blocks are copied as they are (erasure
+    coded fragments are decoded and re-encoded for the new threshold), dealt out to
+    the new horcruxes like split deals out groups. Blocks are never split, so there
+    are only as many distinct groups as there are blocks. Key-only horcruxes keep
+    their ciphertext blob, it isn't needed here.
+
+    The new horcruxes have a new id, so they can't be mixed up with the old ones.
+    outdir defaults to the directory of the first of files and horcrux_title to its
+    title with "_reshared" added, so the new horcruxes don't collide with the old.
+    """
+    sources = _load_survivors(files)
+    horcruxes = [s.horcrux for s in sources]
+    template = horcruxes[0]
+    _check_policy(threshold, num_horcruxes, template.distribution)
+    indexes = [h.index for h in horcruxes if h.index is not None]
+    if not indexes:
+        raise ValueError("Resharing needs horcruxes with a block index.")
+    schedule, blob_digest = indexes[0].schedule, indexes[0].blob_digest
+
+    key = sss.combine_shares([h.share for h in horcruxes])
+    old = template.share
+    shares = sss.generate_shares(num_horcruxes, threshold, key, old.profile, old.field)
+    del key
+
+    first = Path(sources[0].path)
+    if outdir is None:
+        outdir = first.parent
+    if horcrux_title is None:
+        horcrux_title = f"{_title(first)}_reshared"
+    paths = io.horcrux_paths(horcrux_title, num_horcruxes, outdir)
+    inputs = {Path(s.path).resolve() for s in sources}
+    if any(p.resolve() in inputs for p in paths):
+        raise ValueError("The new horcruxes would overwrite the ones being read.")
+
+    with contextlib.ExitStack() as stack:
+        streams = [
+            stack.enter_context(open(p, "wb" if overwrite else "xb")) for p in paths
+        ]
+        opened = {s: stack.enter_context(open(s.path, "rb")) for s in sources}
+        outputs = io.init_horcrux_streams(
+            streams,
+            shares,
+            template.crypto_header,
+            template.encrypted_filename,
+            template.cipher_mode,
+            template.distribution,
+        )
+        if template.distribution == "replicate":
+            schedule = _rerouted(schedule, list(range(num_horcruxes)), threshold)
+            for block_id, (_, holders) in enumerate(schedule):
+                source = _holder(sources, block_id)
+                pos, data_len = source.blocks[block_id]
+                for i in holders:
+                    outputs[i].copy_block(block_id, opened[source], pos, data_len)
+        elif template.distribution == "erasure":
+            schedule = _recode_blocks(
+                sources, opened, len(schedule), outputs, threshold
+            )
+        for h in outputs:  # key-only horcruxes hold no blocks, just the index
+            h.write_index(schedule, blob_digest)
+            h.flush()
+    return paths
+
+
+def _recode_blocks(sources, opened, block_count, outputs, threshold):
+    "erasure code every block over outputs for threshold, returning the new schedule"
+    k = sources[0].horcrux.share.threshold
+    holders = tuple(h.hrcx_id for h in outputs)
+    schedule = []
+    for block_id in range(block_count):
+        fragments = _recoded(sources, opened, block_id, k, len(outputs), threshold)
+        for h in outputs:
+            h.write_data_block(block_id, fragments[h.hrcx_id])
+        schedule.append((len(fragments[0]), holders))
+    return schedule
+
+
+def _check_policy(threshold, num_horcruxes, distribution):
+    if not 2 <= threshold <= num_horcruxes:
+        raise ValueError("Need 2 <= threshold <= number of horcruxes.")
+    if distribution == "erasure" and num_horcruxes > erasure.MAX_FRAGMENTS:
+        raise ValueError(
+            f"Erasure coding supports at most {erasure.MAX_FRAGMENTS} horcruxes."
+        )
+
+
+def _rerouted(schedule, ids, threshold):
+    """
+    holder ids for every block of a replicated schedule, dealt to combinations of
+    len(ids) - threshold + 1 of ids in groups of about split's ideal block size.
+    Blocks every horcrux held (block mode's final block, tiny inputs) still go to all.
+    """
+    everyone = set().union(*(holders for _, holders in schedule))
+    size = sum(length for length, holders in schedule if set(holders) != everyone)
+    r = len(ids) - threshold + 1
+    group_size = max(math.ceil(size / math.comb(len(ids), r)), 1)
+    passes = (split.combinations(ids, r) for _ in itertools.count())
+    deal = itertools.chain.from_iterable(passes)
+    rerouted = []
+    receivers, filled = next(deal), 0
+    for length, holders in schedule:
+        if set(holders) == everyone:
+            rerouted.append((length, tuple(ids)))
+            continue
+        if filled >= group_size:
+            receivers, filled = next(deal), 0
+        rerouted.append((length, receivers))
+        filled += length
+    return rerouted
+
+
+def _load_survivors(files):
+    "plan.Source for every horcrux in files, ciphertext blobs are skipped"
+    sources = []
+    for path in files:
+        if io.is_blob(path):
+            continue
+        h = io.Horcrux(open(path, "rb"))
+        try:
+            h.init_read()
+            blocks = h.locate_blocks()
+        finally:
+            h.close()
+        sources.append(plan.Source(h, blocks, path))
+    if not sources:
+        raise ValueError("No horcruxes to repair from.")
+    return sources
+
+
+def _holder(sources, block_id):
+    for source in sources:
+        if block_id in source.blocks:
+            return source
+    raise ValueError(f"Block {block_id} isn't in any of the given horcruxes.")
+
+
+def _recoded(sources, opened, block_id, k, n, new_k=None):
+    """
+    decode an erasure coded block from k fragments and re-encode it as n fragments, any
+    new_k (default k) of which rebuild it
+    """
+    holders = [s for s in sources if block_id in s.blocks][:k]
+    if len(holders) < k:
+        raise ValueError(
+            f"Only {len(holders)} fragments of block {block_id}, {k} are needed."
+        )
+    fragments = [s.read(opened[s], block_id) for s in holders]
+    xs = [s.horcrux.hrcx_id for s in holders]
+    block = erasure.decode(fragments, xs, k)
+    return erasure.encode(block, new_k or k, n)
+
+
+def _sibling_path(survivor, index):
+    "the path of horcrux index in survivor's directory, numbered like survivor"
+    survivor = Path(survivor)
+    match = _name_match(survivor)
+    digits = len(match.group(2))
+    return survivor.with_name(f"{match.group(1)}_{index + 1:0{digits}}.hrcx")
+
+
+def _title(survivor):
+    "the title survivor was split with, my_hx for my_hx_2.hrcx"
+    return _name_match(Path(survivor)).group(1)
+
+
+def _name_match(survivor):
+    match = re.fullmatch(r"(.*)_(\d+)\.hrcx", survivor.name)
+    if match is None:
+        raise ValueError(f"Can't tell how to name new horcruxes from {survivor}.")
+    return match
@@ -1,18 +1,35 @@
 "split a single file-like stream into horcruxes"
+
+import os
 import math
+import hashlib
+import tempfile
+import threading
+import time
 import itertools
+import contextlib
 import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from rich.progress import Progress, BarColumn, FileSizeColumn
 
 from . import crypto
+from . import erasure
 from . import sss
 from . import io
 
-
 MIN_BLOCK_SIZE = 20
 DEFAULT_BLOCK_SIZE = 4096
 MAX_CHUNK_SIZE = 1024 * 1024 * 100  # 100 MiB
+FRAME_SIZE = 1024 * 1024  # most plaintext encrypted into one block
+MIN_MEMORY_LIMIT = 1024 * 1024  # 1 MiB
+FEED_MEMORY_LIMIT = 1024 * 1024 * 64  # memory_limit for fed input of unknown size
+DISTRIBUTIONS = ("replicate", "erasure", "key-only")
+
+
+class SizeMismatchError(Exception):
+    "the input was longer or shorter than the size it was split with"
 
 
 def _ideal_block_size(size, n, k):
@@ -29,6 +46,17 @@ class Stream:
         stream_name=None,
         outdir=".",
         horcrux_title=None,
+        digest_profile=sss.DEFAULT_PROFILE,
+        field="prime",
+        cipher_mode="stream",
+        workers=None,
+        pipeline=True,
+        distribution="replicate",
+        blob_copies=1,
+        frame_size=FRAME_SIZE,
+        memory_limit=None,
+        spool=False,
+        spool_dir=None,
     ):
         """
         Create `num_horcruxes` from in_stream and require that `threshold` are needed to
@@ -45,17 +73,86 @@ class Stream:
 
         stream_name: filename of the reconstructed stream optional
 
-        out_dir: where to place horcrux file streams
+        outdir: where to place horcrux file streams. A list of directories (one per
+        disk, say) spreads the horcruxes over them round robin.
 
         horcrux_title: What to title the horcrux files. eg: my_horcrux ->
-        my_horcrux_01.hcrx"""
+        my_horcrux_01.hcrx
+
+        digest_profile: sss.DigestProfile (or the name of one of sss.PROFILES) setting
+        the cost of the key digest checked when combining. Recorded in the horcruxes.
+
+        field: finite field used to share the key, one of sss.FIELDS.
+
+        cipher_mode: "stream" for libsodium secretstream, or "block" for independently
+        sealed blocks (crypto.BlockCipher) that can be encrypted in parallel and read
+        back in any order.
+
+        workers: threads used to encrypt blocks in "block" mode, defaults to the number
+        of cpus.
+
+        pipeline: read the input ahead and write each horcrux from a thread of its own,
+        with bounded queues between them, so one slow disk doesn't hold up the rest.
+        `stats` shows where the time went.
+
+        distribution: "replicate" copies whole blocks to n-k+1 horcruxes. "erasure"
+        Reed-Solomon codes each block into n fragments, one per horcrux, any k of which
+        rebuild it, for n/k times the input size instead of n-k+1 times. "key-only"
+        writes the encrypted stream once to a ciphertext blob and the horcruxes only
+        hold key shares and the blob's digest, combine takes k of them and the blob.
+
+        blob_copies: how many identical ciphertext blobs to write for "key-only".
+
+        frame_size: most plaintext bytes encrypted into one block. The distribution
+        groups (the ranges each set of horcruxes gets) can be far bigger, they're
+        encrypted as a run of frames, so memory use follows frame_size, not the input
+        size, when splitting and combining.
+
+        memory_limit: bytes of memory the split may use for look ahead, queues and
+        frames (shrinking frame_size to fit). A stream of unknown size (stdin, a pipe)
+        is then distributed in one continuous schedule, with the group size picked
+        from a look ahead of a quarter of the limit, instead of in separately
+        distributed MAX_CHUNK_SIZE chunks.
+
+        spool: copy a stream of unknown size to a temporary file (in spool_dir, default
+        the system's) first, counting its bytes, so it gets the same size aware
+        distribution as a file.
+
+        in_stream may be None if the input is pushed with `feed` instead."""
 
         self.in_stream = in_stream
         self.stream_size = in_stream_size
         self.n = num_horcruxes
         self.k = threshold
+        if isinstance(digest_profile, str):
+            digest_profile = sss.PROFILES[digest_profile]
+        self.digest_profile = digest_profile
+        self.field = field
 
-        self.crypto = crypto.Stream()
+        self.cipher_mode = cipher_mode
+        if cipher_mode not in crypto.MODES:
+            raise ValueError(f"Unknown cipher mode {cipher_mode!r}.")
+        self.crypto = crypto.MODES[cipher_mode]()
+        self.workers = workers or os.cpu_count() or 1
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {distribution!r}.")
+        if distribution == "erasure" and num_horcruxes > erasure.MAX_FRAGMENTS:
+            raise ValueError(
+                f"Erasure coding supports at most {erasure.MAX_FRAGMENTS} horcruxes."
+            )
+        self.distribution = distribution
+        self.blob_copies = blob_copies
+        if frame_size < 1:
+            raise ValueError("Frame size must be at least 1 byte.")
+        self.frame_size = frame_size
+        self.memory_limit = None
+        if memory_limit is not None:
+            self._limit_memory(memory_limit)
+        self.spool = spool
+        self.spool_dir = spool_dir
+        self.pipeline = pipeline
+        # io.StageStats for each stage, "read" and "write" are filled by the pipeline
+        self.stats = {"read": None, "encrypt": io.StageStats(), "write": {}}
         self.stream_name = stream_name
         if horcrux_title is None:
             dt = datetime.datetime.today()
@@ -65,15 +162,40 @@ class Stream:
             self.horcrux_title = horcrux_title
         self.outdir = outdir
         self.horcruxes = None
+        self.blobs = []
+        self._blob_digest = hashlib.blake2b(digest_size=32)
+        self.schedule = []  # (data length, holder ids) for each block, for the index
 
         self.block_counter = itertools.count()
         self._round_robin_cycler = None
+        self._created = False  # the horcrux files were made by init_horcruxes
+        self._fed = None  # io.FeedBuffer, once `feed` is called
+        self._feeder = None
+        self._feed_error = None
+
+    def _limit_memory(self, memory_limit):
+        if memory_limit < MIN_MEMORY_LIMIT:
+            raise ValueError(f"Memory limit must be at least {MIN_MEMORY_LIMIT}.")
+        # an eighth of the limit for frames, in and out of the encryption workers
+        in_flight = 2 * (2 * self.workers + 2)
+        self.frame_size = min(self.frame_size, memory_limit // 8 // in_flight)
+        self.memory_limit = memory_limit
 
-    def init_horcruxes(self, streams=None):
-        "Generate and split encryption key and write required headers to horcrux files"
+    def init_horcruxes(self, streams=None, blob_streams=None):
+        """
+        Generate and split encryption key and write required headers to horcrux files.
+
+        blob_streams: streams for the ciphertext blobs of "key-only" horcruxes, blob
+        files are created next to the horcruxes if not given.
+        """
         key = crypto.gen_key()
-        header = self.crypto.init_encrypt(key, default_tag="REKEY")
-        shares = sss.generate_shares(self.n, self.k, key)
+        if self.cipher_mode == "stream":
+            header = self.crypto.init_encrypt(key, default_tag="REKEY")
+        else:
+            header = self.crypto.init_encrypt(key)
+        shares = sss.generate_shares(
+            self.n, self.k, key, self.digest_profile, self.field
+        )
         if self.stream_name:
             encrypted_filename = crypto.SecretBox(key).encrypt(
                 self.stream_name.encode()
@@ -85,18 +207,52 @@ class Stream:
             if len(streams) != self.n:
                 raise ValueError(f"Need {self.n} streams to init.")
             self.horcruxes = io.init_horcrux_streams(
-                streams, shares, header, encrypted_filename
+                streams,
+                shares,
+                header,
+                encrypted_filename,
+                self.cipher_mode,
+                self.distribution,
             )
         else:
+            self._created = True
             self.horcruxes = io.get_horcrux_files(
-                self.horcrux_title, shares, header, self.outdir, encrypted_filename
+                self.horcrux_title,
+                shares,
+                header,
+                self.outdir,
+                encrypted_filename,
+                self.cipher_mode,
+                self.distribution,
+            )
+        if self.distribution != "key-only":
+            return
+        if blob_streams:
+            self.blobs = io.init_blob_streams(blob_streams)
+        else:
+            self._created = True
+            self.blobs = io.get_blob_files(
+                self.horcrux_title, self.outdir, self.blob_copies
             )
 
+    @property
+    def outputs(self):
+        "every horcrux and ciphertext blob being written"
+        return self.horcruxes + self.blobs
+
     def distribute(self, istream=None, size=None, progress=False):
+        """
+        Encrypt the input and write it to the horcruxes. Raises SizeMismatchError if
+        a size was given and the input is longer or shorter, removing the horcrux files
+        it created (streams passed to init_horcruxes are left to the caller).
+        """
         if not self.horcruxes:
             raise FileNotFoundError("Horcruxes not initialized.")
         in_stream = self.in_stream if istream is None else istream
-        size = size if size else self.stream_size
+        size = size if size is not None else self.stream_size
+        if size is None and self.spool and self.distribution == "replicate":
+            with self._spooled(in_stream) as (spooled, size):
+                return self.distribute(spooled, size, progress)
         if size:
             progress_settings = []
         else:
@@ -105,55 +261,315 @@ class Stream:
                 BarColumn(),
                 FileSizeColumn(),
             ]
-        with Progress(*progress_settings, transient=True) as pb:
-            self.pb = pb
-            if size:
-                self.task = pb.add_task("Splitting...", total=size, visible=progress)
-            else:
-                self.task = pb.add_task(
-                    "Splitting...", start=False, total=0, visible=progress
-                )
-            if size is not None:
-                ibs = _ideal_block_size(size, self.n, self.k)
-                if MIN_BLOCK_SIZE <= ibs <= MAX_CHUNK_SIZE:
-                    self._smart_distribute(in_stream, ibs)
-                    return
-            while mv := memoryview(in_stream.read(MAX_CHUNK_SIZE)):
-                chunk_size = len(mv)
-                chunk = io.BytesIO(mv)
-                chunk_ibs = _ideal_block_size(chunk_size, self.n, self.k)
-                if MIN_BLOCK_SIZE <= chunk_ibs:
-                    self._smart_distribute(chunk, chunk_ibs)
-                elif chunk_size < DEFAULT_BLOCK_SIZE:
-                    self._full_distribute(chunk)
+        try:
+            with Progress(*progress_settings, transient=True) as pb:
+                self.pb = pb
+                if size:
+                    self.task = pb.add_task(
+                        "Splitting...", total=size, visible=progress
+                    )
                 else:
-                    self._round_robin_distribute(chunk)
+                    self.task = pb.add_task(
+                        "Splitting...", start=False, total=0, visible=progress
+                    )
+                reader = self._start_pipeline(in_stream) if self.pipeline else None
+                source = reader or in_stream
+                if size is not None:
+                    source = _Sized(source, size)
+                try:
+                    self._distribute(source, size)
+                    if size is not None:
+                        source.check_end()
+                    if self.cipher_mode == "block":
+                        self._distribute_final_block()
+                    digest = self._blob_digest.digest() if self.blobs else None
+                    for h in self.outputs:
+                        h.write_index(self.schedule, digest)
+                except BaseException:
+                    # the outputs' errors would hide this one (and SizeMismatchError's
+                    # cleanup below), so they're dropped
+                    self._finish_outputs(reader, failed=True)
+                    raise
+                self._finish_outputs(reader)
+        except SizeMismatchError:
+            # without an index they'd still combine, to the wrong data
+            self._discard_files()
+            raise
+
+    def feed(self, data):
+        """
+        Push the next piece of the input, to split it as it arrives (an upload, say)
+        instead of reading in_stream. Call `close` after the last piece.
+
+        Frames are encrypted and distributed by a thread of their own as the data comes
+        in, feed only blocks while a bounded buffer (an eighth of memory_limit) is full.
+        bytes are buffered without a copy. Without in_stream_size, memory_limit defaults
+        to FEED_MEMORY_LIMIT so the input is distributed in one continuous schedule.
+        From asyncio, feed from a thread: `await asyncio.to_thread(s.feed, data)`.
+        """
+        if self._fed is None:
+            self._start_feed()
+        if not self._fed.feed(data):
+            self._feeder.join()
+            raise self._feed_error or ValueError("Can't feed a closed split.")
+
+    def close(self):
+        """
+        End input pushed with `feed`, waiting for the rest of it to be distributed and
+        the indexes written. Raises whatever stopped the split, if anything did. The
+        horcrux streams are flushed but left open.
+        """
+        if self._fed is None:
+            self._start_feed()
+        self._fed.finish()
+        self._feeder.join()
+        error, self._feed_error = self._feed_error, None
+        if error is not None:
+            raise error
+
+    def _start_feed(self):
+        if not self.horcruxes:
+            raise FileNotFoundError("Horcruxes not initialized.")
+        if self.stream_size is None and self.memory_limit is None:
+            self._limit_memory(FEED_MEMORY_LIMIT)
+        if self.memory_limit is not None:
+            self._fed = io.FeedBuffer(self.memory_limit // 8)
+        else:
+            self._fed = io.FeedBuffer()
+        self._feeder = threading.Thread(target=self._distribute_fed, daemon=True)
+        self._feeder.start()
+
+    def _distribute_fed(self):
+        try:
+            self.distribute(self._fed, self.stream_size)
+        except BaseException as e:  # raised to the feeding thread
+            self._feed_error = e
+        finally:
+            self._fed.close()
+
+    def _discard_files(self):
+        "close and remove the files init_horcruxes created"
+        if not self._created:
+            return
+        for h in self.outputs:
+            h.stream.close()
+            name = getattr(h.stream, "name", None)
+            if isinstance(name, str):
+                with contextlib.suppress(OSError):
+                    os.remove(name)
+
+    @contextlib.contextmanager
+    def _spooled(self, in_stream):
+        "copy in_stream to a temporary file, yielding it rewound and its size"
+        with tempfile.TemporaryFile(dir=self.spool_dir) as f:
+            size = 0
+            while chunk := in_stream.read(io.READ_AHEAD_CHUNK):
+                f.write(chunk)
+                size += len(chunk)
+            f.seek(0)
+            yield f, size
 
-    def _block_producer(self, chunk, block_size):
-        "produce id'd, encrypted blocks of block_size from chunk"
-        while block := chunk.read(block_size):
+    def _start_pipeline(self, in_stream):
+        "start the read ahead and writer threads, returning the stream to read from"
+        encrypt_stats = self.stats["encrypt"]
+        chunk_size = io.READ_AHEAD_CHUNK
+        queue_bytes = io.WRITER_QUEUE_BYTES
+        if self.memory_limit is not None:
+            # an eighth of the limit reading ahead, a quarter queued for the writers
+            chunk_size = min(chunk_size, self.memory_limit // 8 // io.READ_AHEAD_DEPTH)
+            queue_bytes = self.memory_limit // 4 // len(self.outputs)
+        if isinstance(in_stream, io.FeedBuffer):
+            reader = in_stream  # already buffered, by the threads feeding it
+            reader.consumer_stats = encrypt_stats
+        else:
+            reader = io.ReadAhead(in_stream, chunk_size, consumer_stats=encrypt_stats)
+        self.stats["read"] = reader.stats
+        names = [h.hrcx_id for h in self.horcruxes]
+        names += [f"blob {i + 1}" for i in range(len(self.blobs))]
+        for name, h in zip(names, self.outputs):
+            stats = h.start_writer(producer_stats=encrypt_stats, max_bytes=queue_bytes)
+            self.stats["write"][name] = stats
+        return reader
+
+    def _finish_outputs(self, reader, failed=False):
+        """
+        stop the pipeline started for reader, if any, and flush the outputs. The first
+        error writing them is raised, unless failed (another error is on its way out).
+        """
+        if reader is not None:
+            reader.close()
+        errors = []
+        for h in self.outputs:
             try:
-                self.pb.update(self.task, advance=len(block))
-            except AttributeError:
-                pass
-            yield next(self.block_counter), self.crypto.encrypt(block)
-
-    def _smart_distribute(self, chunk, block_size):
-        "The prefered distribution method. Chunk must be math.comb(n, n-k+1) blocks long."
-        if math.comb(len(self.horcruxes), self.n - self.k + 1) > 3000:
-            distribution = itertools.combinations(self.horcruxes, self.n - self.k + 1)
+                if reader is not None:
+                    h.stop_writer()
+                h.flush()
+            except Exception as e:
+                errors.append(e)
+        if errors and not failed:
+            raise errors[0]
+
+    def _distribute(self, in_stream, size):
+        if self.distribution == "erasure":
+            self._erasure_distribute(in_stream)
+            return
+        if self.distribution == "key-only":
+            self._blob_distribute(in_stream)
+            return
+        if size is None and self.memory_limit is not None:
+            self._stream_distribute(in_stream)
+            return
+        if size is not None:
+            ibs = _ideal_block_size(size, self.n, self.k)
+            if MIN_BLOCK_SIZE <= ibs:
+                self._smart_distribute(in_stream, ibs)
+                return
+        while mv := memoryview(in_stream.read(MAX_CHUNK_SIZE)):
+            chunk_size = len(mv)
+            chunk = io.BytesIO(mv)
+            chunk_ibs = _ideal_block_size(chunk_size, self.n, self.k)
+            if MIN_BLOCK_SIZE <= chunk_ibs:
+                self._smart_distribute(chunk, chunk_ibs)
+            elif chunk_size < DEFAULT_BLOCK_SIZE:
+                self._full_distribute(chunk)
+            else:
+                self._round_robin_distribute(chunk)
+
+    def _stream_distribute(self, in_stream):
+        """
+        distribute a stream of unknown size within memory_limit. The group size comes
+        from a look ahead of a quarter of the limit, then the groups are dealt to the
+        combinations of horcruxes in one schedule running to the end of the stream.
+        """
+        look_ahead = self.memory_limit // 4
+        head = in_stream.read(look_ahead)
+        if len(head) < look_ahead:  # it all fit, so the size is known after all
+            self._distribute(io.BytesIO(head), len(head))
+            return
+        stream = _Chained(head, in_stream)
+        del head
+        group_size = _ideal_block_size(look_ahead, self.n, self.k)
+        if group_size < MIN_BLOCK_SIZE:
+            self._round_robin_distribute(stream)
+        else:
+            self._smart_distribute(stream, group_size, repeat=True)
+
+    def _frames(self, chunk, group_size):
+        "yield (group, frame) cutting each group_size range of chunk into frames"
+        for group in itertools.count():
+            remaining = group_size
+            while remaining:
+                frame = chunk.read(min(remaining, self.frame_size))
+                if not frame:
+                    return
+                try:
+                    self.pb.update(self.task, advance=len(frame))
+                except AttributeError:
+                    pass
+                remaining -= len(frame)
+                yield group, frame
+
+    def _block_producer(self, chunk, group_size):
+        """
+        produce (group, block id, encrypted block) from chunk. Each group_size range of
+        chunk is a group, encrypted as blocks of at most frame_size.
+        """
+        if self.cipher_mode == "block":
+            yield from self._parallel_block_producer(chunk, group_size)
+            return
+        for group, frame in self._frames(chunk, group_size):
+            block_id = next(self.block_counter)
+            yield group, block_id, self._encrypt(block_id, frame)
+
+    def _parallel_block_producer(self, chunk, group_size):
+        "_block_producer for block mode, blocks are sealed by a pool of worker threads"
+        pending = deque()
+        with ThreadPoolExecutor(self.workers) as pool:
+            for group, frame in self._frames(chunk, group_size):
+                block_id = next(self.block_counter)
+                sealed = pool.submit(self._encrypt, block_id, frame)
+                pending.append((group, block_id, sealed))
+                # keep a bounded number of blocks in flight
+                if len(pending) > self.workers * 2:
+                    group, block_id, sealed = pending.popleft()
+                    yield group, block_id, sealed.result()
+            while pending:
+                group, block_id, sealed = pending.popleft()
+                yield group, block_id, sealed.result()
+
+    def _encrypt(self, block_id, block):
+        "encrypt a block, adding the time to stats (summed over workers in block mode)"
+        start = time.perf_counter()
+        if self.cipher_mode == "block":
+            sealed = self.crypto.encrypt(block_id, block)
         else:
+            sealed = self.crypto.encrypt(block)
+        self.stats["encrypt"]._worked(time.perf_counter() - start)
+        return sealed
+
+    def _distribute_final_block(self):
+        "block mode streams end with an empty final block in every horcrux"
+        block_id = next(self.block_counter)
+        sealed = self.crypto.encrypt(block_id, b"", final=True)
+        if self.distribution == "erasure":
+            self._distribute_stripe(block_id, sealed)
+        elif self.distribution == "key-only":
+            self._distribute_blob_block(block_id, sealed)
+        else:
+            self._distribute_block(self.horcruxes, block_id, sealed)
+
+    def _distribute_block(self, receivers, block_id, block):
+        "write a block to receivers and note it in the distribution schedule"
+        io.distribute_block(receivers, block_id, block)
+        self.schedule.append((len(block), tuple(h.hrcx_id for h in receivers)))
+
+    def _erasure_distribute(self, in_stream):
+        "erasure code each encrypted frame over every horcrux"
+        for _, block_id, block in self._block_producer(in_stream, self.frame_size):
+            self._distribute_stripe(block_id, block)
 
-            def rand_distribute():
-                combs = set(itertools.combinations(self.horcruxes, self.n - self.k + 1))
-                while combs: 
-                    yield combs.pop()
+    def _distribute_stripe(self, block_id, block):
+        "write a fragment of block to each horcrux, its share x is the fragment's index"
+        fragments = erasure.encode(block, self.k, self.n)
+        for h in self.horcruxes:
+            io.distribute_block([h], block_id, fragments[h.hrcx_id])
+        holders = tuple(h.hrcx_id for h in self.horcruxes)
+        self.schedule.append((len(fragments[0]), holders))
+
+    def _blob_distribute(self, in_stream):
+        "write every encrypted frame to the ciphertext blobs"
+        for _, block_id, block in self._block_producer(in_stream, self.frame_size):
+            self._distribute_blob_block(block_id, block)
+
+    def _distribute_blob_block(self, block_id, block):
+        "write a block to each blob, key-only horcruxes hold none"
+        io.distribute_block(self.blobs, block_id, block)
+        self._blob_digest.update(len(block).to_bytes(8, "big"))
+        self._blob_digest.update(block)
+        self.schedule.append((len(block), ()))
 
-            distribution = rand_distribute()
-        for block_id, block in self._block_producer(chunk, block_size):
-            for h in next(distribution):
-                h.write_data_block(block_id, block)
+    def _combinations(self):
+        "each combination of n-k+1 horcruxes once, shuffled unless there are many"
+        return combinations(self.horcruxes, self.n - self.k + 1)
 
+    def _smart_distribute(self, chunk, block_size, repeat=False):
+        """
+        The prefered distribution method. Chunk must be math.comb(n, n-k+1) blocks long,
+        or any length with repeat, which cycles through the combinations again.
+        """
+        if repeat:
+            passes = (self._combinations() for _ in itertools.count())
+            distribution = itertools.chain.from_iterable(passes)
+        else:
+            distribution = self._combinations()
+        current = None
+        for group, block_id, block in self._block_producer(chunk, block_size):
+            if group != current:  # every frame of a group goes to the same horcruxes
+                current, receivers = group, next(distribution)
+            self._distribute_block(receivers, block_id, block)
+
+        if repeat:
+            return
         # Sanity Check
         try:
             next(distribution)
@@ -175,13 +591,74 @@ class Stream:
             self._round_robin_cycler = cycle
         else:
             cycle = self._round_robin_cycler
-        for block_id, block in self._block_producer(chunk, block_size):
-            for i in next(cycle):
-                self.horcruxes[i].write_data_block(block_id, block)
+        current = None
+        for group, block_id, block in self._block_producer(chunk, block_size):
+            if group != current:
+                current = group
+                receivers = [self.horcruxes[i] for i in next(cycle)]
+            self._distribute_block(receivers, block_id, block)
 
     def _full_distribute(self, chunk):
         "distribute single chunk to all horcruxes"
-        ciphertext = self.crypto.encrypt(chunk.read())
         block_id = next(self.block_counter)
-        for h in self.horcruxes:
-            h.write_data_block(block_id, ciphertext)
+        ciphertext = self._encrypt(block_id, chunk.read())
+        self._distribute_block(self.horcruxes, block_id, ciphertext)
+
+
+def combinations(items, r):
+    "each combination of r of items once, shuffled unless there are many"
+    if math.comb(len(items), r) > 3000:
+        return itertools.combinations(items, r)
+
+    def rand_distribute():
+        combs = set(itertools.combinations(items, r))
+        while combs:
+            yield combs.pop()
+
+    return rand_distribute()
+
+
+class _Chained:
+    "read head, then the rest of stream, letting go of head once it has been read"
+
+    def __init__(self, head, stream):
+        self._head = io.BytesIO(head)
+        self.stream = stream
+
+    def read(self, size):
+        if self._head is None:
+            return self.stream.read(size)
+        data = self._head.read(size)
+        if len(data) < size:
+            self._head = None
+            data += self.stream.read(size - len(data))
+        return data
+
+
+class _Sized:
+    "read exactly size bytes of stream, raising SizeMismatchError if it has more or less"
+
+    def __init__(self, stream, size):
+        self.stream = stream
+        self.remaining = size
+        self.size = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size)
+        while len(data) < size:
+            more = self.stream.read(size - len(data))
+            if not more:
+                read = self.size - self.remaining + len(data)
+                raise SizeMismatchError(
+                    f"Input ended after {read} bytes, expected {self.size}."
+                )
+            data = b"".join((data, more))
+        self.remaining -= len(data)
+        return data
+
+    def check_end(self):
+        "raise SizeMismatchError if the stream goes on past size"
+        if self.remaining or self.stream.read(1):
+            raise SizeMismatchError(f"Input is longer than {self.size} bytes.")
@@ -10,24 +10,73 @@ co-effieients. This allows us to ALSO place a checksum as one of our points givi
 way to determine if the secret was successfully recovered.
 
 curve generation:
-    1. choose points where f(255) == secret & f(254) == digest(secret) and threshold-2 
-    other random points. 
+    1. choose points where f(255) == secret & f(254) == digest(secret) and threshold-2
+    other random points.
 
     2. construct the curve going through those points, and then distribute shares
     from that curve.
+
+In the prime field step 1 draws the threshold-2 highest order co-efficients at random
+instead and solves for the two lowest so the curve passes through the secret and digest
+points. Every curve through those two points is still equally likely, but generation
+never has to interpolate.
+
+With more than 253 shares the secret and digest move to the "wide" index space, x = -1
+and x = -2 (mod PRIME), so shares can use every index from 0 up.
+
+The field the curve lives in is pluggable (FIELDS): the original 256 bit prime field, or
+SLIP-0039's GF(2^8) applied byte-wise to the secret.
 """
 
+import logging
 from typing import List, Tuple, Sequence
-from nacl.pwhash import argon2id
+from functools import lru_cache
+from operator import mul
+from collections import defaultdict
+from nacl.pwhash import argon2id, argon2i
 from nacl.utils import random  # cryptographically strong random function
 from collections import namedtuple
 
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from . import bigmod, gf256
+
 Point = namedtuple("Point", "X Y")
-Share = namedtuple("Share", "id threshold point")
+# profile None means the share predates digest profiles and uses DEFAULT_PROFILE
+Share = namedtuple(
+    "Share",
+    "id threshold point profile field index_space",
+    defaults=(None, "prime", "legacy"),
+)
+DigestProfile = namedtuple("DigestProfile", "algorithm opslimit memlimit")
 # largest 256 bit prime, this will be our finite field
 PRIME = 2 ** 256 - 189
 DIGEST_INDEX = 254
 SECRET_INDEX = 255
+# (digest x, secret x) for each share index space
+INDEX_SPACES = {
+    "legacy": (DIGEST_INDEX, SECRET_INDEX),
+    "wide": (PRIME - 2, PRIME - 1),
+}
+MAX_LEGACY_SHARES = DIGEST_INDEX - 1
+MAX_DECODE_POINTS = 256
+CONSISTENCY_CHECK_POINTS = 16
+
+# Digest cost presets, interactive/moderate/sensitive mirror libsodium's argon2id
+# settings. fast is the minimum argon2id allows and is meant for tests.
+PROFILES = {
+    "interactive": DigestProfile("argon2id", 2, 67108864),
+    "moderate": DigestProfile("argon2id", 3, 268435456),
+    "sensitive": DigestProfile("argon2id", 4, 1073741824),
+    "fast": DigestProfile("argon2id", 1, 8192),
+}
+DEFAULT_PROFILE = PROFILES["interactive"]
+ALGORITHMS = {"argon2id": argon2id, "argon2i": argon2i}
+
+log = logging.getLogger(__name__)
 
 
 class IdMissMatch(Exception):
@@ -42,15 +91,133 @@ class InvalidDigest(Exception):
     pass
 
 
-def generate_shares(shares: int, threshold: int, secret: bytes) -> List[Share]:
-    "split a secret into n shares where threshold shares are required to recover it."
+def generate_shares(
+    shares: int,
+    threshold: int,
+    secret: bytes,
+    profile: DigestProfile = DEFAULT_PROFILE,
+    field: str = "prime",
+    index_space: str = None,
+) -> List[Share]:
+    """
+    split a secret into n shares where threshold shares are required to recover it.
+
+    profile sets the cost of the digest used to verify recovery and field picks the
+    finite field backend from FIELDS. index_space (from INDEX_SPACES) defaults to
+    "legacy" for up to MAX_LEGACY_SHARES shares and "wide" above that. All three are
+    recorded in every share.
+    """
+    if index_space is None:
+        index_space = "legacy" if shares <= MAX_LEGACY_SHARES else "wide"
     salt = random(16)
-    pts = _split_secret(shares, threshold, secret, salt)
-    return [Share(salt, threshold, p) for p in pts]
+    pts = _split_secret(shares, threshold, secret, salt, profile, field, index_space)
+    return [Share(salt, threshold, p, profile, field, index_space) for p in pts]
 
 
 def combine_shares(shares: Sequence[Share]) -> bytes:
     "combine shares of some distributed secret to recover it."
+    pts = _usable_points(shares)
+    s = shares[0]
+    return _recover_secret(pts, s.id, s.profile, s.field, s.index_space)
+
+
+def extend_shares(
+    shares: Sequence[Share], xs: Sequence[int], check: bool = True
+) -> List[Share]:
+    """
+    new shares of the same secret at xs, evaluated from threshold of shares.
+
+    The secret is only recovered when check is set, to verify shares against the digest
+    first (which costs as much as combine_shares). Unchecked, a bad share goes unnoticed
+    until the new shares are combined.
+    """
+    pts = _usable_points(shares)
+    s = shares[0]
+    digest_x, secret_x = INDEX_SPACES[s.index_space]
+    if not all(0 <= x < digest_x for x in xs):
+        raise ValueError("Share indexes must be below the digest and secret indexes.")
+    if check:
+        _recover_secret(pts, s.id, s.profile, s.field, s.index_space)
+    ys = FIELDS[s.field].recover(pts, tuple(xs))
+    return [
+        Share(s.id, s.threshold, Point(x, y), s.profile, s.field, s.index_space)
+        for x, y in zip(xs, ys)
+    ]
+
+
+def generate_shares_many(
+    secrets: Sequence[bytes],
+    shares: int,
+    threshold: int,
+    profile: DigestProfile = DEFAULT_PROFILE,
+    field: str = "prime",
+    index_space: str = None,
+) -> List[List[Share]]:
+    """
+    generate_shares for a batch of secrets, returning a list of shares for each secret.
+
+    Every secret is shared at the same x values, so the curve structure is set up once
+    and, with NumPy installed, the field arithmetic runs as matrix products across the
+    whole batch (bigmod in the prime field). On batches of 10k secrets, 5 shares
+    threshold 3, that arithmetic measured 2x (prime) and 10x (gf256) faster than single
+    calls, recovery 3x and 18x (benchmarks/sss_batch.py). Each secret still gets its own
+    salt and argon2 digest though, hashed here and again by combine_shares_many to check
+    it, and even with the fast profile that is most of the time, so end to end the batch
+    calls are only about 1.1x faster in the prime field and 1.8x in gf256.
+    """
+    if index_space is None:
+        index_space = "legacy" if shares <= MAX_LEGACY_SHARES else "wide"
+    digest_x, secret_x = INDEX_SPACES[index_space]
+    assert shares < digest_x < secret_x, "Too many shares."
+    assert threshold >= 2, "Can't split secret into less than 2 parts."
+    assert threshold <= shares, "Threshold can't be more than total number of shares."
+    if not secrets:
+        return []
+    salts = [random(16) for _ in secrets]
+    anchors = [
+        [Point(digest_x, hsh(secret, salt, profile)), Point(secret_x, secret)]
+        for secret, salt in zip(secrets, salts)
+    ]
+    ys = FIELDS[field].generate_many(threshold, anchors, range(shares))
+    return [
+        [
+            Share(salt, threshold, Point(i, y), profile, field, index_space)
+            for i, y in enumerate(row)
+        ]
+        for salt, row in zip(salts, ys)
+    ]
+
+
+def combine_shares_many(share_sets: Sequence[Sequence[Share]]) -> List[bytes]:
+    """
+    combine_shares for a batch of share sets, returning the secrets in order.
+
+    Sets that were split with the same settings and are combined from the same x values
+    are recovered together in one pass.
+    """
+    groups = defaultdict(list)
+    for i, shares in enumerate(share_sets):
+        pts = sorted(_usable_points(shares))
+        s = shares[0]
+        xs = tuple(p.X for p in pts)
+        groups[(s.field, s.index_space, xs)].append((i, [p.Y for p in pts]))
+
+    secrets = [None] * len(share_sets)
+    for (field, index_space, xs), members in groups.items():
+        digest_x, secret_x = INDEX_SPACES[index_space]
+        recovered = FIELDS[field].recover_many(
+            xs, [ys for _, ys in members], (secret_x, digest_x)
+        )
+        for (i, _), (secret, digest) in zip(members, recovered):
+            s = share_sets[i][0]
+            if hsh(secret, s.id, s.profile) != digest:
+                raise InvalidDigest(f"Shared secret {i} could not be recovered.")
+            secrets[i] = secret
+    return secrets
+
+
+def _usable_points(shares: Sequence[Share]) -> List[Point]:
+    "check shares belong together and return the points to recover them from"
     pts = {s.point for s in shares}
     salt = shares[0].id
     if not all(s.id == salt for s in shares):
@@ -59,62 +226,370 @@ def combine_shares(shares: Sequence[Share]) -> bytes:
         raise NotEnoughShares(
             "Not enough unique Shares to reach the required threshold."
         )
-    return _recover_secret(pts, salt)
+    if len(pts) > shares[0].threshold:
+        pts = FIELDS[shares[0].field].drop_corrupt(pts, shares[0].threshold)
+    return pts
 
 
 def _split_secret(
-    shares: int, threshold: int, secret: bytes, salt: bytes
+    shares: int,
+    threshold: int,
+    secret: bytes,
+    salt: bytes,
+    profile: DigestProfile = None,
+    field: str = "prime",
+    index_space: str = "legacy",
 ) -> List[Point]:
-    # could technically force skip digest and secret share, but I'm lazy, so hard limit of
-    # 254 total shares. (Digest can't be distributed, because it would mean the
-    # secret could be calculated without any other shares by reversing the digest share)
-    assert shares < DIGEST_INDEX < SECRET_INDEX, "Too many shares."
+    # Shares are handed out from index 0 up, so they have to stay below the digest and
+    # secret points: 253 shares in the legacy index space, effectively unlimited in the
+    # wide one. (Digest can't be distributed, because it would mean the secret could be
+    # calculated without any other shares by reversing the digest share)
+    digest_x, secret_x = INDEX_SPACES[index_space]
+    assert shares < digest_x < secret_x, "Too many shares."
     assert threshold >= 2, "Can't split secret into less than 2 parts."
     assert threshold <= shares, "Threshold can't be more than total number of shares."
-    digest = int.from_bytes(hsh(secret, salt), "big")
-    secret = int.from_bytes(secret, "big")
-    assert secret < PRIME and digest < PRIME, "bad secret"
-
-    def rand_int_32():
-        return int.from_bytes(random(32), "big")
+    backend = FIELDS[field]
+    digest = hsh(secret, salt, profile)
 
     # Threshold determines the order of our polynomial. Secret and Digest points means we
     # require at least a straight line (1st order poly which requires 2 points to define,
     # hence 2 shares). If required threshold is more than 2 we need a polynomial rank 2 or
-    # higher. To do this, we generate more random base_points to get a higher order poly
-    # from our larange interpolation. The fact that if t > 2, some of the shares will also
-    # be base points of our curve doesn't matter (since they'll be the randomly generated
-    # ones). So long as the digest and secret base points aren't distributed, the curve
-    # and thus the secret can't be recovered without the required threshold of distributed
-    # points, whether they are base points or not.
-
-    rand_points = [Point(i, rand_int_32() % PRIME) for i in range(threshold - 2)]
-    base_points = rand_points + [
-        Point(DIGEST_INDEX, digest),
-        Point(SECRET_INDEX, secret),
-    ]
-    return [
-        Point(i, _larange_interpolate(i, base_points).to_bytes(32, "big"))
-        for i in range(shares)
-    ]
-
-
-def _recover_secret(shares: Sequence[Point], salt: bytes) -> bytes:
-    shares = [Point(p.X, int.from_bytes(p.Y, "big")) for p in shares]
-    secret = _larange_interpolate(SECRET_INDEX, shares).to_bytes(32, "big")
+    # higher. To do this, the field backend generates more random base_points (or random
+    # co-efficients) to get a higher order poly. The fact that if t > 2, some of the
+    # shares will also be base points of our curve doesn't matter (since they'll be the
+    # randomly generated ones). So long as the digest and secret base points aren't
+    # distributed, the curve and thus the secret can't be recovered without the required
+    # threshold of distributed points, whether they are base points or not.
+
+    anchors = [Point(digest_x, digest), Point(secret_x, secret)]
+    ys = backend.generate(threshold, anchors, range(shares))
+    return [Point(i, y) for i, y in enumerate(ys)]
+
+
+def _recover_secret(
+    shares: Sequence[Point],
+    salt: bytes,
+    profile: DigestProfile = None,
+    field: str = "prime",
+    index_space: str = "legacy",
+) -> bytes:
+    digest_x, secret_x = INDEX_SPACES[index_space]
     # Check digest point to ensure secret has been correctly recovered
-    digest = _larange_interpolate(DIGEST_INDEX, shares).to_bytes(32, "big")
-    if hsh(secret, salt) != digest:
+    secret, digest = FIELDS[field].recover(shares, (secret_x, digest_x))
+    if hsh(secret, salt, profile) != digest:
         raise InvalidDigest("Shared secret could not be recovered.")
     return secret
 
 
-def hsh(secret, salt):
-    "our digest function, salt must be distributed with shares"
-    # Settings from nacl argon2id interactive settings
-    ops = 2
-    mem = 67108864
-    return argon2id.kdf(32, secret, salt, ops, mem)
+class PrimeField:
+    """
+    the original horcrux field, ints mod PRIME. Batches use bigmod when NumPy is
+    installed, python big ints otherwise.
+    """
+
+    @staticmethod
+    def generate(
+        threshold: int, anchors: Sequence[Point], xs: Sequence[int]
+    ) -> List[bytes]:
+        "evaluate a random threshold-1 order curve through anchors at every x in xs"
+        pts = [Point(p.X, int.from_bytes(p.Y, "big")) for p in anchors]
+        assert all(p.Y < PRIME for p in pts), "bad secret"
+        coefficients = _anchored_coefficients(threshold, pts)
+        # Every share is a cheap Horner evaluation instead of a larange interpolation.
+        return [_horner(coefficients, x).to_bytes(32, "big") for x in xs]
+
+    @staticmethod
+    def recover(points: Sequence[Point], targets: Tuple[int, ...]) -> List[bytes]:
+        "evaluate the curve through points at a few targets"
+        points = sorted(points)
+        xs = tuple(p.X for p in points)
+        ys = [int.from_bytes(p.Y, "big") for p in points]
+        # Every target comes from the same (cached) weights for this set of x values
+        return [
+            _dot(coeffs, ys).to_bytes(32, "big")
+            for coeffs in _lagrange_coefficients(xs, targets)
+        ]
+
+    @staticmethod
+    def generate_many(
+        threshold: int, anchor_sets: Sequence[Sequence[Point]], xs: Sequence[int]
+    ) -> List[List[bytes]]:
+        "generate for a batch of anchor sets that all share the same x values"
+        p = PRIME
+        (xa, _), (xb, _) = anchor_sets[0]
+        ya = [int.from_bytes(a[0].Y, "big") for a in anchor_sets]
+        yb = [int.from_bytes(a[1].Y, "big") for a in anchor_sets]
+        assert all(y < PRIME for y in ya + yb), "bad secret"
+        batch = len(anchor_sets)
+        if np is not None:
+            return _generate_many_np(threshold, xa, xb, ya, yb, xs)
+        # Same construction as _anchored_coefficients, one column per secret
+        high = [
+            [int.from_bytes(random(32), "big") % p for _ in range(batch)]
+            for _ in range(threshold - 2)
+        ]
+        powers = [[pow(x, j, p) for j in range(2, threshold)] for x in (xa, xb)]
+        ga, gb = _matmul_mod(powers, high) if high else ([0] * batch, [0] * batch)
+        inv = _divmod(1, xb - xa, p)
+        # solve for the two lowest coefficients so each curve hits its anchors
+        ra = [(y - g) % p for y, g in zip(ya, ga)]
+        rb = [(y - g) % p for y, g in zip(yb, gb)]
+        slope = [(b - a) * inv % p for a, b in zip(ra, rb)]
+        const = [(a - m * xa) % p for a, m in zip(ra, slope)]
+        vandermonde = [[pow(x, j, p) for j in range(threshold)] for x in xs]
+        ys = _matmul_mod(vandermonde, [const, slope] + high)
+        return [[y.to_bytes(32, "big") for y in col] for col in zip(*ys)]
+
+    @staticmethod
+    def recover_many(
+        xs: Tuple[int, ...], y_sets: Sequence[Sequence[bytes]], targets: Tuple[int, ...]
+    ) -> List[List[bytes]]:
+        "recover for a batch of y value sets that all share the same (sorted) xs"
+        coefficients = _lagrange_coefficients(xs, targets)
+        if np is not None and all(len(y) == 32 for ys in y_sets for y in ys):
+            return _recover_many_np(coefficients, y_sets)
+        ys = [[int.from_bytes(y, "big") for y in col] for col in zip(*y_sets)]
+        values = _matmul_mod(coefficients, ys)
+        return [[v.to_bytes(32, "big") for v in col] for col in zip(*values)]
+
+    @staticmethod
+    def drop_corrupt(points: Sequence[Point], threshold: int) -> List[Point]:
+        return _drop_corrupt_points(points, threshold)
+
+
+class GF256Field:
+    """
+    SLIP-0039 style GF(2^8) field, each byte of a secret is shared independently with
+    the same larange scalars, see gf256.
+    """
+
+    @staticmethod
+    def generate(
+        threshold: int, anchors: Sequence[Point], xs: Sequence[int]
+    ) -> List[bytes]:
+        "evaluate the curve through anchors and threshold-2 random points at xs"
+        assert all(0 <= p.X < 256 for p in anchors), "GF(256) needs legacy indexes."
+        size = len(anchors[0].Y)
+        base_points = [Point(i, random(size)) for i in range(threshold - 2)]
+        return GF256Field.recover(base_points + list(anchors), xs)
+
+    @staticmethod
+    def recover(points: Sequence[Point], xs: Sequence[int]) -> List[bytes]:
+        "evaluate the curve through points at every x in xs"
+        assert all(0 <= x < 256 for x in xs), "GF(256) x values must be bytes."
+        scalars = gf256.lagrange_scalars([p.X for p in points], xs)
+        return gf256.combine(scalars, [p.Y for p in points])
+
+    @staticmethod
+    def generate_many(
+        threshold: int, anchor_sets: Sequence[Sequence[Point]], xs: Sequence[int]
+    ) -> List[List[bytes]]:
+        """
+        generate for a batch of anchor sets that all share the same x values.
+
+        Being byte-wise, a batch is just one long secret: concatenate, share, and slice.
+        """
+        joined = [
+            Point(a.X, b"".join(anchors[i].Y for anchors in anchor_sets))
+            for i, a in enumerate(anchor_sets[0])
+        ]
+        ys = GF256Field.generate(threshold, joined, xs)
+        return _slice_batch(ys, len(anchor_sets))
+
+    @staticmethod
+    def recover_many(
+        xs: Tuple[int, ...], y_sets: Sequence[Sequence[bytes]], targets: Tuple[int, ...]
+    ) -> List[List[bytes]]:
+        "recover for a batch of y value sets that all share the same xs"
+        joined = [Point(x, b"".join(col)) for x, col in zip(xs, zip(*y_sets))]
+        return _slice_batch(GF256Field.recover(joined, targets), len(y_sets))
+
+    @staticmethod
+    def drop_corrupt(points: Sequence[Point], threshold: int) -> List[Point]:
+        "corrupt share detection isn't supported, the digest check catches them"
+        return sorted(points)
+
+
+FIELDS = {"prime": PrimeField, "gf256": GF256Field}
+
+
+def _slice_batch(joined: Sequence[bytes], batch: int) -> List[List[bytes]]:
+    "split each concatenated value back up, returning one list of values per item"
+    size = len(joined[0]) // batch
+    return [[v[i * size : (i + 1) * size] for v in joined] for i in range(batch)]
+
+
+def _matmul_mod(a, b, p=PRIME):
+    """
+    a (m x k) @ b (k x n) mod p on python ints.
+
+    The values are 256 bit, too wide for NumPy's integer types, so this is the fallback
+    for when bigmod (which splits them into limbs) can't be used.
+    """
+    cols = list(zip(*b))
+    return [[sum(map(mul, row, col)) % p for col in cols] for row in a]
+
+
+def _generate_many_np(threshold, xa, xb, ya, yb, xs):
+    "PrimeField.generate_many with every column of the batch done at once by bigmod"
+    p = PRIME
+    batch = len(ya)
+    anchors = bigmod.int_limbs(ya + yb).reshape(bigmod.LIMBS, 2, batch)
+    high = bigmod.to_limbs(random(32 * batch * (threshold - 2)))
+    high = bigmod.reduce(high, p).reshape(bigmod.LIMBS, threshold - 2, batch)
+    if threshold > 2:
+        powers = [[pow(x, j, p) for j in range(2, threshold)] for x in (xa, xb)]
+        fitted = bigmod.matmul_mod(powers, high, p)
+    else:
+        fitted = np.zeros_like(anchors)
+    # solve for the two lowest coefficients so each curve hits its anchors, as
+    # _anchored_coefficients does; subtracting is adding p - 1 times
+    stacked = np.concatenate([anchors, fitted], axis=1)
+    rest = bigmod.matmul_mod([[1, 0, p - 1, 0], [0, 1, 0, p - 1]], stacked, p)
+    inv = _divmod(1, xb - xa, p) % p
+    slope = bigmod.matmul_mod([[p - inv, inv]], rest, p)
+    stacked = np.concatenate([rest[:, :1], slope], axis=1)
+    const = bigmod.matmul_mod([[1, (p - xa) % p]], stacked, p)
+    vandermonde = [[pow(x, j, p) for j in range(threshold)] for x in xs]
+    coefficients = np.concatenate([const, slope, high], axis=1)
+    ys = bigmod.matmul_mod(vandermonde, coefficients, p)
+    return _split_values(bigmod.from_limbs(ys.transpose(0, 2, 1)), batch)
+
+
+def _recover_many_np(coefficients, y_sets):
+    "PrimeField.recover_many with every set of the batch done at once by bigmod"
+    ys = bigmod.to_limbs(b"".join(y for ys in y_sets for y in ys))
+    ys = ys.reshape(bigmod.LIMBS, len(y_sets), -1).transpose(0, 2, 1)
+    values = bigmod.matmul_mod(coefficients, ys, PRIME)
+    return _split_values(bigmod.from_limbs(values.transpose(0, 2, 1)), len(y_sets))
+
+
+def _split_values(joined: bytes, batch: int) -> List[List[bytes]]:
+    "cut batch rows of concatenated 32 byte values back into lists of values"
+    values = [joined[i : i + 32] for i in range(0, len(joined), 32)]
+    width = len(values) // batch
+    return [values[i * width : (i + 1) * width] for i in range(batch)]
+
+
+def _drop_corrupt_points(points: Sequence[Point], threshold: int) -> List[Point]:
+    """
+    Use the redundancy of having more than threshold points to find and drop points that
+    don't lie on the curve, without any digest checks.
+
+    The curve through the first threshold points is checked against some of the rest
+    first, if they all agree only those threshold points are returned. If any disagree
+    the curve is recovered with Berlekamp-Welch decoding, which corrects up to
+    (len(points) - threshold) // 2 bad points. If decoding fails (or there are more than
+    MAX_DECODE_POINTS points, decoding is cubic) the points are returned untouched and
+    the digest check will have the final word.
+    """
+    points = sorted(points)
+    ints = [Point(pt.X, int.from_bytes(pt.Y, "big")) for pt in points]
+    xs = tuple(pt.X for pt in ints[:threshold])
+    ys = [pt.Y for pt in ints[:threshold]]
+    # Only the first threshold points get used, a wrong one among them would throw off
+    # every other point, so a handful of extra points is plenty to check against.
+    extra = ints[threshold : threshold + CONSISTENCY_CHECK_POINTS]
+    predicted = _lagrange_coefficients(xs, tuple(pt.X for pt in extra))
+    if all(_dot(coeffs, ys) == pt.Y for coeffs, pt in zip(predicted, extra)):
+        return points[:threshold]  # all consistent, any threshold of them will do
+    if len(points) > MAX_DECODE_POINTS:
+        return points
+    coefficients = _berlekamp_welch(ints, threshold)
+    if coefficients is None:
+        return points
+    good = [
+        pt for pt, i_pt in zip(points, ints) if _horner(coefficients, i_pt.X) == i_pt.Y
+    ]
+    if len(points) - len(good) > (len(points) - threshold) // 2:
+        return points
+    for pt in points:
+        if pt not in good:
+            log.warning("Share %d does not lie on the curve, ignoring it.", pt.X + 1)
+    return good
+
+
+def _berlekamp_welch(points: Sequence[Point], threshold: int):
+    """
+    return the coefficients of the polynomial of order < threshold that passes through
+    all but at most (len(points) - threshold) // 2 of points, or None if there isn't
+    one.
+
+    Solves Q(x_i) == y_i * E(x_i) for every point, where E is the monic error locator of
+    order e and Q = f * E, then f = Q / E.
+    """
+    p = PRIME
+    k = threshold
+    e = (len(points) - k) // 2
+    rows = []
+    for x, y in points:
+        powers = [1]
+        for _ in range(k + e):
+            powers.append(powers[-1] * x % p)
+        rows.append(
+            powers[: k + e] + [-y * xp % p for xp in powers[:e]] + [y * powers[e] % p]
+        )
+    solution = _solve_mod(rows, k + 2 * e, p)
+    if solution is None:
+        return None
+    quotient, remainder = _poly_divmod_monic(solution[: k + e], solution[k + e :] + [1])
+    if any(remainder) or any(quotient[k:]):
+        return None
+    return quotient[:k]
+
+
+def _solve_mod(rows, unknowns, p):
+    "solve an augmented linear system mod p, free variables are 0. None if inconsistent"
+    rows = [list(r) for r in rows]
+    pivots = []
+    r = 0
+    for c in range(unknowns):
+        pivot = next((i for i in range(r, len(rows)) if rows[i][c]), None)
+        if pivot is None:
+            continue
+        rows[r], rows[pivot] = rows[pivot], rows[r]
+        inv = pow(rows[r][c], p - 2, p)
+        rows[r] = [v * inv % p for v in rows[r]]
+        for i in range(len(rows)):
+            if i != r and rows[i][c]:
+                f = rows[i][c]
+                rows[i] = [(a - f * b) % p for a, b in zip(rows[i], rows[r])]
+        pivots.append(c)
+        r += 1
+    if any(row[-1] for row in rows[r:]):
+        return None
+    solution = [0] * unknowns
+    for i, c in enumerate(pivots):
+        solution[c] = rows[i][-1]
+    return solution
+
+
+def _poly_divmod_monic(num, den):
+    "divide polynomials (constant term first) mod PRIME, den must be monic"
+    p = PRIME
+    num = list(num)
+    d = len(den) - 1
+    quotient = [0] * max(len(num) - d, 0)
+    for i in range(len(num) - 1, d - 1, -1):
+        c = num[i]
+        quotient[i - d] = c
+        if c:
+            for j in range(d + 1):
+                num[i - d + j] = (num[i - d + j] - c * den[j]) % p
+    return quotient, num[:d]
+
+
+def hsh(secret, salt, profile=None):
+    """
+    our digest function, salt must be distributed with shares.
+
+    profile None uses DEFAULT_PROFILE, the settings horcruxes used before profiles were
+    recorded (nacl argon2id interactive settings).
+    """
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    kdf = ALGORITHMS[profile.algorithm].kdf
+    return kdf(32, secret, salt, profile.opslimit, profile.memlimit)
 
 
 def product(vals):
@@ -135,29 +610,92 @@ def _divmod(num, den, p):
     return num * mod_inverse
 
 
-def _larange_interpolate(x, points):
-    r"""
-    return y value f(x) for x given a poly-curve described by (x,y) points.
-    we interpret the points as points in a finite field described by PRIME.
-    The equation looks like this(latex):
-    f_k(x) = \sum_{i=1}^{m} y_i[k] \prod_{\substack{j=1\\j \neq i}}^{m} \frac{x - x_j}{x_i - x_j}
+def _anchored_coefficients(threshold, anchors):
+    """
+    return the coefficients (constant term first) of a random threshold-1 order
+    polynomial passing through both anchor points.
 
-    https://en.wikipedia.org/wiki/Lagrange_polynomial
+    All but the two lowest coefficients are random, those two are then solved for so
+    the curve hits the anchors.
     """
     p = PRIME
-    k = len(points)
-    xs, ys = [], []
-    for pt in points:
-        xs.append(pt.X)
-        ys.append(pt.Y)
-    assert k == len(set(xs)), "Points must be destinct."
-    nums = []  # numerators
-    dens = []  # denominators calculated individually to prevent float div errors
-    for i in range(k):
-        others = list(xs)
-        cur = others.pop(i)  # current x value
-        nums.append(product(x - o for o in others))
-        dens.append(product(cur - o for o in others))
-    den = product(dens)  # common denominator
-    num = sum([_divmod(nums[i] * den * ys[i] % p, dens[i], p) for i in range(k)])
-    return _divmod(num, den, p) % p
+    (xa, ya), (xb, yb) = anchors
+    coefficients = [0, 0] + [
+        int.from_bytes(random(32), "big") % p for _ in range(threshold - 2)
+    ]
+    # what the random part contributes at each anchor
+    ga, gb = _horner(coefficients, xa), _horner(coefficients, xb)
+    slope = _divmod((yb - gb) - (ya - ga), xb - xa, p) % p
+    coefficients[0] = (ya - ga - slope * xa) % p
+    coefficients[1] = slope
+    return coefficients
+
+
+def _horner(coefficients, x):
+    "evaluate a polynomial, given by its coefficients (constant first), at x mod PRIME"
+    p = PRIME
+    acc = 0
+    for c in reversed(coefficients):
+        acc = (acc * x + c) % p
+    return acc
+
+
+def _batch_inverse(values, p):
+    """
+    return the modular inverses of all values with a single modular inversion.
+
+    Montgomery's trick: invert the running product once and walk it back down,
+    peeling off one value at a time.
+    """
+    prefix = []
+    acc = 1
+    for v in values:
+        prefix.append(acc)
+        acc = acc * v % p
+    inv = pow(acc, p - 2, p)
+    inverses = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        inverses[i] = inv * prefix[i] % p
+        inv = inv * values[i] % p
+    return inverses
+
+
+@lru_cache(maxsize=128)
+def _lagrange_coefficients(xs: Tuple[int, ...], targets: Tuple[int, ...]):
+    """
+    return, for each target x, the larange coefficients l_i(target) over xs so that
+    f(target) == sum(l_i * y_i) mod PRIME.
+
+    Uses the barycentric form l_i(t) = L(t) * w_i / (t - x_i) where L(t) = prod(t - x_j)
+    and w_i = 1 / prod(x_i - x_j). All of the denominators for every target are inverted
+    together in one batch. Results are cached by x-set, so repeated recoveries from the
+    same shares skip straight to the dot product.
+    """
+    p = PRIME
+    k = len(xs)
+    assert k == len(set(x % p for x in xs)), "Points must be destinct."
+    dens = []
+    for i, xi in enumerate(xs):
+        den = 1
+        for j, xj in enumerate(xs):
+            if j != i:
+                den = den * (xi - xj) % p
+        dens.append(den)
+    offsets = [[(t - x) % p for x in xs] for t in targets]
+    misses = [diffs for diffs in offsets if 0 not in diffs]
+    inverses = _batch_inverse(dens + [d for diffs in misses for d in diffs], p)
+    weights, inverses = inverses[:k], iter(inverses[k:])
+
+    result = []
+    for diffs in offsets:
+        if 0 in diffs:  # target is one of the known points
+            result.append(tuple(int(d == 0) for d in diffs))
+            continue
+        big_l = product(diffs) % p
+        result.append(tuple(big_l * w % p * next(inverses) % p for w in weights))
+    return tuple(result)
+
+
+def _dot(coefficients, ys):
+    "sum of coefficients[i] * ys[i] mod PRIME"
+    return sum(c * y for c, y in zip(coefficients, ys)) % PRIME
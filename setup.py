@@ -11,7 +11,7 @@ with open("README.md") as readme_file:
 
 requirements = [
     "pynacl",
-    "protobuf>=3.0.0",
+    "protobuf>=3.20.0",
     "rich",
 ]
 
@@ -45,6 +45,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={"fast": ["numpy"]},
     license="MIT license",
     long_description=readme,
     include_package_data=True,
@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from horcrux import bigmod
+from horcrux.sss import PRIME, _matmul_mod
+
+np = pytest.importorskip('numpy')
+
+
+def values(limbs):
+    data = bigmod.from_limbs(limbs)
+    return [int.from_bytes(data[i:i + 32], 'big') for i in range(0, len(data), 32)]
+
+
+def test_limbs_round_trip():
+    vals = [0, 1, PRIME - 1, 2**256 - 1, random.getrandbits(256)]
+    limbs = bigmod.int_limbs(vals)
+    assert limbs.shape == (bigmod.LIMBS, len(vals))
+    assert values(limbs) == vals
+
+
+def test_reduce():
+    vals = [0, PRIME - 1, PRIME, PRIME + 188, 2**256 - 1]
+    reduced = bigmod.reduce(bigmod.int_limbs(vals), PRIME)
+    assert values(reduced) == [v % PRIME for v in vals]
+    wide = [2**256, PRIME * PRIME - 1, random.getrandbits(511)]
+    limbs = np.array([[v >> (16 * i) & 0xFFFF for v in wide] for i in range(32)])
+    reduced = bigmod.reduce(limbs.astype(np.uint64), PRIME)
+    assert values(reduced) == [v % PRIME for v in wide]
+
+
+@pytest.mark.parametrize('m,k,count', [(1, 1, 3), (5, 3, 100), (40, 40, 7)])
+def test_matmul_mod(m, k, count, monkeypatch):
+    monkeypatch.setattr(bigmod, 'CHUNK', 64)  # several chunks
+    a = [[random.randrange(PRIME) for _ in range(k)] for _ in range(m)]
+    b = [[random.randrange(PRIME) for _ in range(count)] for _ in range(k)]
+    a[0][0] = b[0][0] = PRIME - 1
+    b[-1][-1] = 2**256 - 1
+    limbs = np.stack([bigmod.int_limbs(row) for row in b], axis=1)
+    out = bigmod.matmul_mod(a, limbs, PRIME)
+    assert out.shape == (bigmod.LIMBS, m, count)
+    assert values(out) == [v for row in _matmul_mod(a, b) for v in row]
@@ -1,5 +1,6 @@
 import pytest
 import random
+import io
 import sys
 import rich
 from pathlib import Path
@@ -27,9 +28,14 @@ def test_parse():
     args = cli._parse("split my_file 2 5".split())
     assert args.in_file == "my_file"
     assert args.cmd == "split"
+    assert args.digest_profile == "interactive"
+    args = cli._parse("split my_file 2 5 --digest-profile fast".split())
+    assert args.digest_profile == "fast"
 
 
 def test_parse_combine(tmp_path):
+    args = cli._parse(["combine"] + [f"hx_{i}.hrcx" for i in range(400)])
+    assert len(args.in_files) == 400
     args = cli._resolve_files_combine(
         cli._parse(["combine", "a", "b", "c", "--output", str(tmp_path)])
     )
@@ -43,6 +49,8 @@ def test_parse_combine(tmp_path):
     )
     assert args.output_dir == tmp_path
     assert args.output_filename == "newname.txt"
+    assert args.memory_limit is None
+    assert cli._parse(["combine", "a", "b", "--memory-limit", "8"]).memory_limit == 8
 
 
 def test_resolve_files_split(tmp_path, capfd):
@@ -143,3 +151,131 @@ def test_no_overwrite(tmp_path, capfd, monkeypatch):
     cli.main(args)
     assert prev_file.read_bytes() == b"\xff" * 10000
     assert "overwrite" not in capfd.readouterr()[1].lower()
+
+
+def test_combine_range(tmp_path):
+    my_file = tmp_path / "my_file.txt"
+    original_data = bytes(i % 251 for i in range(100000))
+    my_file.write_bytes(original_data)
+    args = ["split", str(my_file), str(tmp_path / "hx"), "2", "3"]
+    cli.main(args + ["--cipher-mode", "block", "--digest-profile", "fast"])
+    out = tmp_path / "slice.bin"
+    hxs = [str(tmp_path / f"hx_{i}.hrcx") for i in (1, 3)]
+    args = ["combine"] + hxs + ["--output", str(out)]
+    assert cli.main(args + ["--range", "5000:300"]) == 0
+    assert out.read_bytes() == original_data[5000:5300]
+    assert cli.main(args + ["--range", "99000"]) == 2
+    cli.main(args + ["--range", "99000", "--overwrite"])
+    assert out.read_bytes() == original_data[99000:]
+    with pytest.raises(SystemExit):
+        cli._parse(["combine", "a", "b", "--range", "10:x"])
+
+
+def test_split_spread_to(tmp_path, capfd):
+    my_file = tmp_path / "my_file.txt"
+    my_file.write_bytes(bytes(i % 256 for i in range(10000)))
+    disks = [tmp_path / f"disk{i}" for i in range(3)]
+    for d in disks:
+        d.mkdir()
+    args = ["split", str(my_file), str(disks[0] / "hx"), "2", "4", "--stats"]
+    assert cli.main(args + ["--spread-to", str(disks[1]), str(disks[2])]) == 0
+    assert [len(list(d.iterdir())) for d in disks] == [2, 1, 1]
+    assert "encrypt" in capfd.readouterr()[1]
+    hxs = [str(p) for d in disks for p in d.iterdir()]
+    out = tmp_path / "out.txt"
+    cli.main(["combine"] + hxs + ["--output", str(out), "--memory-limit", "1"])
+    assert out.read_bytes() == my_file.read_bytes()
+
+
+def test_split_erasure(tmp_path):
+    my_file = tmp_path / "my_file.txt"
+    my_file.write_bytes(bytes(i % 256 for i in range(10000)))
+    args = ["split", str(my_file), str(tmp_path / "hx"), "3", "5"]
+    assert cli.main(args + ["--distribution", "erasure"]) == 0
+    hxs = sorted(str(p) for p in tmp_path.glob("hx_*.hrcx"))
+    out = tmp_path / "out.txt"
+    cli.main(["combine"] + hxs[1:4] + ["--output", str(out)])
+    assert out.read_bytes() == my_file.read_bytes()
+
+
+def test_split_key_only(tmp_path, capfd):
+    my_file = tmp_path / "my_file.txt"
+    my_file.write_bytes(bytes(i % 256 for i in range(10000)))
+    args = ["split", str(my_file), str(tmp_path / "hx"), "2", "3", "--stats"]
+    assert cli.main(args + ["--distribution", "key-only"]) == 0
+    assert "blob 1" in capfd.readouterr()[1]
+    hxs = sorted(str(p) for p in tmp_path.glob("hx_*.hrcx"))
+    assert all(Path(h).stat().st_size < 1000 for h in hxs)
+    out = tmp_path / "out.txt"
+    blob = str(tmp_path / "hx.blob")
+    cli.main(["combine", hxs[0], hxs[2], blob, "--output", str(out)])
+    assert out.read_bytes() == my_file.read_bytes()
+
+
+def test_split_stdin_spool_and_size(tmp_path, monkeypatch):
+    data = bytes(i % 256 for i in range(10000))
+    for option in (["--spool"], ["--size", str(len(data))]):
+        monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(data)))
+        out_dir = tmp_path / option[0].strip("-")
+        out_dir.mkdir()
+        args = ["split", "-", str(out_dir / "hx"), "2", "3"]
+        assert cli.main(args + option) == 0
+        hxs = sorted(str(p) for p in out_dir.iterdir())
+        out = out_dir.with_suffix(".out")
+        cli.main(["combine", *hxs[:2], "--output", str(out)])
+        assert out.read_bytes() == data
+    for size in ("9000", "11000"):
+        monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(data)))
+        out_dir = tmp_path / f"wrong{size}"
+        out_dir.mkdir()
+        args = ["split", "-", str(out_dir / "hx"), "2", "3", "--size", size]
+        assert cli.main(args) == 1
+        assert not list(out_dir.iterdir())
+
+
+def test_repair(tmp_path, capfd):
+    my_file = tmp_path / "my_file.txt"
+    my_file.write_bytes(bytes(i % 256 for i in range(10000)))
+    assert cli.main(["split", str(my_file), str(tmp_path / "hx"), "2", "3"]) == 0
+    hxs = sorted(tmp_path.glob("hx_*.hrcx"))
+    lost = hxs[1].read_bytes()
+    hxs[1].unlink()
+    assert cli.main(["repair", str(hxs[0]), str(hxs[2]), "--lost", "2"]) == 0
+    assert hxs[1].read_bytes() == lost
+    assert cli.main(["repair", str(hxs[0]), str(hxs[2]), "--lost", "2"]) == 2
+    assert "--overwrite" in capfd.readouterr()[1]
+
+
+def test_reshare(tmp_path):
+    my_file = tmp_path / "my_file.txt"
+    data = bytes(i % 256 for i in range(10000))
+    my_file.write_bytes(data)
+    assert cli.main(["split", str(my_file), str(tmp_path / "hx"), "2", "3"]) == 0
+    old = sorted(tmp_path.glob("hx_*.hrcx"))
+    args = ["reshare", *map(str, old[1:]), "--to", "3", "4", "--title", "new"]
+    assert cli.main(args) == 0
+    new = sorted(tmp_path.glob("new_*.hrcx"))
+    assert len(new) == 4
+    assert cli.main(args) == 2  # they exist now
+    out = tmp_path / "out.txt"
+    assert cli.main(["combine", *map(str, new[1:]), "--output", str(out)]) == 0
+    assert out.read_bytes() == data
+    assert cli.main(["reshare", *map(str, old[:2]), "--to", "2", "3"]) == 0
+    reshared = sorted(tmp_path.glob("hx_reshared_*.hrcx"))
+    assert len(reshared) == 3
+    out = tmp_path / "out_reshared.txt"
+    assert cli.main(["combine", *map(str, reshared[:2]), "--output", str(out)]) == 0
+    assert out.read_bytes() == data
+
+
+def test_combine_reports_corrupt_horcrux(tmp_path, capfd):
+    my_file = tmp_path / "my_file.txt"
+    data = bytes(i % 256 for i in range(10000))
+    my_file.write_bytes(data)
+    assert cli.main(["split", str(my_file), str(tmp_path / "hx"), "2", "3"]) == 0
+    hxs = sorted(tmp_path.glob("hx_*.hrcx"))
+    hxs[0].write_bytes(hxs[0].read_bytes()[:200])
+    out = tmp_path / "out.txt"
+    assert cli.main(["combine", *map(str, hxs), "--output", str(out)]) == 0
+    assert out.read_bytes() == data
+    assert f"warning: {hxs[0]}" in capfd.readouterr()[1]
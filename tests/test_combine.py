@@ -1,6 +1,9 @@
 import pytest
+import asyncio
 import io
 import os
+import tarfile
+import tracemalloc
 
 from horcrux import combine
 from horcrux import split
@@ -42,6 +45,38 @@ def alt_streams():
     return [io.BytesIO(h) for h in ALT], ORIGINAL
 
 
+@pytest.fixture(params=['stream', 'block'])
+def cipher_mode(request):
+    return request.param
+
+
+def split_data(data, n, k, blobs=None, sized=True, push=None, **kwargs):
+    """
+    split data into n in-memory horcruxes with the fast digest profile, returning their
+    bytes. blobs are the streams for a key-only split's ciphertext blobs. push(s, data)
+    feeds the data to split stream s instead of it being read from a stream.
+    """
+    size = len(data) if sized else None
+    in_stream = None if push else io.BytesIO(data)
+    s = split.Stream(in_stream, n, k, size, digest_profile='fast', **kwargs)
+    out = [io.BytesIO() for _ in range(n)]
+    s.init_horcruxes(out, blobs or [io.BytesIO()])
+    if push:
+        push(s, data)
+    else:
+        s.distribute()
+    return [o.getvalue() for o in out]
+
+
+def write_files(tmp_path, hxd):
+    'write horcrux bytes to files, returning their paths'
+    paths = []
+    for i, h in enumerate(hxd):
+        paths.append(tmp_path / f'hx_{i}.hrcx')
+        paths[-1].write_bytes(h)
+    return paths
+
+
 def test_prepare_streams(hx_streams):
     streams, _ = hx_streams
     hxs = combine._prepare_streams(streams)
@@ -89,3 +124,345 @@ def test_cipher_curruption(alt_streams):
     b.seek(0)
     with pytest.raises(combine.crypto.DecryptionError):
         combine.from_streams(streams)
+
+
+def test_from_streams_wide():
+    hxd = split_data(ORIGINAL[:1000], 300, 2, sized=False)
+    picked = [io.BytesIO(hxd[i]) for i in (7, 299)]
+    assert combine.from_streams(picked) == ORIGINAL[:1000]
+
+
+def test_from_streams_block_mode():
+    for sized in (True, False):
+        hxd = split_data(ORIGINAL, 5, 3, sized=sized, cipher_mode='block')
+        for picked in itertools.combinations(hxd, 3):
+            streams = [io.BytesIO(h) for h in picked]
+            assert combine.from_streams(streams, workers=3) == ORIGINAL
+
+
+def test_block_mode_truncation():
+    hxd = split_data(ORIGINAL, 2, 2, sized=False, cipher_mode='block')
+    cut = []
+    for data in hxd:
+        src = combine.io.Horcrux(io.BytesIO(data))
+        src.init_read()
+        hx = combine.io.Horcrux(io.BytesIO())
+        hx.init_write(src.share, src.crypto_header, cipher_mode='block')
+        blocks = []
+        while src.next_block_id is not None:
+            blocks.append(src.read_block())
+        for block_id, block in blocks[:-1]:  # drop the final block
+            hx.write_data_block(block_id, block)
+        cut.append(io.BytesIO(hx.stream.getvalue()))
+    with pytest.raises(combine.DecryptionError) as e:
+        combine.from_streams(cut)
+    assert 'truncated' in str(e.value)
+
+
+def test_read_range_block_mode():
+    data = os.urandom(50000)
+    ranges = [(0, 10), (1234, 5000), (49990, 100), (60000, 5), (7, None), (3, 0)]
+    for sized in (True, False):
+        hxd = split_data(data, 4, 2, sized=sized, cipher_mode='block')
+        for offset, length in ranges:
+            streams = [io.BytesIO(h) for h in hxd[1:3]]
+            end = None if length is None else offset + length
+            got = combine.range_from_streams(streams, offset, length)
+            assert got == data[offset:end]
+
+
+def test_read_range_stream_mode(hx_streams):
+    streams, _ = hx_streams
+    assert combine.range_from_streams(streams, 100, 50) == ORIGINAL[100:150]
+
+
+def test_read_range_files(tmp_path):
+    paths = write_files(tmp_path, split_data(ORIGINAL, 3, 2, cipher_mode='block'))
+    assert combine.read_range(paths[1:], 10, 20) == ORIGINAL[10:30]
+    assert combine.read_range(paths[:2], 0) == ORIGINAL
+
+
+def strip_index(data):
+    'rewrite a horcrux (or blob) the way it was written before index footers'
+    src = combine.io.Horcrux(io.BytesIO(data))
+    hx = combine.io.Horcrux(io.BytesIO())
+    if data.startswith(combine.io.BLOB_FRAME):
+        src.init_blob_read()
+        hx.init_blob_write()
+    else:
+        src.init_read()
+        hx.init_write(
+            src.share,
+            src.crypto_header,
+            src.encrypted_filename,
+            src.cipher_mode,
+            src.distribution,
+        )
+    while src.next_block_id is not None:
+        hx.write_data_block(*src.read_block())
+    return hx.stream.getvalue()
+
+
+def test_from_streams_without_index(hx_streams):
+    streams, original = hx_streams
+    hxs = combine._prepare_streams(streams)
+    assert all(h.load_index() is not None for h in hxs)
+    old = [strip_index(h) for h in HXD]
+    hxs = combine._prepare_streams([io.BytesIO(h) for h in old])
+    assert all(h.load_index() is None for h in hxs)
+    assert combine.from_streams([io.BytesIO(h) for h in old[1:4]]) == original
+    hxd = split_data(ORIGINAL, 3, 2, sized=False, cipher_mode='block')
+    old = [io.BytesIO(strip_index(h)) for h in hxd]
+    assert combine.range_from_streams(old[:2], 5, 10) == ORIGINAL[5:15]
+
+
+def test_ordered_blocks_missing():
+    hxd = split_data(ORIGINAL, 5, 4, sized=False, cipher_mode='block')
+    hxd = [strip_index(h) for h in hxd]
+    hxs = combine._prepare_streams([io.BytesIO(h) for h in hxd[:2]])
+    with pytest.raises(combine.DecryptionError) as e:
+        list(combine._ordered_blocks(hxs)[0])
+    assert 'missing' in str(e.value)
+
+
+def test_erasure_round_trip(cipher_mode):
+    data = os.urandom(1024 * 1024 * 2 + 100)
+    written = split_data(data, 5, 3, cipher_mode=cipher_mode, distribution='erasure')
+    assert sum(map(len, written)) < len(data) * 2  # n/k, replication would be 3x
+    for picked in itertools.combinations(written, 3):
+        assert combine.from_streams([io.BytesIO(b) for b in picked]) == data
+    unindexed = [io.BytesIO(strip_index(b)) for b in written[1:4]]
+    assert combine.from_streams(unindexed) == data
+    streams = [io.BytesIO(b) for b in written[2:]]
+    assert combine.range_from_streams(streams, 1000, 10) == data[1000:1010]
+
+
+def test_erasure_corrupt_fragment():
+    hxd = split_data(os.urandom(1000), 3, 2, distribution='erasure')
+    hx = combine.io.Horcrux(io.BytesIO(hxd[0]))
+    hx.init_read()
+    _, pos, _ = hx.locate_blocks()[0]
+    damaged = bytearray(hxd[0])
+    damaged[pos + 10] ^= 0xFF
+    with pytest.raises(combine.DecryptionError):
+        combine.from_streams([io.BytesIO(bytes(damaged)), io.BytesIO(hxd[1])])
+
+
+def test_key_only_round_trip(cipher_mode):
+    data = os.urandom(1024 * 1024 * 2 + 100)
+    blobs = [io.BytesIO(), io.BytesIO()]
+    hxs = split_data(
+        data, 4, 2, blobs, cipher_mode=cipher_mode, distribution='key-only'
+    )
+    blobs = [b.getvalue() for b in blobs]
+    assert blobs[0] == blobs[1]
+    assert sum(map(len, hxs)) < 1000
+    for picked in itertools.combinations(hxs, 2):
+        streams = [io.BytesIO(h) for h in picked]
+        assert combine.from_streams(streams, blobs=[io.BytesIO(blobs[0])]) == data
+    streams = [io.BytesIO(h) for h in hxs[1:3]]
+    blob = [io.BytesIO(strip_index(blobs[1]))]
+    assert combine.range_from_streams(streams, 5, 10, blobs=blob) == data[5:15]
+
+
+def test_key_only_needs_its_blob():
+    hxs = split_data(b'key only', 3, 2, distribution='key-only')
+    other_blobs = [io.BytesIO()]
+    split_data(b'key only', 3, 2, other_blobs, distribution='key-only')
+    with pytest.raises(combine.DecryptionError):
+        combine.from_streams([io.BytesIO(h) for h in hxs[:2]])
+    with pytest.raises(combine.DecryptionError):
+        streams = [io.BytesIO(h) for h in hxs[:2]]
+        combine.from_streams(streams, blobs=[io.BytesIO(other_blobs[0].getvalue())])
+
+
+def test_small_frames(cipher_mode):
+    data = os.urandom(10000)
+    hxd = split_data(data, 3, 2, cipher_mode=cipher_mode, frame_size=1000)
+    hx = combine.io.Horcrux(io.BytesIO(hxd[0]))
+    hx.init_read()
+    assert all(length <= 1000 + 17 for length, _ in hx.load_index().schedule)
+    for picked in itertools.combinations(hxd, 2):
+        assert combine.from_streams([io.BytesIO(h) for h in picked]) == data
+
+
+def test_failover_corrupt_block(tmp_path, cipher_mode):
+    data = os.urandom(10000)
+    hxd = split_data(data, 5, 3, cipher_mode=cipher_mode, frame_size=1000)
+    paths = write_files(tmp_path, hxd)
+    block_id, source = combine.plan.plan_reads(paths).schedule[3]
+    pos, length = source.blocks[block_id]
+    corrupt = bytearray(source.path.read_bytes())
+    corrupt[pos + length // 2] ^= 1
+    source.path.write_bytes(corrupt)
+
+    out, stats, problems = io.BytesIO(), {}, {}
+    combine.from_files(paths, outfile=out, stats=stats, problems=problems)
+    assert out.getvalue() == data
+    assert list(problems) == [source.path]
+    assert 'Block' in problems[source.path]
+    # only the bad block is read again
+    block_data = sum(length for length, _ in source.horcrux.index.schedule)
+    assert sum(stats.values()) == block_data + length
+
+    problems = {}
+    streams = [open(p, 'rb') for p in paths]
+    assert combine.from_streams(streams, problems=problems) == data
+    assert list(problems) == [source.horcrux.hrcx_id]
+    for st in streams:
+        st.close()
+
+
+def test_failover_blames_the_right_horcrux(tmp_path):
+    paths = write_files(tmp_path, split_data(os.urandom(10000), 5, 3, frame_size=1000))
+    read_plan = combine.plan.plan_reads(paths)
+    block_id, source = read_plan.schedule[3]
+    error = combine.DecryptionError('bad block')
+    h, result = combine._failover(
+        lambda _, ciphertext: ciphertext, source.horcrux, block_id, error, read_plan
+    )
+    assert h is not source.horcrux
+    assert h.hrcx_id in h.index.schedule[block_id][1]
+    with source.open() as f:
+        assert result == source.read(f, block_id)  # the same copy, from h
+    assert error.horcrux_id == source.horcrux.hrcx_id
+    assert list(read_plan.problems) == [source.path]
+
+
+def test_failover_truncated_file(tmp_path):
+    data = os.urandom(10000)
+    paths = write_files(tmp_path, split_data(data, 5, 3, frame_size=1000))
+    source = combine.plan.plan_reads(paths).chosen[0]
+    source.path.write_bytes(source.path.read_bytes()[:3000])
+    out, problems = io.BytesIO(), {}
+    combine.from_files(paths, outfile=out, problems=problems)
+    assert out.getvalue() == data
+    assert 'truncated' in problems[source.path]
+
+
+def test_failover_without_copies(tmp_path):
+    paths = write_files(tmp_path, split_data(os.urandom(10000), 3, 3))
+    block_id, source = combine.plan.plan_reads(paths).schedule[0]
+    pos, length = source.blocks[block_id]
+    corrupt = bytearray(source.path.read_bytes())
+    corrupt[pos + 1] ^= 1
+    source.path.write_bytes(corrupt)
+    problems = {}
+    with pytest.raises(combine.DecryptionError) as e:
+        combine.from_files(paths, outfile=io.BytesIO(), problems=problems)
+    assert e.value.horcrux_id == source.horcrux.hrcx_id
+    assert list(problems) == [source.path]
+
+
+def test_iter_plaintext(cipher_mode):
+    data = os.urandom(10000)
+    hxd = split_data(data, 3, 2, cipher_mode=cipher_mode)
+    blocks = combine.iter_plaintext([io.BytesIO(h) for h in hxd[:2]])
+    assert b''.join(blocks) == data
+    chunks = combine.iter_plaintext([io.BytesIO(h) for h in hxd[1:]], chunk_size=999)
+    received = []
+    for chunk in chunks:
+        assert isinstance(chunk, memoryview)
+        received.append(bytes(chunk))
+    assert [len(c) for c in received[:-1]] == [999] * (len(received) - 1)
+    assert b''.join(received) == data
+
+
+def test_plaintext_reader_tarfile(tmp_path):
+    members = {'a.txt': os.urandom(5000), 'b.bin': os.urandom(20000)}
+    tar_data = io.BytesIO()
+    with tarfile.open(fileobj=tar_data, mode='w') as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    hxd = split_data(tar_data.getvalue(), 3, 2, sized=False, cipher_mode='block')
+    streams = [io.BytesIO(h) for h in hxd[:2]]
+    with combine.PlaintextReader(streams) as f:
+        with tarfile.open(fileobj=f, mode='r|') as tar:
+            for member in tar:
+                assert tar.extractfile(member).read() == members[member.name]
+    assert f.closed
+
+
+def write_large(tmp_path, size, frame_size):
+    "split size random bytes into 2 of 2 block mode horcrux files, return their paths"
+    with open(tmp_path / 'data', 'wb') as f:
+        f.write(os.urandom(size))
+    paths = []
+    with open(tmp_path / 'data', 'rb') as fin:
+        s = split.Stream(
+            fin,
+            2,
+            2,
+            size,
+            digest_profile='fast',
+            cipher_mode='block',
+            frame_size=frame_size,
+            outdir=tmp_path,
+            horcrux_title='hx',
+        )
+        s.init_horcruxes()
+        s.distribute()
+        for h in s.horcruxes:
+            h.stream.close()
+            paths.append(h.stream.name)
+    return paths
+
+
+def test_iter_plaintext_memory(tmp_path):
+    size = 1024 * 1024 * 16
+    paths = write_large(tmp_path, size, 1024 * 64)
+    streams = [open(p, 'rb') for p in paths]
+    tracemalloc.start()
+    try:
+        total = 0
+        for chunk in combine.iter_plaintext(streams, chunk_size=4096, workers=2):
+            total += len(chunk)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        for st in streams:
+            st.close()
+    assert total == size
+    # the prefetched blocks of each horcrux, not the whole plaintext
+    assert peak < size // 4
+
+
+def test_plaintext_reader_memory_limit(tmp_path):
+    size, frame_size = 1024 * 1024 * 16, 1024 * 64
+    paths = write_large(tmp_path, size, frame_size)
+    streams = [open(p, 'rb') for p in paths]
+    tracemalloc.start()
+    try:
+        total = 0
+        with combine.PlaintextReader(streams, workers=1, memory_limit=1) as f:
+            while True:
+                read = len(f.read(4096))
+                if not read:
+                    break
+                total += read
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        for st in streams:
+            st.close()
+    assert total == size
+    # a block queued and one being read per horcrux, and the few being decrypted
+    assert peak < frame_size * 16
+
+
+def test_feed_round_trip(cipher_mode):
+    def upload(s, data):
+        async def handler():
+            for i in range(0, len(data), 8192):
+                await asyncio.to_thread(s.feed, data[i : i + 8192])
+            await asyncio.to_thread(s.close)
+
+        asyncio.run(handler())
+
+    data = os.urandom(300000)
+    hxd = split_data(data, 5, 3, sized=False, push=upload, cipher_mode=cipher_mode)
+    for picked in itertools.combinations(hxd, 3):
+        streams = [io.BytesIO(h) for h in picked]
+        assert b''.join(combine.iter_plaintext(streams)) == data
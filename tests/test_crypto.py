@@ -91,3 +91,36 @@ def test_empty_encrypt(message):
     header = stream.init_encrypt(message.key)
     with pytest.raises(ValueError):
         c1 = stream.encrypt(b'')
+
+
+def test_block_cipher(key):
+    cipher = crypto.BlockCipher()
+    header = cipher.init_encrypt(key)
+    assert len(header) == crypto.BlockCipher.PREFIX_BYTES
+    c0 = cipher.encrypt(0, b'first block')
+    c1 = cipher.encrypt(1, b'', final=True)
+    with pytest.raises(ValueError):
+        cipher.encrypt(2, b'')
+
+    reader = crypto.BlockCipher()
+    reader.init_decrypt(header, key)
+    # blocks can be opened in any order
+    assert reader.decrypt(1, c1) == (b'', True)
+    assert reader.decrypt(0, c0) == (b'first block', False)
+    with pytest.raises(crypto.DecryptionError):
+        reader.decrypt(1, c0)  # reordered
+    with pytest.raises(crypto.DecryptionError):
+        reader.decrypt(0, b'\x01' + c0[1:])  # re-flagged as final
+    with pytest.raises(crypto.DecryptionError):
+        reader.decrypt(0, c0[:5])
+
+
+def test_failed_decrypt_keeps_state(key):
+    stream = crypto.Stream()
+    header = stream.init_encrypt(key)
+    first, second = stream.encrypt(b'first'), stream.encrypt(b'second')
+    stream.init_decrypt(header, key)
+    with pytest.raises(crypto.DecryptionError):
+        stream.decrypt(first[:-1] + bytes([first[-1] ^ 1]))
+    assert stream.decrypt(first) == b'first'
+    assert stream.decrypt(second) == b'second'
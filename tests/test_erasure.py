@@ -0,0 +1,39 @@
+import pytest
+import itertools
+import os
+
+from horcrux import erasure
+
+
+@pytest.mark.parametrize('n,k', [(1, 1), (3, 2), (5, 3), (6, 6), (10, 4)])
+def test_round_trip(n, k):
+    stripe = os.urandom(1001)
+    fragments = erasure.encode(stripe, k, n)
+    assert len(fragments) == n
+    assert len({len(f) for f in fragments}) == 1
+    for xs in itertools.combinations(range(n), k):
+        assert erasure.decode([fragments[x] for x in xs], xs, k) == stripe
+
+
+def test_systematic():
+    stripe = b'0123456789'
+    fragments = erasure.encode(stripe, 2, 4)
+    framed = b''.join(fragments[:2])
+    assert framed[erasure.LENGTH_BYTES : erasure.LENGTH_BYTES + len(stripe)] == stripe
+
+
+def test_empty_stripe():
+    fragments = erasure.encode(b'', 3, 5)
+    assert erasure.decode(fragments[2:], [2, 3, 4], 3) == b''
+
+
+def test_bad_input():
+    with pytest.raises(ValueError):
+        erasure.encode(b'data', 4, 3)
+    with pytest.raises(ValueError):
+        erasure.encode(b'data', 2, erasure.MAX_FRAGMENTS + 1)
+    fragments = erasure.encode(b'data', 2, 3)
+    with pytest.raises(ValueError):
+        erasure.decode(fragments[:1], [0], 2)
+    with pytest.raises(ValueError):
+        erasure.decode([fragments[0], fragments[1][:-1]], [0, 1], 2)
@@ -0,0 +1,50 @@
+import pytest
+import os
+import random
+import tracemalloc
+
+from horcrux import gf256
+
+
+def test_tables():
+    assert sorted(gf256.EXP[:255]) == list(range(1, 256))
+    assert gf256.mul(0x53, 0xCA) == 1  # AES inverse pair
+    for a in range(1, 256):
+        assert gf256.mul(a, gf256.div(1, a)) == 1
+    with pytest.raises(ZeroDivisionError):
+        gf256.div(3, 0)
+
+
+def test_lagrange_scalars():
+    xs = [0, 1, 2]
+    ys = [bytes([random.getrandbits(8) for _ in range(32)]) for _ in xs]
+    more = gf256.combine(gf256.lagrange_scalars(xs, range(10)), ys)
+    assert more[:3] == ys
+    # any three points on the curve give back the originals
+    picked = [4, 7, 9]
+    back = gf256.combine(gf256.lagrange_scalars(picked, xs), [more[i] for i in picked])
+    assert back == ys
+
+
+def test_combine_without_numpy(monkeypatch):
+    xs = [3, 7, 11, 254]
+    ys = [bytes([random.getrandbits(8) for _ in range(32)]) for _ in xs]
+    scalars = gf256.lagrange_scalars(xs, range(20))
+    expected = gf256.combine(scalars, ys)
+    monkeypatch.setattr(gf256, 'np', None)
+    assert gf256.combine(scalars, ys) == expected
+
+
+@pytest.mark.skipif(gf256.np is None, reason='needs numpy')
+def test_combine_memory():
+    xs = list(range(128))
+    ys = [os.urandom(8192) for _ in xs]
+    scalars = gf256.lagrange_scalars(xs, range(128, 160))
+    tracemalloc.start()
+    try:
+        gf256.combine(scalars, ys)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # a few (targets, length) arrays, not one per pair of target and vector
+    assert peak < 32 * 8192 * 8
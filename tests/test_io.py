@@ -1,12 +1,15 @@
 import pytest
 
 import io
+import os
 import random
+import threading
 from copy import deepcopy
 
 from horcrux import io as hio
-from horcrux.hrcx_pb2 import StreamBlock
-from horcrux.sss import Share, Point
+from horcrux.hrcx_pb2 import StreamBlock, BlockID
+from google.protobuf.internal.encoder import _VarintBytes
+from horcrux.sss import Share, Point, DigestProfile
 
 
 @pytest.fixture()
@@ -166,3 +169,265 @@ def test_get_horcrux_files(tmpdir, share):
         h.stream.close()
         with open(h.stream.name, 'rb') as fin:
             assert fin.read() == expected
+
+
+def test_frame_reader_mmap(tmp_path):
+    messages = [b'123', bytes(255 for _ in range(500)), b'', b'x' * 4096]
+    hx = hio.Horcrux(io.BytesIO())
+    for m in messages:
+        hx._write_bytes(m)
+    path = tmp_path / 'frames.hrcx'
+    path.write_bytes(hx.stream.getvalue())
+    with open(path, 'rb') as fin:
+        reader = hio.FrameReader(fin)
+        assert reader._map is not None
+        assert reader.read_message() == messages[0]
+        reader.skip_message()
+        assert reader.read_message() == messages[2]
+        assert reader.read_message() == messages[3]
+        with pytest.raises(IndexError):
+            reader.read_message()
+
+
+def test_frame_reader_pipe():
+    messages = [bytes(random.getrandbits(8) for _ in range(n)) for n in (5, 300, 40)]
+    hx = hio.Horcrux(io.BytesIO())
+    for m in messages * 3:
+        hx._write_bytes(m)
+    r, w = os.pipe()
+    with open(w, 'wb') as fout:
+        fout.write(hx.stream.getvalue())
+    with open(r, 'rb') as fin:
+        reader = hio.FrameReader(fin, buffer_size=64)
+        assert reader._map is None
+        assert reader.read_message() == messages[0]
+        reader.skip_message()
+        for m in messages[2:] + messages * 2:
+            assert reader.read_message() == m
+        with pytest.raises(IndexError):
+            reader.read_message()
+
+
+def test_encode_data_block():
+    for _id, data in ((0, b''), (1, b'my data'), (300, b'x' * 200), (7, b'\x00')):
+        bid = BlockID()
+        bid.id = _id
+        block = StreamBlock()
+        block.data = data
+        expected = b''.join(
+            (
+                _VarintBytes(bid.ByteSize()),
+                bid.SerializeToString(),
+                _VarintBytes(block.ByteSize()),
+                block.SerializeToString(),
+            )
+        )
+        assert b''.join(hio.encode_data_block(_id, data)) == expected
+
+
+def test_distribute_block_file_buffering(tmp_path, share):
+    paths = [tmp_path / f'{i}.hrcx' for i in range(3)]
+    hxs = hio.init_horcrux_streams(
+        [open(p, 'wb') for p in paths], [share] * 3, b'header'
+    )
+    header_size = paths[0].stat().st_size
+    data = [bytes(random.getrandbits(8) for _ in range(100)) for _ in range(50)]
+    for i, d in enumerate(data):
+        hio.distribute_block(hxs[i % 2 :], i, d)
+    assert paths[0].stat().st_size == header_size  # still buffered
+    for h in hxs:
+        h.flush()
+        h.stream.close()
+    for p, expected in zip(paths, (data[::2], data, data)):
+        with open(p, 'rb') as fin:
+            hx = hio.Horcrux(fin)
+            hx.init_read()
+            assert [hx.read_block()[1] for _ in expected] == expected
+            assert hx.next_block_id is None
+
+
+def test_horcrux_digest_profile_round_trip(share):
+    profiled = share._replace(profile=DigestProfile('argon2id', 1, 8192))
+    gf_share = share._replace(field='gf256')
+    wide = share._replace(point=Point(4999, b'123'), index_space='wide')
+    for s in (share, profiled, gf_share, wide):
+        hx = hio.Horcrux(io.BytesIO())
+        hx.init_write(s, b'header')
+        stream = hx.stream
+        stream.seek(0)
+        hx = hio.Horcrux(stream)
+        hx.init_read()
+        assert hx.share == s
+
+
+def test_horcrux_scan_blocks(tmp_path, share):
+    blocks = [(0, b'first'), (2, b''), (5, bytes(300))]
+    buf = io.BytesIO()
+    hx = hio.Horcrux(buf)
+    hx.init_write(share, b'header')
+    for block_id, data in blocks:
+        hx.write_data_block(block_id, data)
+    path = tmp_path / 'hx.hrcx'
+    path.write_bytes(buf.getvalue())
+    for stream in (io.BytesIO(buf.getvalue()), open(path, 'rb')):
+        with stream:
+            hx = hio.Horcrux(stream)
+            hx.init_read()
+            located = list(hx.scan_blocks())
+            assert [b[0] for b in located] == [0, 2, 5]
+            assert [hx.read_at(pos, n) for _, pos, n in located] == [
+                data for _, data in blocks
+            ]
+
+
+def test_horcrux_index_footer(tmp_path, share):
+    buf = io.BytesIO()
+    hx = hio.Horcrux(buf)
+    hx.init_write(share, b'header')
+    hx.write_data_block(0, b'zero')
+    hx.write_data_block(2, b'two!')
+    schedule = [(4, (share.point.X,)), (9, (7, 8)), (4, (share.point.X, 7))]
+    hx.write_index(schedule)
+    path = tmp_path / 'hx.hrcx'
+    path.write_bytes(buf.getvalue())
+    for stream in (io.BytesIO(buf.getvalue()), open(path, 'rb')):
+        with stream:
+            hx = hio.Horcrux(stream)
+            hx.init_read()
+            index = hx.load_index()
+            assert index.schedule == schedule
+            assert [b[0] for b in index.blocks] == [0, 2]
+            # reading position is untouched and blocks end at the index
+            assert hx.read_block() == (0, b'zero')
+            assert hx.read_block() == (2, b'two!')
+            assert hx.next_block_id is None
+            assert [hx.read_at(pos, n) for _, pos, n in index.blocks] == [
+                b'zero',
+                b'two!',
+            ]
+
+
+def test_horcrux_no_index_footer(share):
+    buf = io.BytesIO()
+    hx = hio.Horcrux(buf)
+    hx.init_write(share, b'header')
+    hx.write_data_block(0, b'zero')
+    hx = hio.Horcrux(io.BytesIO(buf.getvalue()))
+    hx.init_read()
+    assert hx.load_index() is None
+    assert hx.locate_blocks()[0][0] == 0
+    hx = hio.Horcrux(io.BytesIO(buf.getvalue()))
+    hx.init_read()
+    assert hx.read_block() == (0, b'zero')
+
+
+def test_stage_stats_threads():
+    stats = hio.StageStats()
+
+    def work():
+        for _ in range(10000):
+            stats._worked(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert stats.items == 40000
+    assert stats.busy == 20000.0
+
+
+def test_read_ahead():
+    data = bytes(random.getrandbits(8) for _ in range(10000))
+    reader = hio.ReadAhead(io.BytesIO(data), chunk_size=100, depth=2)
+    assert reader.read(150) == data[:150]
+    assert reader.read(0) == b''
+    assert reader.read() == data[150:]
+    assert reader.read(10) == b''
+    reader.close()
+    reader = hio.ReadAhead(io.BytesIO(data), chunk_size=10, depth=1)
+    reader.read(5)
+    reader.close()  # doesn't hang with the reader thread blocked on a full queue
+    assert reader.stats.items > 0
+
+
+def test_read_ahead_close_blocked_read(monkeypatch):
+    monkeypatch.setattr(hio, 'READ_AHEAD_CLOSE_WAIT', 0.1)
+    read_fd, write_fd = os.pipe()
+    with open(read_fd, 'rb', buffering=0) as pipe, open(write_fd, 'wb') as feed:
+        reader = hio.ReadAhead(pipe, chunk_size=10)
+        feed.write(b'x' * 10)
+        feed.flush()
+        assert reader.read(10) == b'x' * 10
+        reader.close()  # doesn't hang with the reader thread waiting on the pipe
+        assert reader._thread.is_alive()
+        feed.write(b'y')
+        feed.flush()
+        reader._thread.join(5)
+        assert not reader._thread.is_alive()  # exits once its read returns
+
+
+def test_horcrux_writer_thread(tmp_path, share):
+    path = tmp_path / 'hx.hrcx'
+    with open(path, 'wb') as f:
+        hx = hio.Horcrux(f)
+        hx.init_write(share, b'header')
+        stats = hx.start_writer(depth=2)
+        for i in range(100):
+            hx.write_data_block(i, bytes([i]) * 1000)
+        hx.stop_writer()
+        assert stats.items > 0
+    with open(path, 'rb') as f:
+        hx = hio.Horcrux(f)
+        hx.init_read()
+        for i in range(100):
+            assert hx.read_block() == (i, bytes([i]) * 1000)
+
+
+def test_get_horcrux_files_spread(tmp_path, share):
+    dirs = [tmp_path / 'a', tmp_path / 'b']
+    for d in dirs:
+        d.mkdir()
+    hxs = hio.get_horcrux_files('test', [share] * 3, b'header', dirs)
+    for h in hxs:
+        h.stream.close()
+    assert sorted(p.name for p in dirs[0].iterdir()) == ['test_1.hrcx', 'test_3.hrcx']
+    assert [p.name for p in dirs[1].iterdir()] == ['test_2.hrcx']
+
+
+def test_feed_buffer():
+    data = bytes(random.getrandbits(8) for _ in range(10000))
+    buf = hio.FeedBuffer(max_bytes=1000)
+    piece = data[:500]
+    assert buf.feed(piece)
+    assert buf.read(500) is piece  # whole pieces aren't copied
+    fed = []
+
+    def feeder():
+        for i in range(500, len(data), 300):
+            fed.append(buf.feed(bytearray(data[i : i + 300])))
+        buf.finish()
+
+    t = threading.Thread(target=feeder)
+    t.start()
+    # more than max_bytes in one read doesn't wait on feeders waiting for room
+    assert buf.read(5000) == data[500:5500]
+    assert buf.read() == data[5500:]
+    assert buf.read(10) == b''
+    t.join()
+    assert all(fed)
+    assert buf.stats.items > 1
+    with pytest.raises(ValueError):
+        buf.feed(b'too late')
+
+
+def test_feed_buffer_close():
+    buf = hio.FeedBuffer(max_bytes=10)
+    assert buf.feed(b'x' * 10)
+    t = threading.Thread(target=lambda: setattr(t, 'fed', buf.feed(b'y')))
+    t.start()
+    t.join(0.1)
+    assert t.is_alive()  # blocked, the buffer is full
+    buf.close()
+    t.join()
+    assert t.fed is False
@@ -0,0 +1,183 @@
+import pytest
+import io
+
+from horcrux import combine
+from horcrux import plan
+from horcrux import split
+
+
+def write_horcruxes(tmp_path, data, n, k, **kwargs):
+    s = split.Stream(io.BytesIO(data), n, k, len(data), digest_profile='fast', **kwargs)
+    out_streams = [io.BytesIO() for _ in range(n)]
+    s.init_horcruxes(out_streams)
+    s.distribute()
+    paths = []
+    for i, st in enumerate(out_streams):
+        paths.append(tmp_path / f'hx_{i}.hrcx')
+        paths[-1].write_bytes(st.getvalue())
+    return paths
+
+
+def test_plan_reads_minimal_cover(tmp_path):
+    paths = write_horcruxes(tmp_path, bytes(range(256)) * 100, 8, 3)
+    read_plan = plan.plan_reads(paths)
+    assert len(read_plan.sources) == 8
+    assert len(read_plan.chosen) == 3
+    assert [b for b, _ in read_plan.schedule] == list(range(len(read_plan.schedule)))
+    assert {s for _, s in read_plan.schedule} <= set(read_plan.chosen)
+
+
+def test_read_blocks_fd_budget(tmp_path, monkeypatch):
+    data = bytes(range(256)) * 100
+    paths = write_horcruxes(tmp_path, data, 6, 3, cipher_mode='block')
+    opened = []
+    real_open = open
+
+    def counting_open(path, *args):
+        f = real_open(path, *args)
+        opened.append(f)
+        return f
+
+    read_plan = plan.plan_reads(paths)
+    monkeypatch.setattr('builtins.open', counting_open)
+    for _ in plan.read_blocks(read_plan, fd_budget=1):
+        assert sum(not f.closed for f in opened) <= 1
+    assert all(f.closed for f in opened)
+
+
+def test_from_files_stats(tmp_path):
+    data = bytes(range(256)) * 100
+    paths = write_horcruxes(tmp_path, data, 6, 2, stream_name='out.bin')
+    stats = {}
+    out = combine.from_files(paths, tmp_path, stats=stats, fd_budget=2)
+    assert out.read_bytes() == data
+    assert set(stats) == set(paths)
+    assert sum(1 for read in stats.values() if read) == 2
+    assert sum(stats.values()) > len(data)
+
+
+def test_plan_reads_missing_block(tmp_path):
+    paths = write_horcruxes(tmp_path, bytes(range(256)) * 100, 5, 4)
+    with pytest.raises(combine.DecryptionError):
+        plan.plan_reads(paths[:2])
+
+
+def test_prefetcher(tmp_path):
+    paths = write_horcruxes(tmp_path, bytes(range(256)) * 100, 6, 3)
+    expected = [(b, d) for _, b, d in plan.read_blocks(plan.plan_reads(paths))]
+    read_plan = plan.plan_reads(paths)
+    prefetcher = plan.Prefetcher(read_plan, depth=2).start()
+    assert [(b, d) for _, b, d in prefetcher] == expected
+    assert sum(read_plan.bytes_read.values()) == sum(len(d) for _, d in expected)
+    assert not any(t.is_alive() for t in prefetcher._threads)
+
+
+def test_prefetcher_errors_and_close(tmp_path):
+    paths = write_horcruxes(tmp_path, bytes(range(256)) * 100, 4, 2)
+    read_plan = plan.plan_reads(paths)
+    prefetcher = plan.Prefetcher(read_plan, depth=1)
+    blocks = iter(prefetcher)
+    next(blocks)
+    blocks.close()  # stopping early doesn't leave readers blocked on full queues
+    assert not any(t.is_alive() for t in prefetcher._threads)
+
+    for path in paths:  # other horcruxes would stand in for the chosen ones
+        path.unlink()
+    with pytest.raises(FileNotFoundError):
+        list(plan.Prefetcher(read_plan))
+
+
+def test_prefetcher_memory_limit(tmp_path):
+    data = bytes(range(256)) * 400
+    paths = write_horcruxes(tmp_path, data, 4, 2, frame_size=1024)
+    read_plan = plan.plan_reads(paths)
+    prefetcher = plan.Prefetcher(read_plan).start()
+    assert {q.maxsize for q in prefetcher._queues.values()} == {plan.PREFETCH_DEPTH}
+    prefetcher.close()
+    limit = len(read_plan.chosen) * 4096  # just under 4 blocks a source
+    prefetcher = plan.Prefetcher(read_plan, memory_limit=limit).start()
+    assert {q.maxsize for q in prefetcher._queues.values()} == {3}
+    prefetcher.close()
+    prefetcher = plan.block_reader(read_plan, memory_limit=1)
+    assert {q.maxsize for q in prefetcher._queues.values()} == {1}
+    assert b''.join(d for _, _, d in prefetcher)
+    out = combine.from_files(paths, tmp_path, 'out.bin', memory_limit=1)
+    assert out.read_bytes() == data
+
+
+@pytest.mark.parametrize('reader', [plan.read_blocks, plan.Prefetcher])
+def test_reader_failover(tmp_path, reader):
+    paths = write_horcruxes(tmp_path, bytes(range(256)) * 100, 4, 2)
+    expected = [(b, d) for _, b, d in plan.read_blocks(plan.plan_reads(paths))]
+    read_plan = plan.plan_reads(paths)
+    lost = read_plan.chosen[0]
+    lost.path.unlink()
+    assert [(b, d) for _, b, d in reader(read_plan)] == expected
+    assert set(read_plan.problems) == {lost.path}
+    assert lost.bytes_read == 0
+
+
+def test_plan_reads_truncated(tmp_path):
+    paths = write_horcruxes(tmp_path, bytes(range(256)) * 100, 4, 2)
+    data = paths[0].read_bytes()
+    paths[0].write_bytes(data[: len(data) // 2])
+    paths[1].write_bytes(b'not a horcrux')
+    read_plan = plan.plan_reads(paths)
+    assert set(read_plan.problems) == {paths[0], paths[1]}
+    assert len(read_plan.sources) == 3
+    out = io.BytesIO()
+    combine.from_files(paths, outfile=out)
+    assert out.getvalue() == bytes(range(256)) * 100
+
+
+def test_plan_streams(tmp_path):
+    paths = write_horcruxes(tmp_path, bytes(range(256)) * 100, 4, 2)
+    streams = [open(p, 'rb') for p in paths]
+    hxs = combine._prepare_streams(streams)
+    read_plan = plan.plan_streams(hxs)
+    assert len(read_plan.chosen) == 2
+    assert set(read_plan.bytes_read) == {h.hrcx_id for h in hxs}
+    assert len(list(plan.Prefetcher(read_plan))) == len(read_plan.schedule)
+    for s in streams:
+        s.close()
+
+
+def test_plan_reads_erasure(tmp_path):
+    data = b'erasure coded ' * 1000
+    paths = write_horcruxes(tmp_path, data, 5, 3, distribution='erasure')
+    read_plan = plan.plan_reads(paths)
+    assert len(read_plan.chosen) == 3
+    assert len(read_plan.schedule) == 3 * len(read_plan.horcruxes[0].index.schedule)
+    out = io.BytesIO()
+    combine.from_files(paths, outfile=out)
+    assert out.getvalue() == data
+    with pytest.raises(combine.DecryptionError):
+        plan.plan_reads(paths[:2])
+
+
+def test_reader_failover_erasure(tmp_path):
+    data = bytes(range(256)) * 100
+    paths = write_horcruxes(tmp_path, data, 5, 3, distribution='erasure')
+    read_plan = plan.plan_reads(paths)
+    read_plan.chosen[0].path.unlink()
+    out = io.BytesIO()
+    combine._combine_blocks(
+        combine._decoded(plan.Prefetcher(read_plan), read_plan.horcruxes),
+        out,
+        combine._init_crypto(read_plan.horcruxes),
+    )
+    assert out.getvalue() == data
+
+
+def test_plan_reads_only_blobs(tmp_path):
+    s = split.Stream(
+        io.BytesIO(b'data'), 3, 2, 4, digest_profile='fast', distribution='key-only'
+    )
+    blob = io.BytesIO()
+    s.init_horcruxes([io.BytesIO() for _ in range(3)], [blob])
+    s.distribute()
+    path = tmp_path / 'hx.blob'
+    path.write_bytes(blob.getvalue())
+    with pytest.raises(ValueError) as e:
+        plan.plan_reads([path])
+    assert 'No horcruxes' in str(e.value)
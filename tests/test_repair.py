@@ -0,0 +1,148 @@
+import pytest
+import io
+import itertools
+import os
+
+from horcrux import combine
+from horcrux import crypto
+from horcrux import repair
+from horcrux import split
+
+
+def write_horcruxes(tmp_path, data, n, k, **kwargs):
+    s = split.Stream(io.BytesIO(data), n, k, len(data), digest_profile='fast', **kwargs)
+    s.horcrux_title = 'hx'
+    s.outdir = tmp_path
+    s.init_horcruxes()
+    s.distribute()
+    for h in s.outputs:
+        h.stream.close()
+    return sorted(tmp_path.glob('hx_*.hrcx'))
+
+
+@pytest.fixture
+def no_decryption(monkeypatch):
+    def fail(*args):
+        raise AssertionError('repair decrypted a block')
+
+    monkeypatch.setattr(crypto.Stream, 'decrypt', fail)
+    monkeypatch.setattr(crypto.BlockCipher, 'decrypt', fail)
+
+
+@pytest.mark.parametrize(
+    'kwargs',
+    [
+        {},
+        {'cipher_mode': 'block', 'frame_size': 1000},
+        {'distribution': 'erasure'},
+        {'distribution': 'key-only'},
+    ],
+)
+def test_regenerate(tmp_path, no_decryption, kwargs):
+    data = os.urandom(10000)
+    paths = write_horcruxes(tmp_path, data, 5, 3, **kwargs)
+    lost = paths[1].read_bytes()
+    paths[1].unlink()
+    rebuilt = repair.regenerate([paths[0], paths[3], paths[4]], 1)
+    assert rebuilt == paths[1]
+    assert rebuilt.read_bytes() == lost
+
+
+def test_regenerate_without_copy_file_range(tmp_path, monkeypatch):
+    paths = write_horcruxes(tmp_path, os.urandom(10000), 3, 2)
+    lost = paths[2].read_bytes()
+    paths[2].unlink()
+
+    def unsupported(*args):
+        raise OSError('not supported')
+
+    monkeypatch.setattr(os, 'copy_file_range', unsupported, raising=False)
+    out = tmp_path / 'rebuilt.hrcx'
+    repair.regenerate(paths[:2], 2, out)
+    assert out.read_bytes() == lost
+
+
+def test_regenerate_combines(tmp_path):
+    data = os.urandom(10000)
+    paths = write_horcruxes(tmp_path, data, 4, 2)
+    paths[0].unlink()
+    rebuilt = repair.regenerate(paths[2:], 0)
+    out = io.BytesIO()
+    combine.from_files([rebuilt, paths[1]], outfile=out)
+    assert out.getvalue() == data
+
+
+def test_regenerate_errors(tmp_path):
+    paths = write_horcruxes(tmp_path, b'data', 3, 2)
+    with pytest.raises(ValueError):
+        repair.regenerate(paths[:2], 1)
+    with pytest.raises(FileExistsError):
+        repair.regenerate(paths[:2], 2)
+    with pytest.raises(combine.sss.NotEnoughShares):
+        repair.regenerate(paths[:1], 2, tmp_path / 'new.hrcx')
+
+
+@pytest.mark.parametrize('distribution', ['replicate', 'erasure'])
+def test_regenerate_unknown_index(tmp_path, distribution):
+    paths = write_horcruxes(tmp_path, os.urandom(1000), 3, 2, distribution=distribution)
+    for index in (3, 5):
+        with pytest.raises(ValueError) as e:
+            repair.regenerate(paths[:2], index, tmp_path / 'new.hrcx')
+        assert 'only 3' in str(e.value)
+    assert not (tmp_path / 'new.hrcx').exists()
+
+
+@pytest.mark.parametrize(
+    'kwargs',
+    [
+        {},
+        {'cipher_mode': 'block', 'frame_size': 500},
+        {'distribution': 'erasure'},
+        {'distribution': 'key-only'},
+    ],
+)
+def test_reshare(tmp_path, no_decryption, monkeypatch, kwargs):
+    data = os.urandom(10000)
+    paths = write_horcruxes(tmp_path, data, 5, 3, **kwargs)
+    outdir = tmp_path / 'new'
+    outdir.mkdir()
+    new = repair.reshare(paths[1:4], 4, 7, outdir)
+    assert [p.name for p in new] == [f'hx_reshared_{i}.hrcx' for i in range(1, 8)]
+    monkeypatch.undo()  # combining decrypts, of course
+    blobs = list(tmp_path.glob('*.blob'))
+    for picked in ([0, 1, 2, 3], [3, 4, 5, 6], [0, 2, 4, 6]):
+        out = io.BytesIO()
+        combine.from_files([new[i] for i in picked] + blobs, outfile=out)
+        assert out.getvalue() == data
+    with pytest.raises((combine.sss.NotEnoughShares, crypto.DecryptionError)):
+        combine.from_files(new[:3] + blobs, outfile=io.BytesIO())
+
+
+def test_reshare_routing(tmp_path):
+    paths = write_horcruxes(tmp_path, os.urandom(100000), 3, 2, frame_size=1000)
+    new = repair.reshare(paths[:2], 3, 5, tmp_path, 'new')
+    h = repair.io.Horcrux(open(new[0], 'rb'))
+    h.init_read()
+    schedule = h.load_index().schedule
+    h.close()
+    assert all(len(holders) == 3 for _, holders in schedule)
+    # no two of the new horcruxes hold every block
+    for pair in itertools.combinations(range(5), 2):
+        assert any(not set(pair) & set(holders) for _, holders in schedule)
+
+
+def test_reshare_defaults(tmp_path):
+    paths = write_horcruxes(tmp_path, b'data', 3, 2)
+    new = repair.reshare(paths[:2], 3, 4)
+    assert new == [tmp_path / f'hx_reshared_{i}.hrcx' for i in range(1, 5)]
+    assert all(p.exists() for p in paths + new)
+
+
+def test_reshare_errors(tmp_path):
+    paths = write_horcruxes(tmp_path, b'data', 3, 2)
+    with pytest.raises(ValueError):
+        repair.reshare(paths[:2], 2, 4, tmp_path, 'hx')  # would overwrite hx_1..3
+    with pytest.raises(ValueError):
+        repair.reshare(paths[:2], 5, 4, tmp_path, 'new')
+    with pytest.raises(combine.sss.NotEnoughShares):
+        repair.reshare(paths[:1], 2, 4, tmp_path, 'new')
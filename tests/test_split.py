@@ -2,6 +2,7 @@ import pytest
 import random
 import io
 import itertools
+import tracemalloc
 from unittest import mock
 
 from horcrux import split
@@ -17,8 +18,9 @@ def mock_crypto(monkeypatch):
 
     mock_stream.return_value.encrypt.side_effect = echo_encrypt
     monkeypatch.setattr(split.crypto, 'Stream', mock_stream)
+    monkeypatch.setitem(split.crypto.MODES, 'stream', mock_stream)
     mock_sss = mock.create_autospec(split.sss.generate_shares)
-    mock_sss.side_effect = lambda n, k, key: [None for _ in range(n)]
+    mock_sss.side_effect = lambda n, k, key, *args: [None for _ in range(n)]
     monkeypatch.setattr(split.sss, 'generate_shares', mock_sss)
 
 
@@ -27,8 +29,11 @@ def mem_hx(monkeypatch):
     'in-memory, no header horcruxes for testing'
     ghx = mock.create_autospec(split.io.get_horcrux_files)
 
-    def get_mem_horcruxes(_, shares, _x, outdir=None, encrypted_filename=None):
-        return [split.io.Horcrux(io.BytesIO()) for _ in range(len(shares))]
+    def get_mem_horcruxes(_, shares, _x, outdir=None, *args):
+        hxs = [split.io.Horcrux(io.BytesIO()) for _ in range(len(shares))]
+        for i, h in enumerate(hxs):
+            h.hrcx_id = i
+        return hxs
 
     ghx.side_effect = get_mem_horcruxes
     monkeypatch.setattr(split.io, 'get_horcrux_files', ghx)
@@ -79,11 +84,8 @@ def assert_recombinable(s, expected_ids, exclusive=False):
         cids = set()
         h.stream.seek(0)
         h._read_next_block_id()
-        while True:
-            try:
-                i, _ = h.read_block()
-            except IndexError:
-                break
+        while h.next_block_id is not None:
+            i, _ = h.read_block()
             cids.add(i)
         ids.append(cids)
     expected_ids = set(expected_ids)
@@ -115,6 +117,20 @@ def test_smart_distribute():
     assert_recombinable(s, range(4096 // block_size + 1), exclusive=True)
 
 
+def test_smart_distribute_frames():
+    s = split.Stream(None, 5, 3, frame_size=100)
+    s.init_horcruxes()
+    data = io.BytesIO(get_data(4096))
+    block_size = split._ideal_block_size(4096, 5, 3)
+    s._smart_distribute(data, block_size)
+    # 10 groups of 410 bytes (406 for the last), 5 frames each
+    assert len(s.schedule) == 50
+    assert max(length for length, _ in s.schedule) == 100
+    for group in range(0, 50, 5):
+        assert len({holders for _, holders in s.schedule[group : group + 5]}) == 1
+    assert_recombinable(s, range(50), exclusive=True)
+
+
 def test_bad_smart_distribute():
     s = split.Stream(None, 5, 3)
     s.init_horcruxes()
@@ -139,6 +155,7 @@ def test_distribute_smart(monkeypatch):
     s.init_horcruxes()
     infile.seek(0)
     mock_sd = mock.create_autospec(s._smart_distribute)
+    mock_sd.side_effect = lambda chunk, *args, **kwargs: chunk.read()
     monkeypatch.setattr(s, '_smart_distribute', mock_sd)
     s.distribute(infile, size)
     mock_sd.assert_called_once()
@@ -192,3 +209,185 @@ def test_distribute_no_args():
     s.init_horcruxes()
     s.distribute()
     assert infile.tell() == 1024**2
+
+
+def test_distribute_pipeline_stats():
+    infile = io.BytesIO(get_data(1024 * 64))
+    s = split.Stream(infile, 5, 3, in_stream_size=1024 * 64)
+    s.init_horcruxes()
+    s.distribute()
+    assert s.stats['read'].items > 0
+    assert s.stats['encrypt'].items == len(s.schedule)
+    assert set(s.stats['write']) == set(range(5))
+    assert all(st.items > 0 and st.depth == 0 for st in s.stats['write'].values())
+    piped = [h.stream.getvalue() for h in s.horcruxes]
+
+    infile.seek(0)
+    s = split.Stream(infile, 5, 3, in_stream_size=1024 * 64, pipeline=False)
+    s.init_horcruxes()
+    s.distribute()
+    assert s.stats['read'] is None
+    assert sum(len(h.stream.getvalue()) for h in s.horcruxes) == sum(map(len, piped))
+
+
+def test_distribute_pipeline_write_error():
+    s = split.Stream(io.BytesIO(get_data(1024 * 64)), 3, 2)
+    s.init_horcruxes()
+
+    def broken_write(frame):
+        raise OSError('disk full')
+
+    s.horcruxes[1]._write_now = broken_write
+    with pytest.raises(OSError):
+        s.distribute()
+
+
+def test_stream_distribute_continuous():
+    infile = io.BytesIO(get_data(1024 * 1024))
+    s = split.Stream(None, 5, 3, memory_limit=split.MIN_MEMORY_LIMIT)
+    s.init_horcruxes()
+    s.distribute(infile)
+    assert infile.tell() == 1024 * 1024
+    # one schedule over the whole stream, cycling through all 10 combinations
+    holders = [h for _, h in s.schedule]
+    assert len(set(holders)) == 10
+    assert len(holders) > 40
+    assert_recombinable(s, range(len(holders)), exclusive=True)
+
+
+def test_stream_distribute_short():
+    infile = io.BytesIO(get_data(1000))
+    s = split.Stream(None, 5, 3, memory_limit=split.MIN_MEMORY_LIMIT)
+    s.init_horcruxes()
+    s.distribute(infile)
+    assert_recombinable(s, range(len(s.schedule)), exclusive=True)
+
+
+class Zeros(io.RawIOBase):
+    'an unseekable stream of size zeros'
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        self.remaining -= size
+        return bytes(size)
+
+
+class Sink(io.RawIOBase):
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return len(b)
+
+
+def test_stream_distribute_memory_limit():
+    limit = 4 * 1024 * 1024
+    infile = Zeros(32 * 1024 * 1024)
+    # real (block mode) crypto, the mocked stream cipher keeps every block it's given
+    s = split.Stream(infile, 5, 3, cipher_mode='block', memory_limit=limit)
+    s.init_horcruxes()
+    for h in s.horcruxes:
+        h.stream = Sink()
+    tracemalloc.start()
+    try:
+        s.distribute()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert infile.remaining == 0
+    assert peak < limit
+
+
+def test_spool(monkeypatch, tmp_path):
+    infile = io.BytesIO(get_data(4096))
+    s = split.Stream(None, 5, 3, spool=True, spool_dir=tmp_path)
+    s.init_horcruxes()
+    mock_sd = mock.create_autospec(s._smart_distribute)
+    mock_sd.side_effect = lambda chunk, *args, **kwargs: chunk.read()
+    monkeypatch.setattr(s, '_smart_distribute', mock_sd)
+    s.distribute(infile)
+    # one smart distribution over the whole input, as if its size was given
+    mock_sd.assert_called_once()
+    assert mock_sd.call_args[0][1] == split._ideal_block_size(4096, 5, 3)
+    assert not list(tmp_path.iterdir())
+
+    infile.seek(0)
+    s = split.Stream(None, 5, 3, spool=True)
+    s.init_horcruxes()
+    s.distribute(infile)
+    assert_recombinable(s, range(len(s.schedule)), exclusive=True)
+
+
+def test_feed():
+    data = get_data(1024 * 1024)
+    s = split.Stream(None, 5, 3, memory_limit=split.MIN_MEMORY_LIMIT)
+    s.init_horcruxes()
+    for i in range(0, len(data), 10000):
+        s.feed(memoryview(data)[i : i + 10000])
+    s.close()
+    assert s._fed.max_bytes == split.MIN_MEMORY_LIMIT // 8
+    # one continuous schedule, as for a stream read with a memory limit
+    holders = [h for _, h in s.schedule]
+    assert len(set(holders)) == 10
+    assert_recombinable(s, range(len(holders)), exclusive=True)
+    assert sum(length for length, _ in s.schedule) == len(data)
+
+
+def test_feed_known_size_and_errors():
+    data = get_data(4096)
+    s = split.Stream(None, 5, 3, len(data))
+    s.init_horcruxes()
+    s.feed(data[:1000])
+    s.feed(data[1000:])
+    s.close()
+    assert s.memory_limit is None
+    assert_recombinable(s, range(len(s.schedule)), exclusive=True)
+
+    s = split.Stream(None, 3, 2)
+    with pytest.raises(FileNotFoundError):
+        s.feed(b'data')
+    s.init_horcruxes()
+
+    def broken_write(frame):
+        raise OSError('disk full')
+
+    s.horcruxes[1]._write_now = broken_write
+    with pytest.raises(OSError):
+        for _ in range(1000):
+            s.feed(get_data(1024 * 64))
+        s.close()
+
+
+@pytest.mark.parametrize('pipeline', [True, False])
+@pytest.mark.parametrize('distribution', split.DISTRIBUTIONS)
+def test_distribute_size_mismatch(pipeline, distribution):
+    data = get_data(50000)
+    for size in (len(data) - 1000, len(data) + 1000):
+        s = split.Stream(
+            io.BytesIO(data), 5, 3, size, pipeline=pipeline, distribution=distribution
+        )
+        s.init_horcruxes(blob_streams=[io.BytesIO()])
+        with pytest.raises(split.SizeMismatchError):
+            s.distribute()
+
+
+def test_size_mismatch_not_masked_by_writer_error(tmp_path):
+    data = get_data(50000)
+    s = split.Stream(
+        io.BytesIO(data), 3, 2, len(data) + 1000, outdir=tmp_path, pipeline=True
+    )
+    s.init_horcruxes()
+
+    def broken_stop():
+        raise OSError('disk full')
+
+    s.horcruxes[1].stop_writer = broken_stop
+    with pytest.raises(split.SizeMismatchError):
+        s.distribute()
+    assert not list(tmp_path.iterdir())  # the cleanup still ran
@@ -10,23 +10,25 @@ def test_hsh():
     assert sss.hsh(secret, salt) == h
 
 
+def recover_int(pts, x):
+    pts = [sss.Point(x_, y.to_bytes(32, 'big')) for x_, y in pts]
+    return int.from_bytes(sss.PrimeField.recover(pts, (x,))[0], 'big')
+
+
 def test_larange():
     # y = mx + b
     # 43 = 3x + 19
     # x = 8
-    pts = [sss.Point(*c) for c in ((0, 19), (1, 22))]
-    assert sss._larange_interpolate(8, pts) == 43
+    assert recover_int(((0, 19), (1, 22)), 8) == 43
 
     #y = 4x**2 + 33x + 10
 
-    pts = [sss.Point(*c) for c in ((0, 10), (1, 47), (3, 145))]
-    assert sss._larange_interpolate(255, pts) == 268525
+    assert recover_int(((0, 10), (1, 47), (3, 145)), 255) == 268525
 
 
 def test_larange_fails_duplicates():
-    pts = [sss.Point(*c) for c in ((0, 19), (0, 19))]
     with pytest.raises(AssertionError):
-        sss._larange_interpolate(255, pts)
+        recover_int(((0, 19), (0, 19)), 255)
 
 
 def test_split_seceret_assertions():
@@ -93,3 +95,130 @@ def test_combine_shares():
     shares[1] = shares[1]._replace(point=sss.Point(2, b'\x33' * 32))
     with pytest.raises(sss.InvalidDigest):
         sss.combine_shares(shares)
+
+
+def test_prime_field_generate():
+    assert sss._horner([10, 33, 4], 255) == 268525
+
+    anchors = [sss.Point(x, rand_bytes(31)) for x in (254, 255)]
+    ys = sss.PrimeField.generate(5, anchors, range(20))
+    pts = [sss.Point(x, y) for x, y in enumerate(ys)]
+    # any 5 points are the same order 4 curve, through both anchors
+    for picked in (pts[:5], pts[15:], pts[::4]):
+        recovered = sss.PrimeField.recover(picked, (254, 255) + tuple(range(20)))
+        assert recovered == [a.Y.rjust(32, b'\0') for a in anchors] + ys
+
+
+def test_split_and_recover_large_threshold():
+    salt = rand_bytes(16)
+    secret = rand_bytes(32)
+    points = sss._split_secret(253, 253, secret, salt)
+    assert sss._recover_secret(points, salt) == secret
+
+
+def test_batch_inverse():
+    values = [1, 2, 3, 12345, sss.PRIME - 1]
+    for v, inv in zip(values, sss._batch_inverse(values, sss.PRIME)):
+        assert v * inv % sss.PRIME == 1
+
+
+def test_lagrange_coefficients():
+    pts = [sss.Point(*c) for c in ((0, 10), (1, 47), (3, 145))]
+    xs = tuple(p.X for p in pts)
+    ys = [p.Y for p in pts]
+    at_255, at_1 = sss._lagrange_coefficients(xs, (255, 1))
+    assert sss._dot(at_255, ys) == 268525
+    assert at_1 == (0, 1, 0)
+    sss._lagrange_coefficients.cache_clear()
+    sss._lagrange_coefficients(xs, (255, 1))
+    sss._lagrange_coefficients(xs, (255, 1))
+    assert sss._lagrange_coefficients.cache_info().hits == 1
+
+
+def test_drop_corrupt_points():
+    salt = rand_bytes(16)
+    secret = rand_bytes(32)
+    points = sss._split_secret(12, 5, secret, salt)
+    assert sss._drop_corrupt_points(points, 5) == sorted(points)[:5]
+    bad = list(points)
+    for i in (0, 4, 9):
+        bad[i] = bad[i]._replace(Y=rand_bytes(32))
+    good = sss._drop_corrupt_points(bad, 5)
+    assert set(bad) - set(good) == {bad[0], bad[4], bad[9]}
+    assert sss._recover_secret(good, salt) == secret
+
+    # more corrupt points than can be corrected, left for the digest check
+    bad[1] = bad[1]._replace(Y=rand_bytes(32))
+    assert sss._drop_corrupt_points(bad, 5) == sorted(bad)
+
+
+def test_combine_shares_with_corrupt_extra():
+    secret = rand_bytes(32)
+    shares = sss.generate_shares(7, 3, secret)
+    shares[2] = shares[2]._replace(point=shares[2].point._replace(Y=rand_bytes(32)))
+    assert sss.combine_shares(shares) == secret
+
+
+def test_digest_profiles():
+    secret = rand_bytes(32)
+    salt = rand_bytes(16)
+    assert sss.hsh(secret, salt) == sss.hsh(secret, salt, sss.PROFILES['interactive'])
+    assert sss.hsh(secret, salt) != sss.hsh(secret, salt, sss.PROFILES['fast'])
+
+    shares = sss.generate_shares(5, 3, secret, sss.PROFILES['fast'])
+    assert all(s.profile == sss.PROFILES['fast'] for s in shares)
+    assert sss.combine_shares(shares[:3]) == secret
+    legacy = [s._replace(profile=None) for s in shares[:3]]
+    with pytest.raises(sss.InvalidDigest):
+        sss.combine_shares(legacy)
+
+
+def test_gf256_field():
+    secret = b'\xff' * 32
+    salt = rand_bytes(16)
+    profile = sss.PROFILES['fast']
+    points = sss._split_secret(20, 4, secret, salt, profile, 'gf256')
+    assert sss._recover_secret(points[5:9], salt, profile, 'gf256') == secret
+    with pytest.raises(sss.InvalidDigest):
+        sss._recover_secret(points[5:9], salt, profile)
+
+    shares = sss.generate_shares(5, 3, secret, profile, 'gf256')
+    assert all(s.field == 'gf256' for s in shares)
+    assert sss.combine_shares(shares[::2]) == secret
+
+
+def test_wide_index_space():
+    secret = rand_bytes(32)
+    profile = sss.PROFILES['fast']
+    shares = sss.generate_shares(600, 4, secret, profile)
+    assert all(s.index_space == 'wide' for s in shares)
+    assert shares[-1].point.X == 599
+    assert sss.combine_shares(shares[-4:]) == secret
+    assert sss.generate_shares(5, 3, secret, profile)[0].index_space == 'legacy'
+    with pytest.raises(AssertionError):
+        sss.generate_shares(600, 4, secret, profile, 'gf256')
+
+
+@pytest.mark.parametrize('field', ['prime', 'gf256'])
+@pytest.mark.parametrize('numpy', [True, False])
+def test_shares_many(field, numpy, monkeypatch):
+    if not numpy:
+        monkeypatch.setattr(sss.gf256, 'np', None)
+        monkeypatch.setattr(sss, 'np', None)
+    profile = sss.PROFILES['fast']
+    secrets = [b'\x00' + rand_bytes(31) for _ in range(20)]
+    sets = sss.generate_shares_many(secrets, 6, 4, profile, field)
+    assert len(sets) == 20
+    assert all(len(s) == 6 for s in sets)
+    assert len({s[0].id for s in sets}) == 20
+    for shares, secret in zip(sets[:3], secrets):
+        assert sss.combine_shares(shares[::-2] + shares[:1]) == secret
+    picked = [s[1:5] if i % 2 else s[2:] for i, s in enumerate(sets)]
+    assert sss.combine_shares_many(picked) == secrets
+
+    picked[3] = picked[3][:3]
+    with pytest.raises(sss.NotEnoughShares):
+        sss.combine_shares_many(picked)
+
+    pairs = sss.generate_shares_many(secrets, 3, 2, profile, field)
+    assert sss.combine_shares_many([s[1:] for s in pairs]) == secrets